@@ -328,30 +328,38 @@ except ImportError as e:
     schedule = False
 
 
-def schedule_often(every=10):
+def schedule_often(every=10, timeout=None):
     """Decorator which schedules the given function to be run "often"
     (default every 10 seconds).
 
+    `timeout` is the maximum number of seconds a run of this job may
+    take before :manage:`linod` terminates it.
+
     See :ref:`dev.linod`.
 
     """
     def decorator(func):
         if schedule:
-            schedule.every(every).seconds.do(func)
+            job = schedule.every(every).seconds.do(func)
+            job.timeout = timeout
         return func
     return decorator
 
 
-def schedule_daily(at="20:00"):
+def schedule_daily(at="20:00", timeout=None):
     """Decorator which schedules the given function to be run "daily"
     (by default at 20:00).
 
+    `timeout` is the maximum number of seconds a run of this job may
+    take before :manage:`linod` terminates it.
+
     See :ref:`dev.linod`.
     """
     def decorator(func):
         if schedule:
             # schedule.every(10).seconds.do(func)
-            schedule.every().day.at(at).do(func)
+            job = schedule.every().day.at(at).do(func)
+            job.timeout = timeout
         return func
     return decorator
     
@@ -1041,16 +1041,41 @@ class DeleteSelected(MultipleRowAction):
     key = keyboard.DELETE  # (ctrl=True)
     #~ client_side = True
 
-    def run_from_ui(self, ar, **kw):
-        objects = []
+    def check_vetos(self, ar):
+        """Check all selected rows using a bulk query and return the veto
+        message of the first row which may not be deleted, or `None`
+        if all of them may be deleted.  Mark the rows as checked so
+        that :meth:`Model.delete <lino.core.model.Model.delete>` does
+        not check them once more.
+
+        """
+        vetos = ar.actor.get_delete_vetos(ar.selected_rows, ar)
         for obj in ar.selected_rows:
-            objects.append(str(obj))
-            msg = ar.actor.disable_delete(obj, ar)
+            msg = vetos.get(obj.pk)
             if msg is not None:
-                ar.error(None, msg, alert=True)
-                return
+                return msg
+        for obj in ar.selected_rows:
+            obj._lino_delete_checked = True
+        return None
+
+    def run_from_ui(self, ar, **kw):
+        objects = [str(obj) for obj in ar.selected_rows]
+        if len(objects) == 1:
+            msg = ar.actor.disable_delete(ar.selected_rows[0], ar)
+        else:
+            msg = self.check_vetos(ar)
+        if msg is not None:
+            ar.error(None, msg, alert=True)
+            return
         
         def ok(ar2):
+            if len(objects) > 1:
+                # the database may have changed while the user was
+                # reading the confirmation
+                msg = self.check_vetos(ar)
+                if msg is not None:
+                    ar2.error(None, msg, alert=True)
+                    return
             super(DeleteSelected, self).run_from_ui(ar, **kw)
             ar2.success(record_deleted=True)
             if ar2.actor.detail_action:
@@ -8,7 +8,9 @@ See :doc:`/dev/actors`.
 
 
 """
+import six
 from six import string_types
+from collections import Counter
 from builtins import str
 from future.utils import with_metaclass
 
@@ -41,6 +43,13 @@ actors_list = None
 
 ACTOR_SEP = '.'
 
+ROW_PERMISSIONS = dict()
+"""The memoized results of :meth:`Actor.get_cached_row_permission`."""
+
+PERMISSION_FALLBACKS = Counter()
+"""The number of per-object evaluations of row permissions by actor.
+See :meth:`Actor.get_cached_row_permission`."""
+
 
 def discover():
     global actor_classes
@@ -72,6 +81,22 @@ def register_actor(a):
     actors_list.append(a)
     return a
 
+_fallback_reasons = dict()
+
+
+def get_permission_fallbacks():
+    """Yield a tuple `(actor, reason, count)` for every actor whose row
+    permissions are evaluated per object.  `count` is the number of
+    such evaluations since the process started.
+
+    """
+    for a in actors_list:
+        if a.is_abstract():
+            continue
+        reason = a.get_permission_fallback_reason()
+        if reason is not None:
+            yield a, reason, PERMISSION_FALLBACKS[a]
+
 #~ class ClassProperty(property):
     #~ def __get__(self, cls, owner):
         #~ return self.fget.__get__(None, owner)()
@@ -405,6 +430,22 @@ class Actor(with_metaclass(ActorMetaClass, type('NewBase', (actions.Parametrizab
     # update_required = set()
     # delete_required = set()
 
+    state_only_permissions = None
+    """Whether the row permissions of this actor depend only on the
+    user type and the workflow state of a row.
+
+    When this is `True`, the results of :meth:`get_row_permission`
+    are memoized per user type, row state and action.  This is
+    important when rendering grid rows because
+    :meth:`disabled_actions` is called for each row.
+
+    The default value `None` means that Lino uses memoization only
+    when neither this actor, nor its model, nor any of its actions
+    override a method which has access to the row itself.  See
+    :meth:`get_permission_fallback_reason`.
+
+    """
+
     editable = None
     """Set this explicitly to `True` or `False` to make the whole table
     editable or not.  Otherwise Lino will guess what you want during
@@ -805,6 +846,59 @@ class Actor(with_metaclass(ActorMetaClass, type('NewBase', (actions.Parametrizab
             return False
         return cls.editable
 
+    @classmethod
+    def get_permission_fallback_reason(cls):
+        """Return `None` if the row permissions of this actor can be
+        memoized (see :attr:`state_only_permissions`), otherwise a
+        string which explains why not.
+
+        """
+        if cls.state_only_permissions is not None:
+            if cls.state_only_permissions:
+                return None
+            return "state_only_permissions is False"
+        func = cls.get_row_permission.__func__
+        if func not in DEFAULT_ROW_PERMISSION_HANDLERS:
+            return "{0} overrides get_row_permission()".format(cls)
+        default = six.get_unbound_function(
+            actions.Action.get_action_permission)
+        for ba in cls.get_actions():
+            a = ba.action
+            func = six.get_unbound_function(a.__class__.get_action_permission)
+            if func is not default:
+                return "{0} overrides get_action_permission()".format(
+                    a.__class__.__name__)
+            if a.debug_permissions:
+                return "{0} has debug_permissions".format(a)
+        return None
+
+    @classmethod
+    def get_cached_row_permission(cls, obj, ar, state, ba):
+        """Same as :meth:`get_row_permission`, but memoize the result
+        when possible (see :attr:`state_only_permissions`).  Count the
+        calls which cannot be memoized in :data:`PERMISSION_FALLBACKS`.
+
+        """
+        if obj is not None:
+            reason = _fallback_reasons.get(cls, False)
+            if reason is False:
+                reason = cls.get_permission_fallback_reason()
+                _fallback_reasons[cls] = reason
+                if reason is not None:
+                    logger.debug(
+                        "Row permissions of %s are evaluated per object "
+                        "because %s", cls, reason)
+            if reason is None:
+                key = (cls, ar.get_user().profile, state, ba)
+                try:
+                    return ROW_PERMISSIONS[key]
+                except KeyError:
+                    v = cls.get_row_permission(obj, ar, state, ba)
+                    ROW_PERMISSIONS[key] = v
+                    return v
+            PERMISSION_FALLBACKS[cls] += 1
+        return cls.get_row_permission(obj, ar, state, ba)
+
     @classmethod
     def _collect_actions(cls):
         """
@@ -1421,3 +1515,6 @@ def resolve_action(spec, action=None):
                     (givenspec, spec))
 
     
+
+
+DEFAULT_ROW_PERMISSION_HANDLERS = set([Actor.get_row_permission.__func__])
@@ -370,6 +370,7 @@ class ChoiceList(with_metaclass(ChoiceListMeta, tables.AbstractTable)):
     hidden_columns = frozenset(['workflow_buttons'])
 
     column_names = 'value name text *'
+    quick_search_fields = 'value name text'
 
     @classmethod
     def get_column_names(self, ar):
@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Filtering and sorting of the data rows of tables which are not
+based on a database query (i.e. having a :meth:`get_data_rows
+<lino.core.tables.AbstractTable.get_data_rows>` method).
+
+The values of a given column are computed only once per request and
+only for the rows which have not yet been filtered out.
+
+"""
+
+from __future__ import unicode_literals
+import six
+
+import datetime
+import threading
+import operator
+
+from django.conf import settings
+from django.utils import translation
+
+from lino.core import fields
+from lino.utils.xmlgen.html import E
+
+
+COMPARISONS = dict(
+    eq=operator.eq, lt=operator.lt, gt=operator.gt,
+    lte=operator.le, gte=operator.ge, ne=operator.ne)
+
+
+def value2text(v):
+    """Return the text to use when searching or sorting the given
+    column value.
+
+    """
+    if v is None:
+        return ''
+    if E.iselement(v):
+        return ''.join(v.itertext())
+    return six.text_type(v)
+
+
+class DataColumns(object):
+    """Column-wise access to the values of a list of `rows` of the
+    table request `ar`.
+
+    """
+    def __init__(self, ar, rows):
+        self.ar = ar
+        self.rows = rows
+        self.values = dict()
+
+    def get_value(self, name, i):
+        """Return the value of column `name` in row number `i`."""
+        col = self.values.get(name)
+        if col is None:
+            col = self.values[name] = dict()
+        try:
+            return col[i]
+        except KeyError:
+            pass
+        fld = self.ar.actor.get_data_elem(name)
+        row = self.rows[i]
+        if isinstance(fld, fields.FakeField):
+            v = fld.value_from_object(row, self.ar)
+        else:
+            v = getattr(row, name, None)
+        col[i] = v
+        return v
+
+    def filter(self, indexes, name, test):
+        """Return the items of `indexes` whose value in column `name`
+        satisfies `test`.
+
+        """
+        return [i for i in indexes if test(self.get_value(name, i))]
+
+    def sort(self, indexes, order_by):
+        """Return the given `indexes` sorted by the given list of column
+        names.  Names prefixed with a "-" sort in descending order.
+
+        """
+        indexes = list(indexes)
+        for name in reversed(order_by):
+            reverse = name.startswith('-')
+            if reverse:
+                name = name[1:]
+            vals = dict([(i, self.get_value(name, i)) for i in indexes])
+            try:
+                indexes.sort(
+                    key=lambda i: (vals[i] is not None, vals[i]),
+                    reverse=reverse)
+            except TypeError:  # values of different types
+                indexes.sort(
+                    key=lambda i: value2text(vals[i]).lower(),
+                    reverse=reverse)
+        return indexes
+
+
+def gridfilter2test(flt):
+    """Convert a `filter` in the format used by
+    :extux:`Ext.ux.grid.GridFilters` into a function which tests a
+    value.  Same semantics as :func:`lino.core.dbtables.add_gridfilters`.
+
+    """
+    flttype = flt['type']
+    value = flt['value']
+    if flttype == 'string':
+        value = six.text_type(value).lower()
+        return lambda v: value in value2text(v).lower()
+    if flttype == 'boolean':
+        return lambda v: bool(v) == bool(value)
+    cmp = COMPARISONS[str(flt['comparison'])]
+    if flttype == 'date':
+        value = datetime.date(*settings.SITE.parse_date(value))
+
+        def test(v):
+            if v is None:
+                return False
+            if isinstance(v, datetime.datetime):
+                v = v.date()
+            return cmp(v, value)
+        return test
+    if flttype == 'numeric':
+        def test(v):
+            if v is None:
+                return False
+            try:
+                # the filter value comes as a string or a float
+                return cmp(v, v.__class__(value))
+            except (TypeError, ValueError, ArithmeticError):
+                return False
+        return test
+    raise NotImplementedError(repr(flt))
+
+
+def filter_data_rows(ar, rows, gridfilters=None, search_fields=None,
+                     order_by=None):
+    """Return a list with those of the given `rows` which pass the given
+    grid filters and the quick search of `ar`, sorted by `order_by`.
+
+    """
+    cols = DataColumns(ar, rows)
+    indexes = range(len(rows))
+    if ar.quick_search and search_fields:
+        search_text = ar.quick_search.lower()
+
+        def matches(i):
+            for name in search_fields:
+                if search_text in value2text(cols.get_value(name, i)).lower():
+                    return True
+            return False
+        indexes = [i for i in indexes if matches(i)]
+    for flt in gridfilters or []:
+        indexes = cols.filter(indexes, flt['field'], gridfilter2test(flt))
+    if order_by:
+        indexes = cols.sort(indexes, order_by)
+    return [rows[i] for i in indexes]
+
+
+ROWS_CACHE = dict()
+ROWS_CACHE_LOCK = threading.Lock()
+
+
+def key2str(v):
+    if hasattr(v, '_meta') and hasattr(v, 'pk'):
+        return (v._meta.db_table, v.pk)
+    if isinstance(v, dict):
+        return sorted([(k, key2str(x)) for k, x in v.items()])
+    if isinstance(v, (list, tuple)):
+        return [key2str(x) for x in v]
+    return six.text_type(v)
+
+
+def get_cached_data_rows(ar, func):
+    """Return the data rows of `ar`, computing them using `func` only if
+    they have not been computed during the last :attr:`rows_cache_timeout
+    <lino.core.tables.AbstractTable.rows_cache_timeout>` seconds for the
+    same actor, user, language, master instance, parameter values and
+    quick search.
+
+    The rows are cached in the memory of the server process because
+    they don't need to be picklable.  The cache is shared by the
+    threads of the process and protected by a lock.
+
+    """
+    now = datetime.datetime.now()
+    u = ar.get_user()
+    key = repr(key2str([
+        ar.actor, u, translation.get_language(), ar.master_instance,
+        ar.param_values, ar.known_values, ar.quick_search]))
+    with ROWS_CACHE_LOCK:
+        for k in [k for k, v in ROWS_CACHE.items() if v[0] < now]:
+            ROWS_CACHE.pop(k, None)
+        cached = ROWS_CACHE.get(key)
+    if cached is not None:
+        return cached[1]
+    rows = func()
+    expires = now + datetime.timedelta(seconds=ar.actor.rows_cache_timeout)
+    with ROWS_CACHE_LOCK:
+        ROWS_CACHE[key] = (expires, rows)
+    return rows
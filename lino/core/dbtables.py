@@ -36,6 +36,7 @@ from lino.core.choicelists import ChoiceListField
 
 
 from lino.core.utils import resolve_model, get_field, UnresolvedModel
+from lino.core.utils import full_model_name
 from lino.core.tables import AbstractTable, TableRequest, VirtualTable
 from lino.core.gfks import ContentType, GenericForeignKey
 
@@ -66,7 +67,8 @@ def add_gridfilters(qs, gridfilters):
 
     """
     if not isinstance(qs, QuerySet):
-        raise NotImplementedError('TODO: filter also simple lists')
+        # lists are filtered by lino.core.datarows
+        raise NotImplementedError('Cannot filter a %s' % type(qs))
     q = models.Q()
     # logger.info("20160610 %s", gridfilters)
     # raise Exception("20160610 %s" % gridfilters)
@@ -429,7 +431,7 @@ class Table(AbstractTable):
             # u = ar.get_user()
             for ba in self.get_actions(ar.bound_action.action):
                 if ba.action.action_name:
-                    if ba.action.show_in_bbar and not self.get_row_permission(obj, ar, state, ba):
+                    if ba.action.show_in_bbar and not self.get_cached_row_permission(obj, ar, state, ba):
                     # if ba.action.show_in_bbar and not obj.get_row_permission(u,state,ba.action):
                     # if a.show_in_bbar and not a.get_action_permission(ar.get_user(),obj,state):
                         d[ba.action.action_name] = True
@@ -631,6 +633,17 @@ class Table(AbstractTable):
             return True
         return obj.get_row_permission(ar, state, ba)
 
+    @classmethod
+    def get_permission_fallback_reason(cls):
+        reason = super(Table, cls).get_permission_fallback_reason()
+        if reason is None and cls.state_only_permissions is None \
+           and cls.model is not None:
+            func = six.get_unbound_function(cls.model.get_row_permission)
+            if func is not DEFAULT_MODEL_ROW_PERMISSION:
+                return "{0} overrides get_row_permission()".format(
+                    full_model_name(cls.model))
+        return reason
+
     @classmethod
     def disable_delete(self, obj, ar):
         """
@@ -647,6 +660,43 @@ class Table(AbstractTable):
             return _("You have no permission to delete this row.")
         return obj.disable_delete(ar)
 
+    @classmethod
+    def get_delete_vetos(self, objects, ar):
+        """Bulk version of :meth:`disable_delete`.  Return a dict which
+        maps the primary key of each of the given `objects` which may
+        *not* be deleted by action request `ar` to a message
+        explaining why.
+
+        When :meth:`disable_delete` has been overridden, this calls
+        it for every object.
+
+        """
+        objects = list(objects)
+        if self.delete_action is None:
+            return dict([(obj.pk, "No delete_action") for obj in objects])
+        vetos = dict()
+        if six.get_method_function(self.disable_delete) is not \
+           six.get_method_function(Table.disable_delete):
+            for obj in objects:
+                msg = self.disable_delete(obj, ar)
+                if msg is not None:
+                    vetos[obj.pk] = msg
+            return vetos
+        todo = []
+        for obj in objects:
+            if self.get_row_permission(
+                    obj, ar, self.get_row_state(obj), self.delete_action):
+                todo.append(obj)
+            else:
+                vetos[obj.pk] = _(
+                    "You have no permission to delete this row.")
+        by_model = dict()
+        for obj in todo:
+            by_model.setdefault(obj.__class__, []).append(obj)
+        for model, lst in by_model.items():
+            vetos.update(model.get_delete_vetos(lst, ar))
+        return vetos
+
     @classmethod
     def get_data_elem(self, name):
         """
@@ -811,3 +861,7 @@ def column_choices(rptname):
     rpt = actors.get_actor(rptname)
     return rpt.column_choices()
 
+
+actors.DEFAULT_ROW_PERMISSION_HANDLERS.add(Table.get_row_permission.__func__)
+DEFAULT_MODEL_ROW_PERMISSION = six.get_unbound_function(
+    Model.get_row_permission)
@@ -15,6 +15,7 @@ from django.conf import settings
 from django.db import models
 
 from .utils import full_model_name as fmn
+from .utils import iter_chunks
 
 
 class DisableDeleteHandler(object):
@@ -97,3 +98,61 @@ class DisableDeleteHandler(object):
             if n:
                 return obj.delete_veto_message(qs.model, n)
         return None
+
+    def disable_delete_on_objects(self, objects, ignore_models=set()):
+        """Bulk version of :meth:`disable_delete_on_object`.  Return a
+        dict which maps the primary key of every given object having
+        a veto to its veto message.
+
+        This runs one query per ForeignKey (and one per GFK) for every
+        chunk of objects instead of one per ForeignKey for every
+        object.
+
+        """
+        vetos = dict()
+        for chunk in iter_chunks(objects):
+            self.collect_vetos(chunk, ignore_models, vetos)
+        return vetos
+
+    def collect_vetos(self, objects, ignore_models, vetos):
+        todo = dict([(obj.pk, obj) for obj in objects])
+        for m, fk in self.fklist:
+            if not todo:
+                return
+            if m in ignore_models:
+                continue
+            if fk.name in m.allow_cascaded_delete:
+                continue
+            if fk.null and fk.rel.on_delete == models.SET_NULL:
+                continue
+            target = fk.rel.get_related_field().attname
+            keys = dict([(getattr(obj, target), obj) for obj in todo.values()])
+            qs = m.objects.filter(**{fk.name + '__in': list(keys.keys())})
+            qs = qs.values(fk.attname).annotate(
+                num=models.Count('pk')).order_by()
+            for row in qs:
+                obj = keys[row[fk.attname]]
+                if row['num'] and obj.pk in todo:
+                    vetos[obj.pk] = obj.delete_veto_message(m, row['num'])
+                    del todo[obj.pk]
+
+        kernel = settings.SITE.kernel
+        by_model = dict()
+        for obj in todo.values():
+            by_model.setdefault(obj.__class__, []).append(obj)
+        for model, lst in by_model.items():
+            pks = [obj.pk for obj in lst]
+            for gfk, fk_field, qs in kernel.get_generic_related_to_many(
+                    model, pks):
+                if gfk.name in qs.model.allow_cascaded_delete:
+                    continue
+                if fk_field.null:  # a nullable GFK is no reason to veto
+                    continue
+                qs = qs.values(fk_field.attname).annotate(
+                    num=models.Count('pk')).order_by()
+                for row in qs:
+                    obj = todo.get(row[fk_field.attname])
+                    if row['num'] and obj is not None:
+                        vetos[obj.pk] = obj.delete_veto_message(
+                            qs.model, row['num'])
+                        del todo[obj.pk]
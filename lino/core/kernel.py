@@ -31,11 +31,17 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
-from os.path import join, dirname, exists
+from os.path import join, dirname, basename, exists, splitext
 
+import re
+import io
 import sys
 import time
+import gzip
+import json
+import glob
 import codecs
+import hashlib
 import atexit
 from importlib import import_module
 
@@ -47,6 +53,11 @@ from django.db import models
 
 from django.utils.translation import ugettext_lazy as _
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 from lino.utils import codetime
 from lino.core import layouts
 from lino.core import actors
@@ -74,6 +85,7 @@ from .utils import is_devserver
 from .utils import full_model_name as fmn
 from .utils import obj2str
 from .utils import get_models
+from .utils import iter_chunks
 # from .utils import format_request
 from .exceptions import ChangedAPI
 from .gfks import GenericForeignKey
@@ -149,6 +161,44 @@ class Callback(object):
         return cbc
 
 
+HASH_LENGTH = 12
+
+
+def hashed_name(name, digest):
+    """Return the given file name with the first characters of the given
+    hexadecimal digest inserted before its extension.
+
+    """
+    root, ext = splitext(name)
+    return "{0}.{1}{2}".format(root, digest[:HASH_LENGTH], ext)
+
+
+def gzip_compress(data):
+    buf = io.BytesIO()
+    # mtime=0 makes the result depend only on the content
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+COMPRESSORS = [('.gz', gzip_compress)]
+if brotli is not None:
+    COMPRESSORS.append(('.br', brotli.compress))
+
+
+def file_stamp(fn):
+    """Return the modification time and size of the file `fn`, or `None`
+    if it doesn't exist.
+
+    """
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
 class Kernel(object):
     """This is the class of the object stored in :attr:`Site.kernel
 <lino.core.site.Site.kernel>`.
@@ -446,6 +496,7 @@ class Kernel(object):
         site.resolve_virtual_fields()
 
         self.code_mtime = codetime()
+        self._hashed_names = dict()
         # We set `code_mtime` only after kernel_startup() because
         # codetime watches only those modules which are already
         # imported.
@@ -652,14 +703,38 @@ class Kernel(object):
             ct = ContentType.objects.get_for_model(gfk.model)
             yield gfk, fk_field, ct.get_all_objects_for_this_type(**kw)
 
+    def get_generic_related_to_many(self, model, pks):
+        """Same as :meth:`get_generic_related`, but for a set of database
+        objects of the given `model` specified by their primary keys.
+        The yielded querysets return all objects whose GFK points to
+        any of these.
+
+        """
+        if len(self.GFK_LIST) == 0:
+            return
+        from django.contrib.contenttypes.models import ContentType
+        if not isinstance(model._meta.pk, GFK_TARGETS):
+            return
+        obj_ct = ContentType.objects.get_for_model(model)
+        for gfk in self.GFK_LIST:
+            fk_field = gfk.model._meta.get_field(gfk.fk_field)
+            kw = dict()
+            kw[gfk.fk_field + '__in'] = pks
+            kw[gfk.ct_field] = obj_ct
+            ct = ContentType.objects.get_for_model(gfk.model)
+            yield gfk, fk_field, ct.get_all_objects_for_this_type(**kw)
+
     def get_broken_generic_related(self, model):
         """Yield all database objects of this model which have some broken
         GFK field.
-    
-        This is a slow query which does an additional database request
-        for each row. (Is there a possibility to do this in a single
-        SQL query?)
-    
+
+        This runs, for every GFK of the model and every content type
+        used by it, a single query which selects the rows whose
+        object id does not exist in the pointed model (an
+        "anti-join").  The result is fetched in chunks ordered by
+        primary key (see :func:`lino.core.utils.iter_chunks`), so the
+        caller may delete the yielded objects.
+
         Each yeld object has two special attributes:
     
         - `_message` : a textual description of the problem
@@ -671,31 +746,48 @@ class Kernel(object):
         See also :ref:`lino.tutorial.watch`.
 
         """
+        from django.contrib.contenttypes.models import ContentType
         gfks = [f for f in self.GFK_LIST if f.model is model]
-        if len(gfks):
-            for gfk in gfks:
-                fk_field = gfk.model._meta.get_field(gfk.fk_field)
-                # fk_field, remote_model, direct, m2m = \
-                #     gfk.model._meta.get_field_by_name(gfk.fk_field)
-                kw = {gfk.ct_field+'__isnull': False}
-                qs = model.objects.filter(**kw)
-                for obj in qs:
-                    fk = getattr(obj, gfk.fk_field)
-                    ct = getattr(obj, gfk.ct_field)
-                    pointed_model = ct.model_class()
-                    # pointed_model = ContentType.objects.get_for_id(ct)
-                    try:
-                        pointed_model.objects.get(pk=fk)
-                    except pointed_model.DoesNotExist:
-                        msg = "Invalid primary key {1} for {2} in `{0}`"
+        for gfk in gfks:
+            fk_field = gfk.model._meta.get_field(gfk.fk_field)
+            if gfk.name in model.allow_cascaded_delete:
+                todo = 'delete'
+            elif fk_field.null:
+                todo = 'clear'
+            else:
+                todo = 'manual'
+            kw = {gfk.ct_field+'__isnull': False}
+            ct_ids = model.objects.filter(**kw).values_list(
+                gfk.ct_field, flat=True).distinct().order_by()
+            for ct_id in ct_ids:
+                ct = ContentType.objects.get_for_id(ct_id)
+                pointed_model = ct.model_class()
+                qs = model.objects.filter(**{gfk.ct_field: ct_id})
+                if pointed_model is None:
+                    msg = "Invalid content type {1} in `{0}`".format(
+                        gfk.ct_field, ct)
+                    for chunk in iter_chunks(qs.order_by('pk')):
+                        for obj in chunk:
+                            obj._message = msg
+                            obj._todo = todo
+                            yield obj
+                    continue
+                pks = pointed_model.objects.values('pk')
+                if isinstance(pointed_model._meta.pk, GFK_TARGETS):
+                    qs = qs.exclude(**{gfk.fk_field+'__in': pks})
+                else:
+                    # cannot compare the object ids in SQL
+                    pks = set([str(pk) for pk in pks.values_list(
+                        'pk', flat=True)])
+                msg = "Invalid primary key {1} for {2} in `{0}`"
+                for chunk in iter_chunks(qs.order_by('pk')):
+                    for obj in chunk:
+                        fk = getattr(obj, gfk.fk_field)
+                        if isinstance(pks, set) and str(fk) in pks:
+                            continue
                         obj._message = msg.format(
                             gfk.fk_field, fk, fmn(pointed_model))
-                        if gfk.name in model.allow_cascaded_delete:
-                            obj._todo = 'delete'
-                        elif fk_field.null:
-                            obj._todo = 'clear'
-                        else:
-                            obj._todo = 'manual'
+                        obj._todo = todo
                         yield obj
 
     def abandon_response(self):
@@ -883,17 +975,155 @@ class Kernel(object):
 
         logger.debug("Building %s ...", fn)
         self.site.makedirs_if_missing(dirname(fn))
-        f = codecs.open(fn, 'w', encoding='utf-8')
+        buf = six.StringIO()
         try:
-            write(f)
-            f.close()
-            return 1
+            write(buf)
         except Exception:
-            f.close()
-            if not self.site.keep_erroneous_cache_files:  #
+            if self.site.keep_erroneous_cache_files:
+                self.write_cache_file(fn, buf.getvalue(), hashed=False)
+            elif exists(fn):
                 os.remove(fn)
             raise
-        #~ logger.info("Wrote %s ...", fn)
+        content = buf.getvalue()
+        if exists(fn):
+            with codecs.open(fn, 'r', encoding='utf-8') as f:
+                old = f.read()
+            if old == content:
+                # don't rewrite it, just mark it as up to date
+                logger.debug("%s is unchanged.", fn)
+                os.utime(fn, None)
+                data = content.encode('utf-8')
+                self.write_compressed_files(fn, data, only_missing=True)
+                self.write_hashed_copy(fn, data)
+                return 0
+        self.write_cache_file(fn, content)
+        return 1
+
+    def write_cache_file(self, fn, content, hashed=True):
+        """Write the given `content` to the cache file `fn`, together with
+        a gzip (and, if the `brotli` package is installed, a brotli)
+        compressed sibling.
+
+        If `hashed` is True, also write a copy whose name contains a
+        hash of the content (see :meth:`get_hashed_name`).
+
+        """
+        data = content.encode('utf-8')
+        self.write_file(fn, data)
+        self.write_compressed_files(fn, data)
+        if hashed:
+            self.write_hashed_copy(fn, data)
+
+    def write_file(self, fn, data):
+        """Write the given bytes to the file `fn`.  The file is first
+        written under a temporary name and then renamed so that
+        concurrent readers never see a partly written file.
+
+        """
+        tmp = "{0}.{1}.tmp".format(fn, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, fn)
+
+    def write_compressed_files(self, fn, data, only_missing=False):
+        """Write the compressed siblings (:file:`.gz` and :file:`.br`) of
+        the file `fn` which has the given content `data`.  These can
+        be served directly by a front-end server (e.g. using the
+        `gzip_static` directive of nginx).
+
+        """
+        for ext, compress in COMPRESSORS:
+            if only_missing and exists(fn + ext):
+                continue
+            self.write_file(fn + ext, compress(data))
+
+    def write_hashed_copy(self, fn, data, stamp=None):
+        """Make sure that a copy of the file `fn` (having the given content
+        `data`) exists under its hashed name.  Return the hashed name.
+
+        When a new hashed copy is written, the older copies of `fn`
+        are removed except for the :attr:`hashed_cache_generations
+        <lino.core.site.Site.hashed_cache_generations>` most recent
+        ones.
+
+        `stamp` is the :func:`file_stamp` of `fn` at the moment when
+        `data` was read from it (default is to take it now).
+
+        """
+        name = hashed_name(basename(fn), hashlib.md5(data).hexdigest())
+        hfn = join(dirname(fn), name)
+        if not exists(hfn):
+            self.write_file(hfn, data)
+            self.write_compressed_files(hfn, data)
+            self.remove_old_hashed_copies(fn, name)
+        if stamp is None:
+            stamp = file_stamp(fn)
+        self._hashed_names[fn] = (stamp, name)
+        return name
+
+    def remove_old_hashed_copies(self, fn, current):
+        """Remove the hashed copies of cache file `fn` (and their
+        compressed siblings) except the `current` one and the
+        :attr:`hashed_cache_generations
+        <lino.core.site.Site.hashed_cache_generations>` most recent
+        older ones.
+
+        """
+        root, ext = splitext(basename(fn))
+        pattern = re.compile(
+            re.escape(root) + r"\.[0-9a-f]{%d}" % HASH_LENGTH +
+            re.escape(ext) + "$")
+        copies = []
+        for old in glob.glob(join(dirname(fn), root + '.*')):
+            name = basename(old)
+            if name != current and pattern.match(name):
+                copies.append((os.stat(old).st_mtime, old))
+        copies.sort(reverse=True)
+        for mtime, old in copies[self.site.hashed_cache_generations:]:
+            for sfx in ('', '.gz', '.br'):
+                if exists(old + sfx):
+                    os.remove(old + sfx)
+
+    def get_hashed_name(self, fn):
+        """Return the name of the copy of cache file `fn` which contains a
+        hash of its content.  Unlike the file `fn` itself, this copy
+        never changes and can therefore be cached forever by browsers.
+
+        `fn` is relative to :setting:`MEDIA_ROOT`.  If the file does
+        not exist, return its plain name.
+
+        The result is memoized per process together with the
+        modification time and size of `fn`, so that it gets updated
+        when another process (e.g. a worker of
+        :attr:`build_js_cache_workers
+        <lino.core.site.Site.build_js_cache_workers>`) rebuilds the
+        file.
+
+        """
+        fn = join(settings.MEDIA_ROOT, fn)
+        stamp = file_stamp(fn)
+        if stamp is None:
+            return basename(fn)
+        memo = self._hashed_names.get(fn)
+        if memo is not None and memo[0] == stamp:
+            return memo[1]
+        with open(fn, 'rb') as f:
+            data = f.read()
+        return self.write_hashed_copy(fn, data, stamp)
+
+    def write_cache_manifest(self, *files):
+        """Write the file :file:`cache/manifest.json` which maps the name
+        of each of the given cache files to the name of its hashed
+        copy.  File names are relative to :setting:`MEDIA_ROOT`.
+
+        """
+        manifest = dict()
+        for fn in files:
+            manifest[fn] = join(dirname(fn), self.get_hashed_name(fn))
+        fn = join(settings.MEDIA_ROOT, 'cache', 'manifest.json')
+        self.site.makedirs_if_missing(dirname(fn))
+        content = json.dumps(manifest, indent=2, sort_keys=True)
+        self.write_file(fn, content.encode('utf-8'))
 
     # def setup_static_link(self, urlpatterns, short_name,
     #                       attr_name=None, source=None):
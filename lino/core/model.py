@@ -12,7 +12,9 @@ from builtins import str
 from past.builtins import basestring
 from builtins import object
 
+import six
 import logging
+import threading
 logger = logging.getLogger(__name__)
 
 from django.db import models
@@ -28,6 +30,7 @@ from lino.core import fields
 from lino.core import signals
 from lino.core import actions
 from lino.core.utils import error2str
+from lino.core.utils import iter_chunks
 from lino.core.utils import resolve_model
 from lino.utils.xmlgen.html import E
 from lino.utils import get_class_attr
@@ -132,6 +135,20 @@ class Model(models.Model):
     
     """
 
+    choices_cache_timeout = None
+    """The number of seconds to cache the responses of combo boxes
+    which select an instance of this model.
+
+    The default value `None` means that these responses are not
+    cached.  Setting this is useful for "hot" combo fields on big
+    tables.  The cache is invalidated when an instance of this model
+    (or of one of its MTI children) is saved or deleted (see
+    :mod:`lino.core.tableversions`).  Note that on a site with several server
+    processes this requires a shared `cache backend
+    <https://docs.djangoproject.com/en/dev/topics/cache/>`__.
+
+    """
+
     grid_post = actions.CreateRow()
     submit_insert = actions.SubmitInsert()
     """This is the action represented by the "Create" button of an Insert
@@ -165,6 +182,16 @@ class Model(models.Model):
 
     """
 
+    quick_search_index = None
+    """An optional search index used to narrow quick searches on this
+    model.  This is set by plugins like :mod:`lino.modlib.search`.
+
+    If this is not `None`, it must have a method `get_filter(model,
+    search_text, prefix)` which returns either `None` or a filter
+    expression to be combined with the default quick search filter.
+
+    """
+
     active_fields = frozenset()
     """If specified, this is the default value for
     :attr:`active_fields<lino.core.tables.AbstractTable.active_fields>`
@@ -372,6 +399,39 @@ class Model(models.Model):
                     return msg
         return self.__class__._lino_ddh.disable_delete_on_object(self)
 
+    @classmethod
+    def get_delete_vetos(cls, objects, ar=None):
+        """Bulk version of :meth:`disable_delete`.  Return a dict which
+        maps the primary key of each of the given `objects` (instances
+        of this model) having a veto to its veto message.
+
+        When :meth:`disable_delete` has been overridden, this calls
+        it for every object.  Otherwise it asks the
+        :class:`DisableDeleteHandler <lino.core.ddh.DisableDeleteHandler>`
+        of this model and of its MTI parents using a constant number
+        of queries per chunk of objects.
+
+        """
+        objects = list(objects)
+        if six.get_unbound_function(cls.disable_delete) is not \
+           six.get_unbound_function(Model.disable_delete):
+            vetos = dict()
+            for obj in objects:
+                msg = obj.disable_delete(ar)
+                if msg is not None:
+                    vetos[obj.pk] = msg
+            return vetos
+        vetos = dict()
+        for b in cls.__bases__:
+            if issubclass(b, models.Model) \
+               and b is not models.Model and not b._meta.abstract:
+                todo = [obj for obj in objects if obj.pk not in vetos]
+                vetos.update(b._lino_ddh.disable_delete_on_objects(
+                    todo, [cls]))
+        todo = [obj for obj in objects if obj.pk not in vetos]
+        vetos.update(cls._lino_ddh.disable_delete_on_objects(todo))
+        return vetos
+
     @classmethod
     def get_default_table(self):
         """Used internally. Lino chooses during the kernel startup, for each
@@ -402,9 +462,10 @@ class Model(models.Model):
         Double-check to avoid "murder bug" (20150623).
         
         """
-        msg = self.disable_delete(None)
-        if msg is not None:
-            raise Warning(msg)
+        if not getattr(self, '_lino_delete_checked', False):
+            msg = self.disable_delete(None)
+            if msg is not None:
+                raise Warning(msg)
         super(Model, self).delete(**kw)
 
     def delete_veto_message(self, m, n):
@@ -630,6 +691,11 @@ class Model(models.Model):
             for fn in model.quick_search_fields:
                 kw = {prefix + fn + "__icontains": search_text}
                 q = q | models.Q(**kw)
+            if model.quick_search_index is not None:
+                iq = model.quick_search_index.get_filter(
+                    model, search_text, prefix)
+                if iq is not None:
+                    q = iq & q
         return q
 
     @classmethod
@@ -1046,6 +1112,7 @@ LINO_MODEL_ATTRIBS = (
     'get_related_project',
     'quick_search_fields',
     'quick_search_fields_digit',
+    'quick_search_index',
     'change_watcher_spec',
     'on_analyze',
     'disable_delete',
@@ -1061,6 +1128,7 @@ LINO_MODEL_ATTRIBS = (
 
 from lino.core.signals import receiver
 from django.db.models.signals import pre_delete
+from lino.core import tableversions  # connects its signal receivers
 
 
 @receiver(pre_delete)
@@ -1092,27 +1160,110 @@ def pre_delete_handler(sender, instance=None, **kw):
     :attr:`allow_cascaded_delete` from ``CASCADE`` to
     ``PROTECTED`` at startup.
 
+    The cascaded generic related objects are deleted in bulk when
+    possible, see :func:`handle_generic_related` and
+    :func:`delete_queryset`.
+
     """
 
+    if instance.pk in get_bulk_handled(sender):
+        return  # GFKs have been handled by delete_queryset()
+    # no need to check again when the delete action did a bulk check
+    checked = getattr(instance, '_lino_delete_checked', False)
+    handle_generic_related(sender, [instance], checked)
+
+
+_bulk_handled = threading.local()
+
+
+def get_bulk_handled(model):
+    """Return the set of primary keys of the instances of `model` whose
+    generic related objects have already been handled by
+    :func:`delete_queryset` in the current thread.
+
+    """
+    d = getattr(_bulk_handled, 'pks', None)
+    if d is None:
+        d = _bulk_handled.pks = dict()
+    return d.setdefault(model, set())
+
+
+def handle_generic_related(model, objects, checked=False):
+    """Handle the generic related objects of the given instances of
+    `model` before they get deleted: delete those which are in
+    :attr:`allow_cascaded_delete <Model.allow_cascaded_delete>`,
+    clear nullable GFKs and raise a :class:`Warning` if some
+    non-nullable GFK points to one of them (unless `checked` is
+    True).
+
+    Does a constant number of queries, except for the cascaded
+    objects which are deleted using :func:`delete_queryset`.
+
+    """
     kernel = settings.SITE.kernel
-    # print "20141208 generic related objects for %s:" % obj
+    objects = dict([(obj.pk, obj) for obj in objects])
     must_cascade = []
-    for gfk, fk_field, qs in kernel.get_generic_related(instance):
+    for gfk, fk_field, qs in kernel.get_generic_related_to_many(
+            model, list(objects.keys())):
         if gfk.name in qs.model.allow_cascaded_delete:
             must_cascade.append(qs)
-        else:
-            if fk_field.null:  # clear nullable GFKs
-                for obj in qs:
-                    setattr(obj, gfk.name, None)
-            elif qs.count():
-                raise Warning(instance.delete_veto_message(
-                    qs.model, qs.count()))
+        elif fk_field.null:  # clear nullable GFKs
+            kw = {fk_field.attname: None}
+            ct_field = qs.model._meta.get_field(gfk.ct_field)
+            if ct_field.null:
+                kw[ct_field.attname] = None
+            qs.update(**kw)
+            tableversions.bump_table_versions(qs.model)
+        elif not checked:
+            qs = qs.values(fk_field.attname).annotate(
+                num=models.Count('pk')).order_by()
+            for row in qs[:1]:
+                obj = objects[row[fk_field.attname]]
+                raise Warning(obj.delete_veto_message(
+                    qs.model, row['num']))
     for qs in must_cascade:
-        if qs.count():
-            logger.info("Deleting %d %s before deleting %s",
-                        qs.count(),
-                        qs.model._meta.verbose_name_plural,
-                        obj2str(instance))
-            for obj in qs:
+        n = delete_queryset(qs)
+        if n:
+            logger.info("Deleted %d %s before deleting %s",
+                        n, qs.model._meta.verbose_name_plural,
+                        ', '.join([obj2str(o) for o in objects.values()]))
+
+
+def delete_queryset(qs):
+    """Delete all database objects of the given queryset and return
+    their number.
+
+    When the model doesn't override :meth:`Model.delete`, this checks
+    the delete vetos (:meth:`Model.get_delete_vetos`) and the generic
+    related objects of every chunk of rows in bulk and then deletes
+    the chunk using a single queryset-level `delete()`.  Otherwise it
+    calls `delete()` on every object.
+
+    """
+    model = qs.model
+    qs = qs.order_by('pk')
+    bulk = six.get_unbound_function(model.delete) is \
+        six.get_unbound_function(Model.delete)
+    n = 0
+    # keyset pagination: every chunk starts after the last primary key
+    # of the previous one, also when `delete()` doesn't remove the row
+    for chunk in iter_chunks(qs):
+        n += len(chunk)
+        if not bulk:
+            for obj in chunk:
                 obj.delete()
+            continue
+        vetos = model.get_delete_vetos(chunk)
+        for obj in chunk:
+            if obj.pk in vetos:
+                raise Warning(vetos[obj.pk])
+        handle_generic_related(model, chunk, True)
+        pks = [obj.pk for obj in chunk]
+        handled = get_bulk_handled(model)
+        handled.update(pks)
+        try:
+            model._base_manager.filter(pk__in=pks).delete()
+        finally:
+            handled.difference_update(pks)
+    return n
 
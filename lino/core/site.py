@@ -28,6 +28,8 @@ from builtins import str
 
 import os
 import sys
+import socket
+import smtplib
 from os.path import normpath, dirname, join, isdir, relpath, exists
 import inspect
 import datetime
@@ -124,6 +126,19 @@ class NOT_PROVIDED(object):
     pass
 
 
+def is_email_connection_error(e):
+    """Return `True` if the given exception means that the connection to
+    the email server got lost (see :meth:`Site.send_email`).  Other
+    SMTP errors (e.g. a refused recipient) concern only one email.
+
+    """
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPException):
+        return False
+    return isinstance(e, socket.error)
+
+
 class Site(object):
     """The base class for a Lino application.  This class is designed to
     be overridden by both application developers and local site
@@ -592,6 +607,17 @@ class Site(object):
 
     """
 
+    build_js_cache_workers = None
+    """The number of worker processes to use when building the
+    :xfile:`lino*.js` files for all user profiles and languages (see
+    :meth:`build_site_cache
+    <lino.modlib.extjs.ext_renderer.ExtRenderer.build_site_cache>`).
+
+    The default value `None` means to build them in the current
+    process.
+
+    """
+
     keep_erroneous_cache_files = False
     """When some exception occurs during
     :meth:`lino.core.kernel.Kernel.make_cache_file`, Lino usually
@@ -610,6 +636,17 @@ class Site(object):
 
     """
 
+    hashed_cache_generations = 3
+    """The number of older hashed copies to keep for every cache file
+    (see :meth:`lino.core.kernel.Kernel.write_hashed_copy`).
+
+    Browsers which loaded a page before a cache file was rebuilt,
+    and server processes which still serve the old page, continue to
+    use the hashed copy of the previous generation.  Older copies are
+    removed when a new one gets written.
+
+    """
+
     use_websockets = True
     """Set this to `False` in order to deactivate use of websockets and
     channels.  
@@ -1015,6 +1052,13 @@ class Site(object):
 
     """
 
+    data_chunk_size = 1000
+    """The number of database rows to fetch at once when streaming
+    potentially big tables, e.g. when rendering a table as CSV.  See
+    :func:`lino.core.utils.iter_chunks`.
+
+    """
+
     logger_filename = 'lino.log'
     """The name of Lino's main log file, created in :meth:`setup_logging`.
 
@@ -3089,6 +3133,11 @@ site. :manage:`diag` is a command-line shortcut to this.
             if cd.writeable:
                 ln += " [writeable]"
             s += ln + '\n'
+        s += "\n"
+        s += rstgen.header(1, "Row permissions evaluated per object")
+        from lino.core.actors import get_permission_fallbacks
+        for a, reason, count in get_permission_fallbacks():
+            s += "- {0} : {1} ({2} calls)\n".format(a, reason, count)
         # for arg in args:
         #     p = self.plugins[arg]
         return s
@@ -3447,10 +3496,15 @@ Please convert to Plugin method".format(mod, methname)
             url += "?" + urlencode(kw, True)
         return url
 
-    def send_email(self, subject, sender, body, recipients):
+    def send_email(self, subject, sender, body, recipients,
+                   connection=None):
         """Send an email message with the specified arguments (the same
 signature as `django.core.mail.EmailMessage`.
 
+        `connection` is an optional email backend instance (as
+        returned by `django.core.mail.get_connection`) to be reused
+        when sending many emails.
+
         `recipients` is an iterator over a list of strings with email
         addresses. Any address containing '@example.com' will be
         removed. Does nothing if the resulting list of recipients is
@@ -3458,16 +3512,23 @@ signature as `django.core.mail.EmailMessage`.
 
         If `body` starts with "<", then it is considered to be HTML.
 
+        Return `False` if the email could not be sent, otherwise
+        `True` (also when it has been ignored).  Errors are logged,
+        except when a `connection` was given and the connection to the
+        email server got lost (see :func:`is_email_connection_error`):
+        then the exception is raised
+        so that the caller can stop sending more emails through it.
+
         """
         if '@example.com' in sender:
             self.logger.debug(
                 "Ignoring email '%s' because sender is %s", subject, sender)
-            return
+            return True
         recipients = [a for a in recipients if '@example.com' not in a]
         if not len(recipients):
             self.logger.info(
                 "Ignoring email '%s' because there is no recipient", subject)
-            return
+            return True
 
         self.logger.info(
             "Send email '%s' from %s to %s", subject, sender, recipients)
@@ -3479,9 +3540,14 @@ signature as `django.core.mail.EmailMessage`.
             body = html2text(body)
         # self.logger.info("20161008b %r %r %r %r", subject, sender, recipients, body)
         try:
-            send_mail(subject, body, sender, recipients, **kw)
+            send_mail(subject, body, sender, recipients,
+                      connection=connection, **kw)
         except Exception as e:
+            if connection is not None and is_email_connection_error(e):
+                raise
             self.logger.warning("send_mail() failed : %s", e)
+            return False
+        return True
         # msg = EmailMessage(subject=subject,
         #                    from_email=sender, body=body, to=recipients)
 
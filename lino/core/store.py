@@ -34,6 +34,8 @@ from builtins import object
 import logging
 logger = logging.getLogger(__name__)
 
+import re
+import keyword
 import datetime
 
 from django.conf import settings
@@ -532,7 +534,7 @@ class DisableEditingStoreField(SpecialStoreField):
         if actor.update_action is None:
             # print 20120601, self.store.actor, "update_action is None"
             return True  # disable editing if there's no update_action
-        v = actor.get_row_permission(
+        v = actor.get_cached_row_permission(
             obj, ar, actor.get_row_state(obj), actor.update_action)
         # if str(actor).startswith('aids.'):
         #     logger.info("20141128 store.py %s %s value=%s",
@@ -858,6 +860,135 @@ def create_atomizer(model, fld, name):
         return ComboStoreField(fld, name, **kw)
 
 
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _func(m):
+    # Return the plain function of a (bound or unbound) method.
+    return getattr(m, '__func__', m)
+
+
+def _simple_getter(sf):
+    """Return the name of the model attribute to read for getting the
+    value of the given store field, or `None` if the store field
+    needs its :meth:`full_value_from_object` method to be called.
+
+    """
+    if 'full_value_from_object' in sf.__dict__:
+        return None
+    if _func(sf.full_value_from_object) is not _func(
+            StoreField.full_value_from_object):
+        return None
+    fld = sf.field
+    if not isinstance(fld, models.Field):
+        return None
+    if _func(fld.value_from_object) is not _func(
+            models.Field.value_from_object):
+        return None
+    attname = getattr(fld, 'attname', None)
+    if attname and IDENTIFIER.match(attname) \
+       and not keyword.iskeyword(attname):
+        return str(attname)
+    return None
+
+
+class RowSerializerCompiler(object):
+    """Generates the source code of a specialized function which
+    serializes a row for a given sequence of store fields.
+
+    This is used by :meth:`Store.compile_serializers`.  The generated
+    functions do exactly what :meth:`Store.row2list_loop` and
+    :meth:`Store.row2dict_loop` do, except that all decisions which
+    depend only on the store fields (how to get the value, whether
+    the field is a :class:`ComboStoreField`, ...) have been taken in
+    advance.
+
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.namespace = dict()
+        self.lines = []
+
+    def add_global(self, prefix, i, value):
+        name = "_%s%d" % (prefix, i)
+        self.namespace[name] = value
+        return name
+
+    def emit_getter(self, i, sf):
+        attname = _simple_getter(sf)
+        if attname is None:
+            g = self.add_global('g', i, sf.full_value_from_object)
+            self.lines.append("    v%d = %s(row, ar)" % (i, g))
+        else:
+            self.lines.append("    v%d = row.%s" % (i, attname))
+
+    def compile(self, name):
+        source = "\n".join(self.lines)
+        exec(compile(source, "<%s>" % name, 'exec'), self.namespace)
+        return self.namespace[name]
+
+    def compile_row2list(self):
+        """Return a function `f(ar, row)` equivalent to
+        :meth:`Store.row2list_loop`.
+
+        """
+        self.lines.append("def row2list(ar, row):")
+        self.lines.append("    l = []")
+        pending = []
+
+        def flush():
+            if len(pending):
+                self.lines.append("    l += [%s]" % ', '.join(pending))
+                del pending[:]
+
+        for i, sf in enumerate(self.fields):
+            self.emit_getter(i, sf)
+            v2l = sf.value2list
+            if _func(v2l) is _func(StoreField.value2list):
+                pending.append("v%d" % i)
+            elif _func(v2l) is _func(ComboStoreField.value2list):
+                vt = self.add_global('vt', i, v2l.__self__.get_value_text)
+                self.lines.append("    t%d = %s(v%d, row)" % (i, vt, i))
+                pending.append("t%d[1]" % i)
+                pending.append("t%d[0]" % i)
+            else:
+                flush()
+                p = self.add_global('p', i, v2l)
+                self.lines.append("    %s(ar, v%d, l, row)" % (p, i))
+        flush()
+        self.lines.append("    return l")
+        return self.compile('row2list')
+
+    def compile_row2dict(self):
+        """Return a function `f(ar, row, d)` equivalent to
+        :meth:`Store.row2dict_loop`.
+
+        """
+        self.lines.append("def row2dict(ar, row, d):")
+        for i, sf in enumerate(self.fields):
+            self.emit_getter(i, sf)
+            v2d = sf.value2dict
+            if _func(v2d) is _func(StoreField.value2dict):
+                owner = getattr(v2d, '__self__', sf)
+                n = self.add_global('n', i, str(owner.name))
+                self.lines.append("    d[%s] = v%d" % (n, i))
+            elif _func(v2d) is _func(ComboStoreField.value2dict):
+                owner = v2d.__self__
+                vt = self.add_global('vt', i, owner.get_value_text)
+                n = self.add_global('n', i, str(owner.name))
+                h = self.add_global('h', i, str(
+                    owner.name + constants.CHOICES_HIDDEN_SUFFIX))
+                self.lines.append("    t%d = %s(v%d, row)" % (i, vt, i))
+                self.lines.append("    d[%s] = t%d[1]" % (n, i))
+                self.lines.append("    d[%s] = t%d[0]" % (h, i))
+            else:
+                p = self.add_global('p', i, v2d)
+                self.lines.append("    %s(v%d, d, row)" % (p, i))
+        self.lines.append("    return d")
+        return self.compile('row2dict')
+
+
 class BaseStore(object):
     pass
 
@@ -1009,6 +1140,20 @@ class Store(BaseStore):
         self.all_fields = tuple(self.all_fields)
         self.list_fields = tuple(self.list_fields)
         self.detail_fields = tuple(self.detail_fields)
+        self.compile_serializers()
+
+    def compile_serializers(self):
+        """Build the specialized functions used by :meth:`row2list` and
+        :meth:`row2dict`.  See :class:`RowSerializerCompiler`.
+
+        """
+        self._row2list = RowSerializerCompiler(
+            self.list_fields).compile_row2list()
+        self._row2dict = {
+            id(self.list_fields): RowSerializerCompiler(
+                self.list_fields).compile_row2dict(),
+            id(self.detail_fields): RowSerializerCompiler(
+                self.detail_fields).compile_row2dict()}
 
     def collect_fields(self, fields, *layouts):
         """`fields` is a pointer to either `self.detail_fields` or
@@ -1099,7 +1244,31 @@ class Store(BaseStore):
         # logger.info("20111214 column_names: %s",list(self.column_names()))
         return list(self.column_names()).index(name)
 
-    def row2list(self, request, row):
+    def row2list(self, ar, row):
+        """Return a list with the "atomized" values of the given `row`
+        for all :attr:`list_fields`.
+
+        """
+        if isinstance(row, PhantomRow):
+            return self.row2list_loop(ar, row)
+        return self._row2list(ar, row)
+
+    def row2dict(self, ar, row, fields=None, **d):
+        """Return a dict with the "atomized" values of the given `row`
+        for the specified `fields` (default is :attr:`detail_fields`).
+
+        """
+        if fields is None:
+            fields = self.detail_fields
+        f = self._row2dict.get(id(fields))
+        if f is None:
+            return self.row2dict_loop(ar, row, fields, **d)
+        return f(ar, row, d)
+
+    def row2list_loop(self, request, row):
+        """The non-compiled equivalent of :meth:`row2list`.
+
+        """
         # assert isinstance(request,dbtables.AbstractTableRequest)
         # if not isinstance(request,dbtables.ListActionRequest):
             # raise Exception()
@@ -1118,7 +1287,10 @@ class Store(BaseStore):
         # logger.info("20130611 Store row2list() --> %r", l)
         return l
 
-    def row2dict(self, ar, row, fields=None, **d):
+    def row2dict_loop(self, ar, row, fields=None, **d):
+        """The non-compiled equivalent of :meth:`row2dict`.
+
+        """
         # assert isinstance(ar,dbtables.AbstractTableRequest)
         # logger.info("20111209 Store.row2dict(%s)", dd.obj2str(row))
         if fields is None:
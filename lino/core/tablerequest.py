@@ -20,10 +20,12 @@ from types import GeneratorType
 import sys
 from io import StringIO
 import json
+import hashlib
 
 from django.db import models
 from django.conf import settings
 from django.db.models.query import QuerySet
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, SuspiciousOperation
 
 from lino.core.utils import obj2str
@@ -34,12 +36,24 @@ from lino.utils.xmlgen import html as xghtml
 from lino.utils.xmlgen.html import E
 from lino.utils import jsgen
 from lino.core.utils import getrqdata
+from lino.core.datarows import filter_data_rows, get_cached_data_rows
+from lino.core.tableversions import get_table_versions, are_versioned
 
 from .requests import ActionRequest
 
 WARNINGS_LOGGED = dict()
 
 
+def count_queryset(qs, limit=None):
+    """Return the number of rows of the given queryset, but at most
+    `limit + 1` if `limit` is given.
+
+    """
+    if limit is not None:
+        return qs[:limit + 1].count()
+    return qs.count()
+
+
 def column_header(col):
         #~ if col.label:
             #~ return join_elems(col.label.split('\n'),sep=E.br)
@@ -145,15 +159,34 @@ class TableRequest(ActionRequest):
 
     def get_data_iterator(self):
         if self.actor.get_data_rows is not None:
-            l = []
-            for row in self.actor.get_data_rows(self):
-                group = self.actor.group_from_row(row)
-                group.process_row(l, row)
+            if self.actor.rows_cache_timeout:
+                l = get_cached_data_rows(self, self.get_data_rows)
+            else:
+                l = self.get_data_rows()
+            search_fields = self.actor.quick_search_fields
+            if isinstance(search_fields, six.string_types):
+                search_fields = search_fields.split()
+            if self.gridfilters or self.order_by or (
+                    self.quick_search and search_fields):
+                l = filter_data_rows(
+                    self, l, self.gridfilters, search_fields, self.order_by)
             return l
         #~ logger.info("20120914 tables.get_data_iterator %s",self)
         #~ logger.info("20120914 tables.get_data_iterator %s",self.actor)
         return self.actor.get_request_queryset(self)
 
+    def get_data_rows(self):
+        """Return a list of the rows yielded by the :meth:`get_data_rows
+        <lino.core.tables.AbstractTable.get_data_rows>` method of our
+        actor, processed by their group.
+
+        """
+        l = []
+        for row in self.actor.get_data_rows(self):
+            group = self.actor.group_from_row(row)
+            group.process_row(l, row)
+        return l
+
     def get_total_count(self):
         """
         Calling `len()` on a QuerySet would execute the whole SELECT.
@@ -161,7 +194,7 @@ class TableRequest(ActionRequest):
         """
         di = self.data_iterator
         if isinstance(di, QuerySet):
-            return di.count()
+            return self.get_queryset_count(di)
         #~ if di is None:
             #~ raise Exception("data_iterator is None: %s" % self)
         if False:
@@ -172,6 +205,42 @@ class TableRequest(ActionRequest):
             except TypeError:
                 raise TypeError("{0} has no length".format(di))
 
+    def get_queryset_count(self, qs):
+        """Return the number of rows of the given queryset, applying the
+        :attr:`max_exact_count
+        <lino.core.tables.AbstractTable.max_exact_count>` and
+        :attr:`count_cache_timeout
+        <lino.core.tables.AbstractTable.count_cache_timeout>` of our
+        actor.
+
+        The cache key is based on the SQL of the query, which contains
+        the filter conditions of the actor, the master instance, the
+        quick search and the parameter values of this request.  Counts
+        of queries which use a table whose version is not maintained
+        (see :mod:`lino.core.tableversions`) are not cached.
+
+        """
+        limit = self.actor.max_exact_count
+        timeout = self.actor.count_cache_timeout
+        if not timeout:
+            return count_queryset(qs, limit)
+        sql, params = qs.query.sql_with_params()
+        tables = set([qs.model._meta.db_table])
+        for alias in qs.query.alias_map.values():
+            tables.add(alias.table_name)
+        tables = sorted(tables)
+        if not are_versioned(tables):
+            return count_queryset(qs, limit)
+        data = [qs.db, sql, params, limit, tables,
+                get_table_versions(tables)]
+        key = 'lino-count-' + hashlib.md5(
+            repr(data).encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = count_queryset(qs, limit)
+            cache.set(key, count, timeout)
+        return count
+
     def __iter__(self):
         return self.data_iterator.__iter__()
 
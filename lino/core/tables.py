@@ -335,6 +335,52 @@ class AbstractTable(actors.Actor):
 
     """
 
+    count_cache_timeout = None
+    """The number of seconds to cache the total number of rows of
+    requests on this table.
+
+    The default value `None` means that the rows are counted again for
+    every request.  Cached counts are invalidated when an object of a
+    model used in the query is saved or deleted (see
+    :mod:`lino.core.tableversions`).  Note that on a site
+    with several server processes this requires a shared cache
+    backend.
+
+    """
+
+    max_exact_count = None
+    """If this is not `None`, then the total number of rows of requests
+    on this table is counted only up to this number.  Tables with more
+    rows than that will report `max_exact_count + 1` rows.
+
+    This makes counting fast on big tables when the exact number of
+    rows is not needed.
+
+    """
+
+    quick_search_fields = None
+    """For tables having a :meth:`get_data_rows` method: a list (or a
+    space-separated string) of the names of the columns where a quick
+    search should look.  If this is `None`, Lino doesn't filter the
+    rows returned by :meth:`get_data_rows` (which then may handle the
+    quick search itself).
+
+    Tables on a model use :attr:`lino.core.model.Model.quick_search_fields`.
+
+    """
+
+    rows_cache_timeout = None
+    """For tables having a :meth:`get_data_rows` method: the number of
+    seconds during which the rows returned by :meth:`get_data_rows`
+    may be reused for other requests (e.g. when the user scrolls to
+    another page, filters or sorts) with the same user, language,
+    master instance and parameter values.
+
+    The default value `None` means that :meth:`get_data_rows` is
+    called for every request.
+
+    """
+
     cell_edit = True
     """`True` (default) to use ExtJS CellSelectionModel, `False` to use
     RowSelectionModel.  When `True`, the users cannot select multiple
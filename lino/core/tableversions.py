@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Version numbers of database tables, used for invalidating cached
+data which depends on the content of these tables (e.g. the
+responses of combo boxes, see :attr:`choices_cache_timeout
+<lino.core.model.Model.choices_cache_timeout>`, or the row counts of
+tables, see :attr:`count_cache_timeout
+<lino.core.tables.AbstractTable.count_cache_timeout>`).
+
+The version numbers are stored in the Django cache so that they are
+shared by all processes of a site that uses a shared cache backend.
+
+Lino increments the version of a table (and those of the tables of
+its MTI parents) whenever a database object is saved or deleted.  The
+signal receivers which do this are connected at startup (after
+:data:`lino.core.signals.post_analyze`), independently of what is in
+the cache, and only for the models which need them: those having a
+:attr:`choices_cache_timeout
+<lino.core.model.Model.choices_cache_timeout>`, those of tables
+having a :attr:`count_cache_timeout
+<lino.core.tables.AbstractTable.count_cache_timeout>`, their MTI
+parents and the MTI children of all these.  The other models don't
+get any receiver so that Django can still delete them in bulk.
+
+Code which writes rows without sending these signals (e.g. using
+`bulk_create` or a queryset `update`) must call
+:func:`bump_table_versions` itself.
+
+"""
+
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+from lino.core.signals import receiver, post_analyze
+from lino.core.utils import full_model_name
+
+VERSIONED_TABLES = set()
+"""The names of the database tables whose versions are maintained."""
+
+
+def version_key(db_table):
+    return 'lino-table-version-' + db_table
+
+
+def get_table_versions(tables):
+    """Return a list with the current version numbers of the given
+    database tables.
+
+    """
+    keys = [version_key(t) for t in tables]
+    versions = cache.get_many(keys)
+    for k in keys:
+        if k not in versions:
+            versions[k] = 1
+            cache.add(k, 1, None)
+    return [versions[k] for k in keys]
+
+
+def get_model_version(model):
+    """Return the current version number of the table of the given
+    model.
+
+    """
+    return get_table_versions([model._meta.db_table])[0]
+
+
+def bump_table_versions(*models):
+    """Increment the version numbers of the tables of the given models
+    and their MTI parents.
+
+    """
+    tables = set()
+    for model in models:
+        for m in [model] + list(model._meta.get_parent_list()):
+            tables.add(m._meta.db_table)
+    for t in tables:
+        k = version_key(t)
+        try:
+            cache.incr(k)
+        except ValueError:
+            cache.set(k, 1, None)
+
+
+def are_versioned(tables):
+    """Return `True` if the versions of all given database tables are
+    maintained, i.e. if data depending on them may be cached.
+
+    """
+    return VERSIONED_TABLES.issuperset(tables)
+
+
+def on_table_changed(sender, **kwargs):
+    bump_table_versions(sender)
+
+
+@receiver(post_analyze)
+def setup_table_versions(sender, models_list=None, **kwargs):
+    from lino.core import actors
+    versioned = set()
+    for m in models_list:
+        if getattr(m, 'choices_cache_timeout', None):
+            versioned.add(m._meta.concrete_model)
+    for a in actors.actors_list:
+        m = getattr(a, 'model', None)
+        if getattr(a, 'count_cache_timeout', None) and m in models_list:
+            versioned.add(m._meta.concrete_model)
+    for m in list(versioned):
+        versioned.update(m._meta.get_parent_list())
+    VERSIONED_TABLES.clear()
+    VERSIONED_TABLES.update([m._meta.db_table for m in versioned])
+    for m in models_list:
+        if versioned.isdisjoint(
+                [m._meta.concrete_model] + list(m._meta.get_parent_list())):
+            continue
+        name = full_model_name(m)
+        post_save.connect(
+            on_table_changed, sender=m,
+            dispatch_uid='lino-bump-table-version-saved-' + name)
+        post_delete.connect(
+            on_table_changed, sender=m,
+            dispatch_uid='lino-bump-table-version-deleted-' + name)
@@ -26,6 +26,7 @@ import datetime
 
 from django.db import models
 from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
 from django.db.models.fields import FieldDoesNotExist
 from importlib import import_module
 from django.utils.translation import ugettext as _
@@ -551,6 +552,128 @@ def navinfo(qs, elem):
         message=message)
 
 
+def get_stable_ordering(qs):
+    """Return the list of `order_by` arguments which order the given
+    queryset as it is ordered now, followed by the primary key (unless
+    the primary key is already part of it).  The result is a total
+    order, i.e. stable slices of the queryset.
+
+    """
+    ordering = list(qs.query.extra_order_by or qs.query.order_by)
+    if not ordering and qs.query.default_ordering:
+        ordering = list(qs.model._meta.ordering)
+    pk = qs.model._meta.pk
+    for o in ordering:
+        if isinstance(o, six.string_types) and o.lstrip('-') in (
+                'pk', pk.name, pk.attname):
+            return ordering
+    return ordering + ['pk']
+
+
+def get_keyset_fields(qs, ordering):
+    """Return a list of `(field, descending)` tuples for the given stable
+    `ordering` of queryset `qs`, or `None` if the ordering cannot be
+    used for keyset pagination.  It can when it contains only local
+    non-nullable non-relational fields, the primary key being the last
+    one.
+
+    """
+    if qs._fields is not None or qs.query.extra_order_by:
+        return None  # values() querysets or extra() ordering
+    meta = qs.model._meta
+    keys = []
+    for o in ordering:
+        if not isinstance(o, six.string_types):
+            return None  # expressions
+        name = o.lstrip('-')
+        if name == '?' or LOOKUP_SEP in name:
+            return None
+        if name == 'pk':
+            fld = meta.pk
+        else:
+            try:
+                fld = meta.get_field(name)
+            except FieldDoesNotExist:
+                return None  # e.g. annotations
+        if fld is meta.pk:
+            keys.append((fld, o.startswith('-')))
+            return keys
+        if not fld.concrete or fld.null or fld.is_relation:
+            return None
+        keys.append((fld, o.startswith('-')))
+    return None
+
+
+def keyset_filter(keys, obj):
+    """Return a :class:`Q` object which selects the rows coming after the
+    given database object `obj` in the order given by `keys` (as
+    returned by :func:`get_keyset_fields`).
+
+    """
+    q = None
+    for i, (fld, desc) in enumerate(keys):
+        lookup = fld.attname + ('__lt' if desc else '__gt')
+        cond = Q(**{lookup: getattr(obj, fld.attname)})
+        for prev, d in keys[:i]:
+            cond &= Q(**{prev.attname: getattr(obj, prev.attname)})
+        q = cond if q is None else q | cond
+    return q
+
+
+def iter_chunks(qs, chunk_size=None):
+    """Yield the items of the given queryset (or sequence) `qs` as a
+    series of lists, each containing at most `chunk_size` items.
+
+    For a :class:`QuerySet` every chunk is fetched by a separate
+    database query, so that only one chunk at a time is held in
+    memory.  The primary key is added to the ordering of the queryset
+    (see :func:`get_stable_ordering`) because otherwise the database
+    would not guarantee stable slices.
+
+    Whenever possible (see :func:`get_keyset_fields`), the chunks are
+    selected by "keyset pagination": every chunk starts after the
+    last row of the previous one (e.g. ``pk__gt=last_pk``) instead of
+    skipping an increasing number of rows using OFFSET.  This is
+    faster on big tables, and it remains correct when the caller
+    modifies or deletes the rows of a chunk before asking for the
+    next one.  Querysets ordered by something else (e.g. a nullable
+    field or a field of a related model) are sliced using OFFSET.
+
+    A sliced queryset (e.g. ``qs[:10]``) is fetched at once.
+
+    The default value for `chunk_size` is
+    :attr:`lino.core.site.Site.data_chunk_size`.
+
+    """
+    if chunk_size is None:
+        chunk_size = settings.SITE.data_chunk_size
+    if isinstance(qs, models.QuerySet) and qs.query.can_filter():
+        ordering = get_stable_ordering(qs)
+        qs = qs.order_by(*ordering)
+        keys = get_keyset_fields(qs, ordering)
+        offset = 0
+        chunk = list(qs[:chunk_size])
+        while len(chunk):
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            if keys is None:
+                offset += chunk_size
+                chunk = list(qs[offset:offset + chunk_size])
+            else:
+                chunk = list(qs.filter(keyset_filter(keys, chunk[-1]))[
+                    :chunk_size])
+    else:
+        chunk = []
+        for item in qs:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk):
+            yield chunk
+
+
 # class Handle(object):
 #     """Base class for :class:`lino.core.tables.TableHandle`,
 #     :class:`lino.core.frames.FrameHandle` etc.
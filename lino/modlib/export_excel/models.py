@@ -12,6 +12,8 @@ from django.conf import settings
 from django.db.models import Model
 from django.utils.functional import Promise
 from lino.core import actions
+from lino.core import store
+from lino.core.utils import iter_chunks
 from lino.core.tables import AbstractTable
 from lino.utils.media import TmpMediaFile
 from lino.utils import IncompleteDate
@@ -30,9 +32,95 @@ def sheet_name(s):
     return s
 
 
+def value2cell(value):
+    """Convert a value of any type into something that can be stored in
+    a cell.
+
+    """
+    if type(value) == bool:
+        return value and 1 or 0
+    elif isinstance(value, (Duration, Choice)):
+        return str(value)
+    elif E.iselement(value):
+        return E.to_rst(value)
+        # dd.logger.info("20160716 %s", value)
+    elif isinstance(value, Promise):
+        return str(value)
+    elif isinstance(value, IncompleteDate):
+        return incomplete2cell(value)
+    elif isinstance(value, Model):
+        return str(value)
+    return value
+
+
+def bool2cell(value):
+    if type(value) == bool:
+        return value and 1 or 0
+    return value2cell(value)
+
+
+def object2cell(value):
+    if value is None:
+        return None
+    return str(value)
+
+
+def incomplete2cell(value):
+    if isinstance(value, IncompleteDate):
+        if value.is_complete():
+            return value.as_date()
+        return str(value)
+    return value2cell(value)
+
+
+def html2cell(value):
+    if E.iselement(value):
+        return E.to_rst(value)
+    return value2cell(value)
+
+
+def get_cell_converter(sf):
+    """Return the function to use for converting the values of the
+    given store field.  Store fields for which we cannot know the type
+    of the values use :func:`value2cell`.
+
+    """
+    sf = getattr(sf, 'delegate', sf)  # virtual fields
+    if isinstance(sf, store.BooleanStoreField):
+        return bool2cell
+    if isinstance(sf, (
+            store.DateStoreField, store.DateTimeStoreField,
+            store.TimeStoreField, store.IntegerStoreField,
+            store.AutoStoreField, store.DecimalStoreField)):
+        return None  # no conversion needed
+    if isinstance(sf, store.ForeignKeyStoreField):
+        return object2cell
+    if isinstance(sf, store.IncompleteDateStoreField):
+        return incomplete2cell
+    if isinstance(sf, store.DisplayStoreField):
+        return html2cell
+    return value2cell
+
+
 def ar2workbook(ar, column_names=None):
+    """Return an openpyxl workbook in write-only mode with the rows of
+    the given table request.
+
+    The rows are written one by one while iterating over the data,
+    and database querysets are read in chunks (see
+    :func:`lino.core.utils.iter_chunks`), so that memory usage doesn't
+    depend on the number of rows.  The chunks are taken from a total
+    order of the rows (the primary key is added to the ordering of
+    the table), so no row gets duplicated or lost when the table is
+    ordered by a non-unique field.
+
+    """
     from openpyxl import Workbook
     from openpyxl.styles import Font
+    try:
+        from openpyxl.cell import WriteOnlyCell
+    except ImportError:  # openpyxl < 2.4
+        from openpyxl.writer.write_only import WriteOnlyCell
     # local import to avoid the following traceback:
     # Error in sys.exitfunc:
     # Traceback (most recent call last):
@@ -47,41 +135,36 @@ def ar2workbook(ar, column_names=None):
     # removed `guess_types=True` because it caused trouble in openpyxl
     # 3.4.0 and because I don't know whether it is needed.
     
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = sheet_name(ar.get_title())
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_name(ar.get_title()))
 
     bold_font = Font(name='Calibri', size=11, bold=True, )
 
     fields, headers, widths = ar.get_field_info(column_names)
 
+    header = []
     for c, column in enumerate(fields):
-        sheet.cell(row=1, column=c + 1).value = str(headers[c])
-        sheet.cell(row=1, column=c + 1).font = bold_font
+        cell = WriteOnlyCell(sheet, value=str(headers[c]))
+        cell.font = bold_font
+        header.append(cell)
         # sheet.col(c).width = min(256 * widths[c] / 7, 65535)
         # 256 == 1 character width, max width=65535
-
-    for c, column in enumerate(fields):
-        for r, row in enumerate(ar.data_iterator, start=1):
-            sf = column.field._lino_atomizer
-            value = sf.full_value_from_object(row, ar)
-            if type(value) == bool:
-                value = value and 1 or 0
-            elif isinstance(value, (Duration, Choice)):
-                value = str(value)
-            elif E.iselement(value):
-                value = E.to_rst(value)
-                # dd.logger.info("20160716 %s", value)
-            elif isinstance(value, Promise):
-                value = str(value)
-            elif isinstance(value, IncompleteDate):
-                if value.is_complete():
-                    value = value.as_date()
-                else:
-                    value = str(value)
-            elif isinstance(value, Model):
-                value = str(value)
-            sheet.cell(row=r + 1, column=c + 1).value = value
+    sheet.append(header)
+
+    columns = []
+    for column in fields:
+        sf = column.field._lino_atomizer
+        columns.append((sf, get_cell_converter(sf)))
+
+    for chunk in iter_chunks(ar.data_iterator):
+        for row in chunk:
+            values = []
+            for sf, conv in columns:
+                value = sf.full_value_from_object(row, ar)
+                if conv is not None:
+                    value = conv(value)
+                values.append(value)
+            sheet.append(values)
 
     return workbook
 
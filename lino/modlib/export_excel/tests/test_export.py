@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Tests for :mod:`lino.modlib.export_excel`.  Run them from any Lino
+project::
+
+  $ python manage.py test lino.modlib.export_excel
+
+"""
+
+from __future__ import unicode_literals
+
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from lino.api import rt
+from lino.modlib.export_excel.models import ar2workbook
+from lino.utils.djangotest import RemoteAuthTestCase
+
+
+class ExportTest(RemoteAuthTestCase):
+
+    def test_non_unique_ordering(self):
+        """An export of a table ordered by a non-unique field, read in
+        several chunks, contains every row exactly once.
+
+        Some databases (e.g. SQLite) return the rows of equal sort
+        keys in a stable order anyway, so we also check that every
+        chunk is ordered by the primary key as a tie-breaker.
+
+        """
+        from openpyxl import load_workbook
+        User = settings.SITE.user_model
+        expected = []
+        for i in range(23):
+            # only three distinct values in the sort column
+            obj = self.create_obj(
+                User, username="user{0:02}".format(i),
+                last_name="Name{0}".format(i % 3))
+            expected.append(obj.username)
+
+        ar = rt.models.users.Users.request(order_by=['last_name'])
+        old = settings.SITE.data_chunk_size
+        settings.SITE.data_chunk_size = 5
+        fd, fn = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                ar2workbook(ar, 'username last_name').save(fn)
+        finally:
+            settings.SITE.data_chunk_size = old
+
+        try:
+            sheet = load_workbook(fn, read_only=True).active
+            rows = [[c.value for c in row] for row in sheet.rows][1:]
+        finally:
+            os.remove(fn)
+
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(
+            sorted(username for username, last_name in rows),
+            sorted(expected))
+        last_names = [last_name for username, last_name in rows]
+        self.assertEqual(last_names, sorted(last_names))
+
+        pk = connection.ops.quote_name(User._meta.pk.column)
+        selects = [q['sql'] for q in ctx.captured_queries
+                   if q['sql'].startswith('SELECT')
+                   and User._meta.db_table in q['sql']]
+        self.assertTrue(len(selects) >= 5)
+        for sql in selects:
+            order_by = sql.split('ORDER BY')[-1]
+            self.assertIn(pk, order_by)
@@ -75,6 +75,22 @@ class Plugin(Plugin):
     Default is `False` since currently this is not really useful.
     """
 
+    use_js_chunks = False
+    """Whether to split the :xfile:`lino*.js` files into chunks.
+
+    When this is `True`, the :xfile:`lino*.js` file contains only the
+    main menu, the choicelists and small stubs for the actions of
+    every actor.  The Javascript code of each actor and each form
+    layout is written to a separate file under
+    :file:`media/cache/js/chunks`.  These files are named after a
+    hash of their content so that they can be cached by the browser
+    forever, and they get loaded asynchronously when needed, e.g. when
+    the user opens the window of an actor for the first time.  The
+    action is run as soon as its chunk has been loaded, so the stub
+    of an action returns nothing.
+
+    """
+
     url_prefix = "ext"
 
     media_name = 'ext-3.3.1'
@@ -121,7 +137,8 @@ class Plugin(Plugin):
         kernel.extjs_renderer = self.renderer
 
         # added 20160329
-        for fl in self.renderer.param_panels:
+        for fl in self.renderer.sorted_layouts(
+                self.renderer.param_panels):
             fl.get_layout_handle(self)
 
         # logger.info("20140227 extjs.Plugin.on_ui_init() b")
@@ -15,12 +15,17 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import re
 import cgi
+import hashlib
 import time
 import jinja2
+import multiprocessing
+from collections import OrderedDict
 
 from django.conf import settings
 from django.db import models
+from django.db import connections
 from django.utils import translation
 from django.utils.encoding import force_text
 
@@ -82,6 +87,26 @@ def prepare_label(mi):
     #~ return label
 
 
+# a reference like ``Lino.contacts.Persons.detail`` in generated code
+JS_REFERENCE = re.compile(r"\bLino\.(\w+)\.(\w+)\.?(\w*)")
+
+# the definition of an action in the code generated for an actor
+JS_ACTION_DEFINITION = re.compile(
+    r"^Lino\.(\w+\.\w+\.\w+) = (?:new Lino\.WindowAction\b|function\b)",
+    re.MULTILINE)
+
+
+def build_js_cache_group(job):
+    """Build a group of :xfile:`lino*.js` files.  This is a module-level
+    function so that it can run in a worker process of
+    :meth:`ExtRenderer.build_site_cache`.
+
+    """
+    force, lng, profiles = job
+    return settings.SITE.plugins.extjs.renderer.build_js_cache_group(
+        lng, profiles, force)
+
+
 class ExtRenderer(HtmlRenderer):
     """An HTML renderer that uses the ExtJS Javascript toolkit.
 
@@ -96,6 +121,7 @@ class ExtRenderer(HtmlRenderer):
         for s in 'green blue red yellow'.split():
             self.row_classes_map[s] = 'x-grid3-row-%s' % s
 
+        self._js_fragments = None
         self.prepare_layouts()
 
     def pk2url(self, ar, pk, **kw):
@@ -644,14 +670,93 @@ class ExtRenderer(HtmlRenderer):
             os.path.join(settings.MEDIA_ROOT, 'webdav'))
 
         if force or settings.SITE.build_js_cache_on_startup:
-            count = 0
+            jobs = [(force, lng, profiles)
+                    for lng, profiles in self.get_js_cache_groups()]
+            workers = settings.SITE.build_js_cache_workers
+            if workers and workers > 1 and len(jobs) > 1:
+                # forked processes must not share the database
+                # connections of their parent
+                connections.close_all()
+                pool = multiprocessing.Pool(min(workers, len(jobs)))
+                try:
+                    counts = pool.map(build_js_cache_group, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                counts = [build_js_cache_group(job) for job in jobs]
+            logger.info("%d lino*.js files have been built in %s seconds.",
+                        sum(counts), time.time() - started)
+            files = []
             for lng in settings.SITE.languages:
                 with translation.override(lng.django_code):
                     for profile in UserTypes.objects():
-                        count += jsgen.with_user_profile(
-                            profile, self.build_js_cache, force)
-            logger.info("%d lino*.js files have been built in %s seconds.",
-                        count, time.time() - started)
+                        files.append(os.path.join(*jsgen.with_user_profile(
+                            profile, self.lino_js_parts)))
+            settings.SITE.kernel.write_cache_manifest(*files)
+
+    def get_permission_key(self, profile):
+        """Return a hashable value which is the same for all user profiles
+        having the same view permissions.  The Javascript code
+        rendered for an actor depends only on this key and the
+        current language.
+
+        """
+        hl = profile.hidden_languages
+        if hl is not None:
+            hl = frozenset(hl)
+        return (profile.role.__class__, profile.readonly, hl)
+
+    def get_js_cache_groups(self):
+        """Yield a tuple `(language, profiles)` for every group of user
+        profiles who can share the Javascript fragments of their
+        :xfile:`lino*.js` files.  `language` is a Django language
+        code and `profiles` a list of profile values.
+
+        """
+        groups = OrderedDict()
+        for lng in settings.SITE.languages:
+            for profile in UserTypes.objects():
+                k = (lng.django_code, self.get_permission_key(profile))
+                groups.setdefault(k, []).append(profile.value)
+        for k, profiles in groups.items():
+            yield k[0], profiles
+
+    def build_js_cache_group(self, lng, profiles, force):
+        """Build the :xfile:`lino*.js` files for the given language and
+        user profiles.  The per-actor fragments are rendered only once
+        for all these profiles.  Return the number of files that have
+        been written.
+
+        """
+        count = 0
+        self._js_fragments = dict()
+        try:
+            with translation.override(lng):
+                for value in profiles:
+                    profile = UserTypes.get_by_value(value)
+                    count += jsgen.with_user_profile(
+                        profile, self.build_js_cache, force)
+        finally:
+            self._js_fragments = None
+        return count
+
+    def js_fragment(self, key, func, *args):
+        """Return the lines yielded by `func(*args)` as a single string.
+
+        During :meth:`build_site_cache` the result is shared among all
+        user profiles having the same :meth:`get_permission_key`.
+
+        """
+        if self._js_fragments is None:
+            return ''.join([ln + '\n' for ln in func(*args)])
+        profile = jsgen.get_user_profile()
+        key = (self.get_permission_key(profile),) + key
+        s = self._js_fragments.get(key)
+        if s is None:
+            s = ''.join([ln + '\n' for ln in func(*args)])
+            self._js_fragments[key] = s
+        return s
 
     def build_js_cache(self, force):
         """Build the :xfile:`lino*.js` file for the current user and the
@@ -691,6 +796,7 @@ class ExtRenderer(HtmlRenderer):
         # don't generate JS for abstract actors
         self.actors_list = [a for a in self.actors_list
                             if not a.is_abstract()]
+        self.actors_by_id = {a.actor_id: a for a in self.actors_list}
 
         # Layouts
 
@@ -814,6 +920,28 @@ class ExtRenderer(HtmlRenderer):
 
         assert profile == jsgen.get_user_profile()
 
+        fragments = self.js_actor_fragments(profile, actors_list)
+        if self.plugin.use_js_chunks:
+            self.write_js_chunks(f, fragments)
+        else:
+            for name, s in fragments:
+                f.write(s)
+
+        if profile != jsgen.get_user_profile():
+            logger.warning(
+                "Oops, profile %s != jsgen.get_user_profile() %s",
+                profile, jsgen.get_user_profile())
+
+        return 1
+
+    def js_actor_fragments(self, profile, actors_list):
+        """Yield a tuple `(name, code)` for every form layout and every
+        actor of `actors_list` which is visible to the given profile.
+        `name` is the name of the :meth:`chunk <write_js_chunks>` to
+        which `code` belongs.
+
+        """
+
         def must_render(lh, profile):
             """Return True if the given form layout `fl` is needed for
             profile."""
@@ -827,25 +955,27 @@ class ExtRenderer(HtmlRenderer):
             return False
 
         #~ f.write('\n/* Application FormPanel subclasses */\n')
-        for fl in self.param_panels:
+        for fl in self.sorted_layouts(self.param_panels):
             lh = fl.get_layout_handle(self.plugin)
             if must_render(lh, profile):
-                for ln in self.js_render_ParamsPanelSubclass(lh):
-                    f.write(ln + '\n')
+                yield fl._formpanel_name, self.js_fragment(
+                    ('params', fl),
+                    self.js_render_ParamsPanelSubclass, lh)
 
-        for fl in self.action_param_panels:
+        for fl in self.sorted_layouts(self.action_param_panels):
             lh = fl.get_layout_handle(self.plugin)
             if must_render(lh, profile):
-                for ln in self.js_render_ActionFormPanelSubclass(lh):
-                    f.write(ln + '\n')
+                yield fl._formpanel_name, self.js_fragment(
+                    ('action_params', fl),
+                    self.js_render_ActionFormPanelSubclass, lh)
 
         assert profile == jsgen.get_user_profile()
 
-        for fl in self.form_panels:
+        for fl in self.sorted_layouts(self.form_panels):
             lh = fl.get_layout_handle(self.plugin)
             if must_render(lh, profile):
-                for ln in self.js_render_FormPanelSubclass(lh):
-                    f.write(ln + '\n')
+                yield fl._formpanel_name, self.js_fragment(
+                    ('form', fl), self.js_render_FormPanelSubclass, lh)
 
         actions_written = set()
         for rpt in actors_list:
@@ -854,38 +984,108 @@ class ExtRenderer(HtmlRenderer):
                 if ba.action.parameters:
                     if ba.action not in actions_written:
                         actions_written.add(ba.action)
-                        for ln in self.js_render_window_action(
-                                rh, ba, profile):
-                            f.write(ln + '\n')
+                        yield rpt.actor_id, self.js_fragment(
+                            ('params_window', rpt, ba.action),
+                            self.js_render_window_action, rh, ba, profile)
 
         for rpt in actors_list:
-            rh = rpt.get_handle()
-            if isinstance(rpt, type) and issubclass(rpt, (
-                    tables.AbstractTable, choicelists.ChoiceList)):
-                for ln in self.js_render_GridPanel_class(rh):
-                    f.write(ln + '\n')
+            yield rpt.actor_id, self.js_fragment(
+                ('actor', rpt), self.js_render_actor, rpt, profile)
 
-            for ba in rpt.get_actions():
-                if ba.action.parameters and not ba.action.no_params_window:
-                    pass
-                elif ba.action.opens_a_window:
-                    if isinstance(ba.action, (ShowDetailAction,
-                                              InsertRow)):
-                        for ln in self.js_render_detail_action_FormPanel(
-                                rh, ba):
-                            f.write(ln + '\n')
-                    for ln in self.js_render_window_action(rh, ba, profile):
-                        f.write(ln + '\n')
-                elif ba.action.action_name:
-                    for ln in self.js_render_custom_action(rh, ba):
-                        f.write(ln + '\n')
+    def sorted_layouts(self, layouts):
+        """Return the given set of form layouts sorted by name.  A set
+        has no stable order from one process to another, but the
+        generated code must be the same for unchanged layouts.
 
-        if profile != jsgen.get_user_profile():
-            logger.warning(
-                "Oops, profile %s != jsgen.get_user_profile() %s",
-                profile, jsgen.get_user_profile())
+        """
+        return sorted(layouts, key=lambda fl: fl._formpanel_name)
 
-        return 1
+    def write_js_chunks(self, f, fragments):
+        """Write the given fragments (as yielded by
+        :meth:`js_actor_fragments`) into chunk files and write their
+        manifest and stubs for the actions they define to `f`.  See
+        :attr:`use_js_chunks
+        <lino.modlib.extjs.Plugin.use_js_chunks>`.
+
+        The manifest, :js:attr:`Lino.js_chunks`, maps every chunk name
+        to the URL of its file and to the names of the other chunks
+        it refers to.  Chunks of form layouts must be loaded before
+        those of actors because the latter extend classes defined by
+        the former.
+
+        """
+        chunks = OrderedDict()
+        for name, code in fragments:
+            chunks.setdefault(name, []).append(code)
+
+        manifest = OrderedDict()
+        stubs = []
+        for name, parts in chunks.items():
+            code = ''.join(parts)
+            if not code:
+                continue
+            deps = set()
+            for a, b, c in JS_REFERENCE.findall(code):
+                ref = '.'.join((a, b, c))
+                if ref not in chunks:
+                    ref = '.'.join((a, b))
+                if ref != name and ref in chunks:
+                    deps.add(ref)
+            is_layout = name not in self.actors_by_id
+            if not is_layout:
+                for action_name in JS_ACTION_DEFINITION.findall(code):
+                    stubs.append(
+                        "Lino.%s = Lino.lazy_action(%s, %s);\n" % (
+                            action_name, py2js(name), py2js(action_name)))
+            manifest[name] = dict(
+                url=self.write_js_chunk(name, code),
+                layout=is_layout, deps=sorted(deps))
+
+        f.write("Lino.js_chunks = %s;\n" % py2js(manifest))
+        for ln in stubs:
+            f.write(ln)
+
+    def write_js_chunk(self, name, code):
+        """Write the given Javascript `code` to a chunk file whose name
+        contains a hash of the content.  Return the URL of that file.
+
+        """
+        code = jscompress(code)
+        digest = hashlib.md5(code.encode('utf-8')).hexdigest()[:12]
+        filename = "{0}.{1}.js".format(name, digest)
+        fn = os.path.join(
+            settings.MEDIA_ROOT, 'cache', 'js', 'chunks', filename)
+        if not os.path.exists(fn):
+            settings.SITE.makedirs_if_missing(os.path.dirname(fn))
+            settings.SITE.kernel.write_cache_file(fn, code, hashed=False)
+        return settings.SITE.build_media_url(
+            'cache', 'js', 'chunks', filename)
+
+    def js_render_actor(self, rpt, profile):
+        """Yield the Javascript code for the grid panel class and the
+        window actions of the given actor.
+
+        """
+        rh = rpt.get_handle()
+        if isinstance(rpt, type) and issubclass(rpt, (
+                tables.AbstractTable, choicelists.ChoiceList)):
+            for ln in self.js_render_GridPanel_class(rh):
+                yield ln
+
+        for ba in rpt.get_actions():
+            if ba.action.parameters and not ba.action.no_params_window:
+                pass
+            elif ba.action.opens_a_window:
+                if isinstance(ba.action, (ShowDetailAction,
+                                          InsertRow)):
+                    for ln in self.js_render_detail_action_FormPanel(
+                            rh, ba):
+                        yield ln
+                for ln in self.js_render_window_action(rh, ba, profile):
+                    yield ln
+            elif ba.action.action_name:
+                for ln in self.js_render_custom_action(rh, ba):
+                    yield ln
 
     def lino_js_parts(self):
         profile = jsgen.get_user_profile()
@@ -894,6 +1094,17 @@ class ExtRenderer(HtmlRenderer):
                 'lino_' + profile.value + '_'
                 + translation.get_language() + '.js')
 
+    def hashed_lino_js_parts(self):
+        """Same as :meth:`lino_js_parts`, but the last part is the name of
+        the hashed copy of the file (see
+        :meth:`lino.core.kernel.Kernel.get_hashed_name`).  This is
+        used in :xfile:`extjs/index.html`.
+
+        """
+        parts = self.lino_js_parts()
+        name = settings.SITE.kernel.get_hashed_name(os.path.join(*parts))
+        return parts[:-1] + (name,)
+
     def linolib_template(self):
         env = jinja2.Environment(loader=jinja2.FileSystemLoader(
             os.path.dirname(__file__)))
@@ -1449,8 +1660,10 @@ class ExtRenderer(HtmlRenderer):
         extjs = settings.SITE.plugins.extjs
 
         def fn():
-            yield "// lino.js --- generated %s by %s for %s." % (
-                time.ctime(), cgi.escape(settings.SITE.site_version()),
+            # no timestamp here because an unchanged file must have
+            # the same content (see Kernel.make_cache_file)
+            yield "// lino.js --- generated by %s for %s." % (
+                cgi.escape(settings.SITE.site_version()),
                 jsgen.get_user_profile())
             # lino.__version__)
             #~ // $site.title ($lino.welcome_text())
@@ -867,6 +867,90 @@ Lino.WindowAction = Ext.extend(Lino.WindowAction,{
   
 });
 
+{% if extjs.use_js_chunks %}
+Lino.js_chunks_loaded = {};
+
+Lino.load_js_chunk = function(name, callback) {
+  // Asynchronously load the specified chunk of Javascript code and
+  // all chunks it refers to, evaluate them and then call the given
+  // callback.  See lino.modlib.extjs.Plugin.use_js_chunks
+  var todo = [], seen = {};
+  var collect = function(n) {
+    if (seen[n] || Lino.js_chunks_loaded[n]) return;
+    seen[n] = true;
+    var chunk = Lino.js_chunks[n];
+    if (!chunk) return;
+    todo.push(n);
+    Ext.each(chunk.deps, function(d) { collect(d); });
+  };
+  collect(name);
+  if (todo.length == 0) {
+    callback();
+    return;
+  }
+  // form layouts first because actors extend their classes
+  todo.sort(function(a, b) {
+    return Lino.js_chunks[b].layout - Lino.js_chunks[a].layout;
+  });
+  var mask = Lino.viewport && Lino.viewport.loadMask;
+  if (mask) mask.show();
+  var texts = {}, remaining = todo.length, failed = false;
+  var done = function() {
+    if (mask) mask.hide();
+    Ext.each(todo, function(n) {
+      // another request may have loaded it in the meantime
+      if (Lino.js_chunks_loaded[n]) return;
+      Lino.js_chunks_loaded[n] = true;
+      // indirect eval to run the code in the global scope
+      (0, eval)(texts[n]);
+    });
+    callback();
+  };
+  Ext.each(todo, function(n) {
+    var req = new XMLHttpRequest();
+    req.open('GET', Lino.js_chunks[n].url, true);
+    req.onreadystatechange = function() {
+      if (req.readyState != 4 || failed) return;
+      if (req.status != 200) {
+        failed = true;
+        if (mask) mask.hide();
+        Lino.alert("Could not load " + Lino.js_chunks[n].url);
+        return;
+      }
+      texts[n] = req.responseText;
+      remaining -= 1;
+      if (remaining == 0) done();
+    };
+    req.send(null);
+  });
+};
+
+Lino.lazy_action = function(chunk_name, action_name) {
+  // Return a stub for an action whose definition is in a chunk that
+  // has not yet been loaded.  Calling the stub loads that chunk and
+  // then calls the real action.
+  var resolve = function() {
+    var action = eval("Lino." + action_name);
+    if (action === stub) throw "No definition for " + action_name;
+    return action;
+  };
+  var stub = function() {
+    var scope = this, args = arguments;
+    Lino.load_js_chunk(chunk_name, function() {
+      resolve().apply(scope, args);
+    });
+  };
+  stub.run = function() {
+    var args = arguments;
+    Lino.load_js_chunk(chunk_name, function() {
+      var action = resolve();
+      action.run.apply(action, args);
+    });
+  };
+  return stub;
+};
+{% endif %}
+
 
 Lino.PanelMixin = {
   get_containing_window : function (){
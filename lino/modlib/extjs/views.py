@@ -34,8 +34,11 @@ from django import http
 from django.db import models
 from django.conf import settings
 from django.views.generic import View
+from django.core.cache import cache
 import json
+import hashlib
 from django.utils.translation import ugettext as _
+from django.utils.translation import get_language
 from django.utils.encoding import force_text
 
 from lino.api import dd
@@ -51,6 +54,8 @@ from lino.core import auth
 from lino.core import actions
 
 from lino.core.views import requested_actor, action_request
+from lino.core.utils import iter_chunks
+from lino.core.tableversions import get_model_version
 from lino.core.views import json_response, json_response_kw
 
 from lino.core import constants
@@ -267,27 +272,93 @@ def choices_for_field(request, holder, field):
     return (qs, row2dict)
 
 
-def choices_response(actor, request, qs, row2dict, emptyValue):
-    quick_search = request.GET.get(constants.URL_PARAM_FILTER, None)
-    if quick_search and isinstance(qs, models.QuerySet):
-        qs = qs.filter(qs.model.quick_search_filter(quick_search))
-    count = len(qs)
+CHOICES_KEY_PARAMS = (
+    constants.URL_PARAM_FILTER, constants.URL_PARAM_START,
+    constants.URL_PARAM_LIMIT, constants.URL_PARAM_MASTER_PK,
+    constants.URL_PARAM_MASTER_TYPE, constants.URL_PARAM_PARAM_VALUES,
+    constants.URL_PARAM_KNOWN_VALUES, constants.URL_PARAM_SUBST_USER)
+"""The URL parameters which can influence the choices of a combo box
+(besides the context parameters of its chooser)."""
 
-    offset = request.GET.get(constants.URL_PARAM_START, None)
-    if offset:
-        qs = qs[int(offset):]
-        #~ kw.update(offset=int(offset))
-    limit = request.GET.get(constants.URL_PARAM_LIMIT, None)
-    if limit:
-        #~ kw.update(limit=int(limit))
-        qs = qs[:int(limit)]
 
-    rows = [row2dict(row, {}) for row in qs]
+def get_context_params(holder, field):
+    """Return the names of the context parameters of the chooser for
+    the given field, or an empty tuple if it has no chooser.
+
+    """
+    chooser = holder.get_chooser_for_field(field.name)
+    if chooser is None:
+        return ()
+    return chooser.context_params
+
+
+def get_choices_cache_key(request, model, context_params=()):
+    """Return the key to use for caching the choices response for the
+    given request, or `None` if these choices are not to be cached.
+
+    The key contains only the URL parameters which can influence the
+    choices (:data:`CHOICES_KEY_PARAMS` and the given
+    `context_params`), not e.g. the `_dc` parameter which ExtJS adds
+    to every request in order to disable the browser cache.
 
-    if quick_search and isinstance(qs, list):
-        txt = quick_search.lower()
-        rows = [row for row in rows
-                if txt in row[constants.CHOICES_TEXT_FIELD].lower()]
+    """
+    if not getattr(model, 'choices_cache_timeout', None):
+        return None
+    user = getattr(request, 'user', None)
+    params = [(k, request.GET.getlist(k))
+              for k in CHOICES_KEY_PARAMS + tuple(context_params)]
+    data = [request.path, params,
+            getattr(user, 'pk', None), get_language(),
+            get_model_version(model)]
+    return 'lino-choices-' + hashlib.md5(
+        repr(data).encode('utf-8')).hexdigest()
+
+
+def choices_response(actor, request, qs, row2dict, emptyValue,
+                     context_params=()):
+    """Return the JSON response with the choices of a combo box.
+    `context_params` are the names of the context parameters of its
+    chooser (if any).
+
+    When the choices are a queryset, then quick search, counting and
+    paging are done in the database.  Otherwise all choices are
+    converted and filtered in Python before counting and paging.
+
+    """
+    quick_search = request.GET.get(constants.URL_PARAM_FILTER, None)
+    offset = request.GET.get(constants.URL_PARAM_START, None)
+    limit = request.GET.get(constants.URL_PARAM_LIMIT, None)
+    if isinstance(qs, models.QuerySet):
+        cache_key = get_choices_cache_key(
+            request, qs.model, context_params)
+        cached = None
+        if cache_key is not None:
+            cached = cache.get(cache_key)
+        if cached is None:
+            if quick_search:
+                qs = qs.filter(qs.model.quick_search_filter(quick_search))
+            count = qs.count()
+            if offset:
+                qs = qs[int(offset):]
+            if limit:
+                qs = qs[:int(limit)]
+            rows = [row2dict(row, {}) for row in qs]
+            if cache_key is not None:
+                cache.set(cache_key, (count, rows),
+                          qs.model.choices_cache_timeout)
+        else:
+            count, rows = cached
+    else:
+        rows = [row2dict(row, {}) for row in qs]
+        if quick_search:
+            txt = quick_search.lower()
+            rows = [row for row in rows
+                    if txt in str(row[constants.CHOICES_TEXT_FIELD]).lower()]
+        count = len(rows)
+        if offset:
+            rows = rows[int(offset):]
+        if limit:
+            rows = rows[:int(limit)]
 
     if emptyValue and not quick_search:
         empty = dict()
@@ -312,7 +383,9 @@ class ActionParamChoices(View):
             emptyValue = '<br/>'
         else:
             emptyValue = None
-        return choices_response(actor, request, qs, row2dict, emptyValue)
+        return choices_response(
+            actor, request, qs, row2dict, emptyValue,
+            get_context_params(ba.action, field))
 
 
 class Choices(View):
@@ -329,6 +402,7 @@ class Choices(View):
         """
         rpt = requested_actor(app_label, rptname)
         emptyValue = None
+        context_params = ()
         if fldname is None:
             ar = rpt.request(request=request)  # ,rpt.default_action)
             #~ rh = rpt.get_handle(self)
@@ -355,8 +429,10 @@ class Choices(View):
                 # logger.info("views.Choices: %r is blank",field)
                 emptyValue = '<br/>'
             qs, row2dict = choices_for_field(request, rpt, field)
+            context_params = get_context_params(rpt, field)
 
-        return choices_response(rpt, request, qs, row2dict, emptyValue)
+        return choices_response(
+            rpt, request, qs, row2dict, emptyValue, context_params)
 
 
 class Restful(View):
@@ -530,6 +606,28 @@ class ApiElement(View):
         return delete_element(ar, elem)
 
 
+def csv_stream(ar):
+    """Generate the lines of a CSV rendering of the given table request.
+
+    The data rows are fetched in chunks of
+    :attr:`lino.core.site.Site.data_chunk_size` rows so that even huge
+    tables can be streamed with constant memory usage.
+
+    """
+    store = ar.ah.store
+    w = ucsv.UnicodeWriter(ucsv.EchoBuffer(), **settings.SITE.csv_params)
+    yield w.writerow(store.column_names())
+    if True:  # 20130418 : also column headers, not only internal names
+        column_names = None
+        fields, headers, cellwidths = ar.get_field_info(column_names)
+        yield w.writerow(headers)
+
+    for chunk in iter_chunks(ar.data_iterator):
+        yield b''.join([
+            w.writerow([str(v) for v in store.row2list(ar, row)])
+            for row in chunk])
+
+
 class ApiList(View):
 
     def post(self, request, app_label=None, actor=None):
@@ -591,8 +689,8 @@ class ApiList(View):
         if fmt == 'csv':
             #~ response = HttpResponse(mimetype='text/csv')
             charset = settings.SITE.csv_params.get('encoding', 'utf-8')
-            response = http.HttpResponse(
-                content_type='text/csv;charset="%s"' % charset)
+            response = http.StreamingHttpResponse(
+                csv_stream(ar), content_type='text/csv;charset="%s"' % charset)
             if False:
                 response['Content-Disposition'] = \
                     'attachment; filename="%s.csv"' % ar.actor
@@ -602,15 +700,6 @@ class ApiList(View):
                     'inline; filename="%s.csv"' % ar.actor
 
             #~ response['Content-Disposition'] = 'attachment; filename=%s.csv' % ar.get_base_filename()
-            w = ucsv.UnicodeWriter(response, **settings.SITE.csv_params)
-            w.writerow(ar.ah.store.column_names())
-            if True:  # 20130418 : also column headers, not only internal names
-                column_names = None
-                fields, headers, cellwidths = ar.get_field_info(column_names)
-                w.writerow(headers)
-
-            for row in ar.data_iterator:
-                w.writerow([str(v) for v in rh.store.row2list(ar, row)])
             return response
 
         if fmt == constants.URL_FORMAT_PRINTER:
@@ -31,6 +31,17 @@ Options:
   partial snapshot of a database which is not (fully) synced with the
   application code.
 
+- `--parallel N` : Write the files of the different tables in `N`
+  worker processes.
+
+- `--format col` : Write the rows of every table into compressed
+  binary column files (see :mod:`lino.utils.coldump`) instead of
+  Python code.  Such a dump is faster to write and to restore, and
+  smaller.  The :xfile:`restore.py` file is the same.
+
+- `--no-compress` : Do not compress the column files (so that they
+  get memory-mapped when restoring).
+
 
 The directory will contain a file :xfile:`restore.py` and a lot of
 other `.py` files (currently one for every model) which are being
@@ -40,6 +51,10 @@ dump to your database, simply run the `restore.py` script using the
 
   $ python manage.py run mydump/restore.py
 
+Add the `--quick` option to :xfile:`restore.py` when you trust the
+dump: this skips validation and inserts the rows in bulk (see
+:class:`lino.utils.dpy.DpyLoader`).
+
 Or, if you don't use per-project :xfile:`manage.py` files::
 
   $ set DJANGO_SETTINGS_MODULE=myproject
@@ -69,12 +84,15 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import json
+import time
+import multiprocessing
 from decimal import Decimal
 import argparse
 
 from clint.textui import progress
 
-from django.db import models
+from django.db import models, connections
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.db.utils import DatabaseError
@@ -82,9 +100,12 @@ from django.utils.timezone import make_naive, is_aware
 
 from lino.utils import puts
 from lino.core.utils import sorted_models_list, full_model_name
+from lino.core.utils import resolve_model
+from lino.core.utils import iter_chunks
 from lino.core.choicelists import ChoiceListField
 
 from lino.utils.mldbc.fields import BabelCharField, BabelTextField
+from lino.utils.coldump import TableWriter
 
 
 def is_pointer_to_contenttype(f):
@@ -95,6 +116,24 @@ def is_pointer_to_contenttype(f):
     return f.rel.model is settings.SITE.modules.contenttypes.ContentType
 
 
+def write_table_job(job, cmd=None):
+    """Write the dump file of one model.  This is a module-level
+    function so that it can run in a worker process of
+    :meth:`Command.write_files`.
+
+    """
+    output_dir, options, name = job
+    if cmd is None:
+        cmd = Command()
+        cmd.output_dir = output_dir
+        cmd.options = options
+        cmd._content_type_names = None
+    model = resolve_model(name)
+    started = time.time()
+    count, error = cmd.write_table(model)
+    return model._meta.db_table, count, time.time() - started, error
+
+
 class Command(BaseCommand):
     # tmpl_dir = ''
     # args = "output_dir"
@@ -112,6 +151,16 @@ class Command(BaseCommand):
         parser.add_argument('-o', '--overwrite', action='store_true',
                             dest='overwrite', default=False,
                             help='Overwrite existing files.'),
+        parser.add_argument('--parallel', type=int,
+                            dest='parallel', default=1,
+                            help='Number of worker processes.')
+        parser.add_argument('--format', dest='format', default='py',
+                            choices=['py', 'col'],
+                            help='Write the rows as Python code (py) '
+                            'or as binary column files (col).')
+        parser.add_argument('--no-compress', action='store_false',
+                            dest='compress', default=True,
+                            help='Do not compress the column files.')
         #~ make_option('--quick', action='store_true',
         #~ dest='quick', default=False,
         #~ help='Do not call full_clean() method on restored instances.'),
@@ -150,7 +199,7 @@ from django.utils.timezone import make_aware
 from lino.utils.dpy import create_mti_child
 from lino.utils.dpy import DpyLoader
 from lino.core.utils import resolve_model
-
+%s
 if settings.USE_TZ:
     def dt(*args):
         return make_aware(datetime(*args))
@@ -164,7 +213,8 @@ def new_content_type_id(m):
     if ct is None: return None
     return ct.pk
     
-''')
+''' % ('from lino.utils.coldump import load_table\n'
+       if self.options['format'] == 'col' else ''))
         s = ','.join([
             '%s=values[%d]' % (lng.name, lng.index)
             for lng in settings.SITE.languages])
@@ -261,7 +311,7 @@ def bv2kw(fieldname, values):
         self.stream.write("""
 
 def main(args):
-    loader = DpyLoader(globals())
+    loader = DpyLoader(globals(), quick=args.quick)
     from django.core.management import call_command
     call_command('initdb', interactive=args.interactive)
     os.chdir(os.path.dirname(__file__))
@@ -269,50 +319,42 @@ def main(args):
 
 """)
 
-        for model in progress.bar(self.models):
-            filename = '%s.py' % model._meta.db_table
-            filename = os.path.join(self.output_dir, filename)
-            # puts("Writing {0}...".format(filename))
-            # stream = file(filename, 'wt')
-            stream = open(filename, 'wt')
-            stream.write('# -*- coding: UTF-8 -*-\n')
-            qs = model.objects.all()
+        options = dict([(k, self.options[k])
+                        for k in ('tolerate', 'format', 'compress')])
+        jobs = [(self.output_dir, options, full_model_name(model))
+                for model in self.models]
+        workers = self.options['parallel']
+        if workers > 1 and len(jobs) > 1:
+            # forked processes must not share the database connections
+            # of their parent
+            connections.close_all()
+            pool = multiprocessing.Pool(min(workers, len(jobs)))
             try:
-                stream.write(
-                    'logger.info("Loading %d objects to table %s...")\n' % (
-                        qs.count(), model._meta.db_table))
-
-                fields = [f for f in model._meta.get_fields()
-                          if f.concrete and f.model is model]
-                fields = [
-                    f for f in fields
-                    if not getattr(f, '_lino_babel_field', False)]
-                stream.write(
-                    "# fields: %s\n" % ', '.join(
-                        [f.name for f in fields]))
-                for obj in qs:
-                    self.count_objects += 1
-                    #~ used_models.add(model)
-                    stream.write('loader.save(create_%s(%s))\n' % (
-                        obj._meta.db_table,
-                        ','.join([self.value2string(obj, f) for f in fields])))
-                stream.write('\n')
-                stream.write('loader.flush_deferred_objects()\n')
-            except DatabaseError as e:
+                results = list(progress.bar(
+                    pool.imap_unordered(write_table_job, jobs),
+                    expected_size=len(jobs)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [write_table_job(job, self)
+                       for job in progress.bar(jobs)]
+        for db_table, count, seconds, error in sorted(results):
+            self.count_objects += count
+            if error:
                 self.database_errors += 1
-                if not self.options['tolerate']:
-                    raise
-                stream.write('\n')
-                logger.warning("Tolerating database error %s in %s",
-                               e, model._meta.db_table)
-                msg = ("The data of this table has not been dumped"
-                       "because an error {0} occured.").format(e)
-                stream.write('raise Exception("{0}")\n'.format(msg))
-                
-            stream.close()
-
-            #~ self.stream.write('\nfilename = os.path.join(os.path.dirname(__file__),"%s.py")\n' % )
-            self.stream.write('    execfile("%s.py")\n' % model._meta.db_table)
+            logger.info("Wrote %d rows of %s in %.1f seconds (%d rows/s)",
+                        count, db_table, seconds, count / (seconds or 1))
+
+        for model in self.models:
+            if self.options['format'] == 'col':
+                self.stream.write('    load_table(loader, globals(), "%s")\n'
+                                  % model._meta.db_table)
+            else:
+                self.stream.write('    execfile("%s.py")\n'
+                                  % model._meta.db_table)
+        if self.options['format'] == 'col':
+            self.write_manifest(results)
 
         self.stream.write(
             '    loader.finalize()\n')
@@ -325,6 +367,9 @@ if __name__ == '__main__':
     parser.add_argument('--noinput', dest='interactive',
         action='store_false', default=True,
         help="Don't ask for confirmation before flushing the database.")
+    parser.add_argument('--quick', dest='quick',
+        action='store_true', default=False,
+        help='Trust the dump: no validation, bulk inserts.')
 
     args = parser.parse_args()
     main(args)
@@ -332,6 +377,163 @@ if __name__ == '__main__':
         #~ self.stream.write('\nsettings.SITE.load_from_file(globals())\n')
         self.stream.close()
 
+    def get_dumped_fields(self, model):
+        fields = [f for f in model._meta.get_fields()
+                  if f.concrete and f.model is model]
+        return [f for f in fields
+                if not getattr(f, '_lino_babel_field', False)]
+
+    def write_table(self, model):
+        """Write the file(s) with the rows of the given model.  Return the
+        number of rows and the text of a tolerated database error (or
+        `None`).
+
+        """
+        if self.options['format'] == 'col':
+            return self.write_table_columns(model)
+        filename = '%s.py' % model._meta.db_table
+        filename = os.path.join(self.output_dir, filename)
+        count = 0
+        error = None
+        stream = open(filename, 'wt')
+        stream.write('# -*- coding: UTF-8 -*-\n')
+        qs = model.objects.all()
+        try:
+            stream.write(
+                'logger.info("Loading %d objects to table %s...")\n' % (
+                    qs.count(), model._meta.db_table))
+
+            fields = self.get_dumped_fields(model)
+            stream.write(
+                "# fields: %s\n" % ', '.join(
+                    [f.name for f in fields]))
+            for batch in iter_chunks(qs.order_by('pk')):
+                for obj in batch:
+                    stream.write('loader.save(create_%s(%s))\n' % (
+                        obj._meta.db_table,
+                        ','.join([self.value2string(obj, f)
+                                  for f in fields])))
+                count += len(batch)
+            stream.write('\n')
+            stream.write('loader.flush_deferred_objects()\n')
+        except DatabaseError as e:
+            if not self.options['tolerate']:
+                raise
+            error = str(e)
+            stream.write('\n')
+            logger.warning("Tolerating database error %s in %s",
+                           e, model._meta.db_table)
+            msg = ("The data of this table has not been dumped"
+                   "because an error {0} occured.").format(e)
+            stream.write('raise Exception("{0}")\n'.format(msg))
+
+        stream.close()
+        return count, error
+
+    def write_table_columns(self, model):
+        """Write the column files (see :mod:`lino.utils.coldump`) with the
+        rows of the given model.
+
+        """
+        fields = self.get_dumped_fields(model)
+        columns = [(f.attname, self.get_column_type(f)) for f in fields]
+        dirname = os.path.join(self.output_dir, model._meta.db_table)
+        writer = TableWriter(dirname, columns, self.options['compress'])
+        error = None
+        try:
+            for batch in iter_chunks(model.objects.order_by('pk')):
+                for obj in batch:
+                    writer.append([
+                        self.value2column(obj, f, t)
+                        for f, (name, t) in zip(fields, columns)])
+        except DatabaseError as e:
+            if not self.options['tolerate']:
+                raise
+            error = str(e)
+            logger.warning("Tolerating database error %s in %s",
+                           e, model._meta.db_table)
+        writer.close(model=full_model_name(model), error=error)
+        return writer.count, error
+
+    def get_column_type(self, field):
+        """Return the type of the column used for the given field in a
+        column dump.  Each type corresponds to one way of writing a
+        value in :meth:`value2column`.
+
+        """
+        if isinstance(field, (BabelCharField, BabelTextField)):
+            return 'json'
+        if isinstance(field, models.DateTimeField):
+            return 'datetime'
+        if isinstance(field, models.TimeField):
+            return 'time'
+        if is_pointer_to_contenttype(field):
+            return 'model'
+        if isinstance(field, models.DateField):
+            return 'date'
+        if isinstance(field, (models.FloatField, models.DecimalField)):
+            return 'decimal'
+        if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+            return 'bool'
+        # a pointer to an MTI child points to the parent link of that
+        # child, which in turn points to the parent
+        while isinstance(field, models.ForeignKey):
+            field = field.rel.get_related_field()
+        if isinstance(field, (models.AutoField, models.IntegerField)):
+            return 'int'
+        return 'text'
+
+    def value2column(self, obj, field, type):
+        """Return the value of the given field of `obj` as needed by the
+        column writer of the given type.
+
+        """
+        if type == 'json':
+            return settings.SITE.field2args(obj, field.name)
+        value = field.value_from_object(obj)
+        if value is None:
+            return None
+        if type == 'datetime':
+            if is_aware(value):
+                return make_naive(value)
+            return value
+        if type == 'model':
+            return self.get_content_type_names()[value]
+        if type == 'decimal':
+            return str(value)
+        if type == 'text':
+            return field.value_to_string(obj)
+        return value
+
+    def write_manifest(self, results):
+        """Write the :file:`manifest.json` of a column dump."""
+        rows = dict([(r[0], r[1]) for r in results])
+        data = dict(
+            source_version=settings.SITE.version,
+            settings_module=settings.SETTINGS_MODULE,
+            time_zone=settings.TIME_ZONE,
+            tables=[[m._meta.db_table, rows[m._meta.db_table]]
+                    for m in self.models])
+        fn = os.path.join(self.output_dir, 'manifest.json')
+        with open(fn, 'wt') as f:
+            f.write(str(json.dumps(data, indent=1)))
+
+    def get_content_type_names(self):
+        """Return a dict which maps the primary key of every content type
+        to the name used for its model in :xfile:`restore.py`.
+
+        """
+        if self._content_type_names is None:
+            ContentType = settings.SITE.modules.contenttypes.ContentType
+            self._content_type_names = d = dict()
+            for ct in ContentType.objects.all():
+                m = ct.model_class()
+                if m is None:
+                    d[ct.pk] = 'None'
+                else:
+                    d[ct.pk] = full_model_name(m, '_')
+        return self._content_type_names
+
     def sort_models(self, unsorted):
         sorted = []
         hope = True
@@ -413,9 +615,7 @@ if __name__ == '__main__':
             d = value
             return 'time(%d,%d,%d)' % (d.hour, d.minute, d.second)
         if is_pointer_to_contenttype(field):
-            ContentType = settings.SITE.modules.contenttypes.ContentType
-            ct = ContentType.objects.get(pk=value)
-            return full_model_name(ct.model_class(), '_')
+            return self.get_content_type_names()[value]
             #~ return "'"+full_model_name(ct.model_class())+"'"
             #~ return repr(tuple(value.app_label,value.model))
         if isinstance(field, models.DateField):
@@ -441,6 +641,7 @@ if __name__ == '__main__':
         self.main_file = os.path.join(self.output_dir, 'restore.py')
         self.count_objects = 0
         self.database_errors = 0
+        self._content_type_names = None
         if os.path.exists(self.output_dir):
             if options['overwrite']:
                 pass
@@ -18,11 +18,18 @@ package which you must install manually::
 
   $ pip install schedule
 
+Every run of a job is executed in a separate worker process (see
+:class:`JobRunner`) so that a slow daily job does not block the jobs
+which run every few seconds.
+
 """
 
 from __future__ import print_function
 
 import time
+import datetime
+import multiprocessing
+
 try:
     import schedule
 except ImportError:
@@ -37,10 +44,131 @@ except ImportError:
 # logging.getLogger('schedule').setLevel(logging.WARNING)
 
 from django.core.management.base import BaseCommand
+from django.db import connections
 # import lino
 from lino.api import dd
 
 
+def run_job(job_func):
+    """The target of the worker process which runs a job."""
+    try:
+        job_func()
+    except Exception as e:
+        dd.logger.exception(e)
+        raise
+
+
+class JobStats(object):
+    """Metrics about the runs of a scheduled job."""
+    runs = 0
+    failures = 0
+    timeouts = 0
+    skipped = 0
+    last_start = None
+    last_duration = None
+    max_duration = 0
+    total_duration = 0
+
+    def __str__(self):
+        s = "{0} runs".format(self.runs)
+        if self.runs:
+            s += ", last {0:.1f}s, max {1:.1f}s, avg {2:.1f}s".format(
+                self.last_duration, self.max_duration,
+                self.total_duration / self.runs)
+        s += ", {0} failures, {1} timeouts, {2} skipped".format(
+            self.failures, self.timeouts, self.skipped)
+        return s
+
+
+class JobRunner(object):
+    """Runs the pending jobs of the `schedule` module, each of them in
+    a separate worker process.
+
+    At most `max_workers` jobs are running at the same time.  A job
+    is never started while a previous run of the same job is still
+    running (that run is skipped).  A job whose run takes longer than
+    its `timeout` (see :func:`lino.api.dd.schedule_often`), or the
+    default `timeout` of the runner, gets terminated.
+
+    Note that worker processes are forked from the main process, so
+    this works only on platforms which support `fork()`.
+
+    """
+    def __init__(self, max_workers=4, timeout=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.running = dict()  # job -> worker process
+        self.stats = dict()  # job -> JobStats
+
+    def get_stats(self, job):
+        st = self.stats.get(job)
+        if st is None:
+            st = self.stats[job] = JobStats()
+        return st
+
+    def get_timeout(self, job):
+        return getattr(job, 'timeout', None) or self.timeout
+
+    def run_pending(self):
+        self.reap()
+        for job in sorted(schedule.jobs):
+            if not job.should_run:
+                continue
+            if job in self.running:
+                self.get_stats(job).skipped += 1
+                dd.logger.warning(
+                    "Skipped %s because it is still running.", job)
+                job._schedule_next_run()
+                continue
+            if len(self.running) >= self.max_workers:
+                # try again when a worker is free
+                break
+            self.start(job)
+
+    def start(self, job):
+        dd.logger.debug("Start %s", job)
+        # The worker must not inherit our database connections.
+        connections.close_all()
+        p = multiprocessing.Process(target=run_job, args=(job.job_func,))
+        p.daemon = True
+        p.start()
+        self.running[job] = p
+        self.get_stats(job).last_start = time.time()
+        job.last_run = datetime.datetime.now()
+        job._schedule_next_run()
+
+    def reap(self):
+        now = time.time()
+        for job, p in list(self.running.items()):
+            st = self.get_stats(job)
+            timed_out = False
+            if p.is_alive():
+                timeout = self.get_timeout(job)
+                if not timeout or now - st.last_start < timeout:
+                    continue
+                p.terminate()
+                timed_out = True
+                st.timeouts += 1
+                dd.logger.warning(
+                    "Terminated %s after %d seconds.", job, timeout)
+            p.join()
+            del self.running[job]
+            duration = now - st.last_start
+            st.runs += 1
+            st.last_duration = duration
+            st.total_duration += duration
+            st.max_duration = max(st.max_duration, duration)
+            if p.exitcode and not timed_out:
+                st.failures += 1
+            dd.logger.debug(
+                "Finished %s in %.1f seconds (exit code %s)",
+                job, duration, p.exitcode)
+
+    def log_stats(self):
+        for job in schedule.jobs:
+            dd.logger.info("%s : %s", job, self.get_stats(job))
+
+
 class Command(BaseCommand):
 
     def add_arguments(self, parser):
@@ -49,6 +177,18 @@ class Command(BaseCommand):
             '--list', '-l', action='store_true',
             dest='list_jobs', default=False,
             help="Just list the jobs, don't run them.")
+        parser.add_argument(
+            '--workers', '-w', action='store', type=int,
+            dest='workers', default=4,
+            help="Maximum number of jobs to run at the same time.")
+        parser.add_argument(
+            '--timeout', '-t', action='store', type=int,
+            dest='timeout', default=None,
+            help="Default maximum number of seconds for a job to run.")
+        parser.add_argument(
+            '--stats-every', action='store', type=int,
+            dest='stats_every', default=3600,
+            help="Log the job metrics every this number of seconds.")
 
     def handle(self, *args, **options):
         # lino.startup()
@@ -64,7 +204,15 @@ class Command(BaseCommand):
             dd.logger.info("[%d] %s", i, job)
         if options['list_jobs']:
             return
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-
+        runner = JobRunner(options['workers'], options['timeout'])
+        stats_every = options['stats_every']
+        last_stats = time.time()
+        try:
+            while True:
+                runner.run_pending()
+                time.sleep(1)
+                if stats_every and time.time() - last_stats > stats_every:
+                    runner.log_stats()
+                    last_stats = time.time()
+        finally:
+            runner.log_stats()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Tests for :manage:`dump2py` and the :xfile:`restore.py` of a
+dump.  Run them from any Lino project::
+
+  $ python manage.py test lino.modlib.lino_startup
+
+"""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import argparse
+import datetime
+import runpy
+import sqlite3
+from unittest import skipIf, TestCase
+from past.builtins import execfile
+
+import django
+from django.apps.registry import Apps
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, models, IntegrityError
+from django.test import TransactionTestCase
+
+from lino.api import rt
+from lino.core.utils import sorted_models_list
+from lino.utils.dpy import DpyLoader
+from lino.modlib.lino_startup.management.commands.dump2py import Command
+from lino.utils.coldump import ColumnWriter, ColumnReader
+from lino.utils.test import CommonTestCase
+
+
+def get_dumped_models():
+    lst = []
+    for m in sorted_models_list():
+        if m._meta.app_label in ('contenttypes', 'sessions'):
+            continue
+        lst.append(m)
+    return lst
+
+
+def get_rows(models):
+    """Return a dict with the content of the tables of the given models.
+    Datetime values are rounded to seconds because dumps don't store
+    microseconds.
+
+    """
+    data = dict()
+    for m in models:
+        fields = [f.attname for f in m._meta.concrete_fields]
+        rows = []
+        for row in m.objects.order_by('pk').values_list(*fields):
+            rows.append(tuple([
+                v.replace(microsecond=0)
+                if isinstance(v, datetime.datetime) else v
+                for v in row]))
+        data[m._meta.db_table] = rows
+    return data
+
+
+class RestoreTestCase(TransactionTestCase, CommonTestCase):
+    """Base class for tests which dump the database and restore it."""
+
+    def setUp(self):
+        super(RestoreTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.SITE.loading_from_dump = False
+        super(RestoreTestCase, self).tearDown()
+
+    def create_demo_data(self):
+        User = settings.SITE.user_model
+        UserTypes = rt.modules.users.UserTypes
+        create = self.create_obj
+        robin = create(User, username='robin', first_name="Robin",
+                       profile=UserTypes.admin)
+        anna = create(User, username='anna', first_name="Anna",
+                      profile=UserTypes.user)
+        create(User, username='inactive')
+        create(rt.modules.users.Authority, user=robin, authorized=anna)
+        ct = rt.modules.contenttypes.ContentType.objects.get_for_model(User)
+        create(rt.modules.gfks.HelpText, content_type=ct,
+               field='username', help_text="The name used to log in.")
+        return robin, anna
+
+    def dump_and_restore(self, *options, **kwargs):
+        """Dump the database, empty the dumped tables and restore the
+        dump.  Return the content of the tables before and after.
+
+        """
+        models = get_dumped_models()
+        before = get_rows(models)
+        output_dir = os.path.join(self.tmpdir, 'dump')
+        call_command('dump2py', output_dir, *options)
+        cursor = connection.cursor()
+        with connection.constraint_checks_disabled():
+            for m in reversed(models):
+                cursor.execute('DELETE FROM ' + connection.ops.quote_name(
+                    m._meta.db_table))
+        # like :manage:`run`, which is how users run a restore.py
+        g = runpy.run_path(os.path.join(output_dir, 'restore.py'),
+                           dict(execfile=execfile))
+        g['main'](argparse.Namespace(interactive=False, **kwargs))
+        return before, get_rows(models)
+
+
+# Django before 2.1 breaks the foreign keys to renamed tables when
+# running with SQLite 3.26 or later (Django ticket #29182).
+BROKEN_SQLITE = (
+    connection.vendor == 'sqlite' and django.VERSION < (2, 1)
+    and sqlite3.sqlite_version_info >= (3, 26))
+
+
+class QuickRestoreTest(RestoreTestCase):
+
+    @skipIf(BROKEN_SQLITE, "SQLite 3.26+ is not supported by Django < 2.1")
+    def test_quick_restore(self):
+        self.create_demo_data()
+        before, after = self.dump_and_restore(quick=True)
+        self.assertEqual(before, after)
+
+    def test_fallback(self):
+        """When a bulk insert fails, the objects of the batch are saved one
+        by one, each of them in its own savepoint, and the
+        `before_dumpy_save` method of every object is called only
+        once.
+
+        """
+        robin, anna = self.create_demo_data()
+        Authority = rt.modules.users.Authority
+        pk = Authority.objects.get().pk
+        calls = []
+
+        def prepared(obj):
+            def before_dumpy_save():
+                calls.append(obj.pk)
+            obj.before_dumpy_save = before_dumpy_save
+            return obj
+
+        def broken(obj):
+            # writes its row and then fails
+            def save(*args, **kwargs):
+                Authority.save(obj, *args, **kwargs)
+                raise IntegrityError("Simulated failure")
+            obj.save = save
+            return obj
+
+        loader = DpyLoader(dict(
+            settings=settings, SOURCE_VERSION=settings.SITE.version),
+            quick=True)
+        loader.initialize()
+        # the first object has an existing primary key, which makes
+        # the bulk insert fail
+        loader.save(prepared(Authority(id=pk, user=anna, authorized=robin)))
+        loader.save(broken(prepared(
+            Authority(id=pk + 1, user=anna, authorized=robin))))
+        loader.save(prepared(
+            Authority(id=pk + 2, user=robin, authorized=robin)))
+        loader.finalize()
+
+        self.assertEqual(sorted(set(calls)), [pk, pk + 1, pk + 2])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(
+            list(Authority.objects.order_by('pk').values_list(
+                'pk', 'user__username')),
+            [(pk, 'anna'), (pk + 2, 'robin')])
+
+
+class ColumnRestoreTest(RestoreTestCase):
+
+    @skipIf(BROKEN_SQLITE, "SQLite 3.26+ is not supported by Django < 2.1")
+    def test_col_restore(self):
+        """A column dump restores datetime and content type columns."""
+        self.create_demo_data()
+        before, after = self.dump_and_restore('--format', 'col', quick=True)
+        self.assertEqual(before, after)
+        User = settings.SITE.user_model
+        self.assertEqual(
+            rt.modules.gfks.HelpText.objects.get().content_type.model_class(),
+            User)
+        self.assertIsNotNone(User.objects.get(username='anna').created)
+
+
+class ColumnFilesTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def roundtrip(self, type, values, compress):
+        fn = os.path.join(self.tmpdir, type)
+        w = ColumnWriter(fn, type, compress)
+        for v in values:
+            w.append(v)
+        w.close()
+        r = ColumnReader(fn, type)
+        try:
+            return [r.get(i) for i in range(len(values))]
+        finally:
+            r.close()
+
+    def test_types(self):
+        babel = [["Hello", "Hallo", ""], ["Fünf €", None, "cinq"], None]
+        dt = datetime.datetime(2016, 2, 29, 23, 59, 58)
+        for compress in (True, False):
+            self.assertEqual(
+                self.roundtrip('json', babel, compress), babel)
+            self.assertEqual(
+                self.roundtrip('datetime', [dt, None], compress),
+                [(2016, 2, 29, 23, 59, 58), None])
+            self.assertEqual(
+                self.roundtrip('model', ['users_User', None], compress),
+                ['users_User', None])
+            self.assertEqual(
+                self.roundtrip('text', ["", "é", None], compress),
+                ["", "é", None])
+            self.assertEqual(
+                self.roundtrip('date', [dt.date(), None], compress),
+                [dt.date(), None])
+            self.assertEqual(
+                self.roundtrip('time', [dt.time(), None], compress),
+                [dt.time(), None])
+
+
+class ColumnTypeTest(TestCase):
+
+    def test_pointer_to_mti_child(self):
+        """A pointer to an MTI child is stored as an integer column."""
+        # a registry of their own so that the dump tests don't see
+        # these models
+        test_apps = Apps()
+
+        class Meta:
+            app_label = 'lino_startup'
+            apps = test_apps
+
+        Partner = type(str('Partner'), (models.Model,), dict(
+            Meta=Meta, __module__=__name__))
+        Person = type(str('Person'), (Partner,), dict(
+            Meta=Meta, __module__=__name__))
+        Note = type(str('Note'), (models.Model,), dict(
+            Meta=Meta, __module__=__name__,
+            person=models.ForeignKey(Person),
+            partner=models.ForeignKey(Partner),
+            text=models.CharField(max_length=10)))
+        cmd = Command()
+        fields = Note._meta
+        self.assertEqual(
+            cmd.get_column_type(fields.get_field('person')), 'int')
+        self.assertEqual(
+            cmd.get_column_type(fields.get_field('partner')), 'int')
+        self.assertEqual(
+            cmd.get_column_type(fields.get_field('text')), 'text')
+        self.assertEqual(
+            cmd.get_column_type(Person._meta.get_field('partner_ptr')), 'int')
@@ -10,9 +10,10 @@ from __future__ import unicode_literals
 from builtins import object
 import json
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
+from django.core.mail import get_connection
 
 from lino.api import dd, rt, _
 from lino.api import pgettext
@@ -20,7 +21,9 @@ from lino.api import pgettext
 from lino.core.roles import SiteStaff
 from lino.core.gfks import gfk2lookup
 from lino.core.requests import BaseRequest
-from lino.core.site import html2text
+from lino.core.site import html2text, is_email_connection_error
+from lino.core.utils import iter_chunks
+from lino.core.tableversions import bump_table_versions
 
 from lino.mixins import Created, ObservedPeriod
 from lino.modlib.gfks.mixins import Controllable
@@ -178,9 +181,58 @@ class Message(UserAuthored, Controllable, Created):
             subject = "{} by {}".format(message_type, me)
             dd.logger.info(
                 "Notify %s users about %s", len(others), subject)
-            for user in others:
-                cls.create_message(
-                    user, owner, body=body, message_type=message_type)
+            cls.create_messages(
+                others, owner, body=body, message_type=message_type)
+
+    @classmethod
+    def create_messages(cls, users, owner=None, **kwargs):
+        """Create a message for every user of the given list of `users`
+        except those who have already been notified about that
+        object.
+
+        This is the bulk version of :meth:`create_message`: it finds
+        the users to skip using a single query and inserts all new
+        messages using `bulk_create`.  Websocket notifications are sent
+        only after the current transaction has been committed.
+
+        Note that the database validation of foreign keys (which
+        would cause one query per field and message) is skipped.
+
+        """
+        users = list(users)
+        if len(users) == 0:
+            return
+        fltkw = gfk2lookup(cls.owner, owner)
+        notified = set(cls.objects.filter(
+            user__in=users, seen__isnull=True, **fltkw).values_list(
+                'user_id', flat=True))
+        now = timezone.now()
+        messages = []
+        for user in users:
+            if user.pk in notified:
+                continue
+            obj = cls(user=user, owner=owner, created=now, **kwargs)
+            obj.full_clean(exclude=['user', 'owner_type'])
+            if owner is not None:
+                owner.update_owned_instance(obj)
+            messages.append(obj)
+        if len(messages) == 0:
+            return
+        cls.objects.bulk_create(messages)
+        bump_table_versions(cls)
+        if owner is not None:
+            for obj in messages:
+                owner.after_update_owned_instance(obj)
+        if settings.SITE.use_websockets:
+            recipients = [obj.user for obj in messages]
+
+            def send_browser_messages():
+                qs = cls.objects.filter(
+                    user__in=recipients, created=now, **fltkw)
+                for obj in qs.select_related('user'):
+                    obj.send_browser_message(obj.user)
+
+            transaction.on_commit(send_browser_messages)
 
     @classmethod
     def create_message(cls, user, owner=None, **kwargs):
@@ -236,13 +288,23 @@ class Message(UserAuthored, Controllable, Created):
     #     #     ar.obj2html(self.owner), " ",
     #     #     _("was modified by {0}").format(self.user))
 
-    def send_individual_email(self):
-        """"""
+    def send_individual_email(self, connection=None, template=None,
+                              save=True):
+        """Send an individual email about this message to its recipient.
+
+        `connection` and `template` may be given by callers who send
+        many emails (see :func:`send_individual_emails`).  If `save`
+        is `False`, the caller is responsible for setting :attr:`sent`.
+
+        Return `True` if an email has been sent.  See
+        :meth:`lino.core.site.Site.send_email` about errors.
+
+        """
         if not self.user.email:
             # debug level because we don't want to see this message
             # every 10 seconds:
             dd.logger.debug("User %s has no email address", self.user)
-            return
+            return False
         # dd.logger.info("20151116 %s %s", ar.bound_action, ar.actor)
         # ar = ar.spawn_request(renderer=dd.plugins.bootstrap3.renderer)
         # sar = BaseRequest(
@@ -260,14 +322,19 @@ class Message(UserAuthored, Controllable, Created):
         # context = dict(obj=self, E=E, rt=rt, ar=sar)
         # body = template.render(**context)
 
-        template = rt.get_template('notify/individual.eml')
+        if template is None:
+            template = rt.get_template('notify/individual.eml')
         context = dict(obj=self, E=E, rt=rt)
         body = template.render(**context)
 
         sender = settings.SERVER_EMAIL
-        rt.send_email(subject, sender, body, [self.user.email])
-        self.sent = timezone.now()
-        self.save()
+        if not rt.send_email(subject, sender, body, [self.user.email],
+                             connection=connection):
+            return False
+        if save:
+            self.sent = timezone.now()
+            self.save()
+        return True
 
     # for testing, set show_in_workflow to True:
     @dd.action(label=_("Send e-mail"),
@@ -490,13 +557,35 @@ class MyMessages(My, Messages):
 # dd.add_welcome_handler(welcome_messages)
 
 
-def send_summary_email(user, messages):
-    """"""
+def mark_messages_sent(pks):
+    """Set :attr:`sent` of the messages with the given primary keys to
+    the current time, using one `update()` per chunk of messages.
+
+    """
+    Message = rt.models.notify.Message
+    now = timezone.now()
+    for chunk in iter_chunks(pks):
+        Message.objects.filter(pk__in=chunk).update(sent=now)
+    bump_table_versions(Message)
+
+
+def send_summary_email(user, messages, connection=None, template=None,
+                       save=True):
+    """Send one email to the given `user` which summarizes the given
+    list of `messages`.
+
+    If `save` is `False`, the caller is responsible for setting
+    :attr:`sent` on the messages.
+
+    Return `True` if an email has been sent.  See
+    :meth:`lino.core.site.Site.send_email` about errors.
+
+    """
     if not user.email:
         # debug level because we don't want to see this message
         # every 10 seconds:
         dd.logger.debug("User %s has no email address", user)
-        return
+        return False
     # dd.logger.info("20151116 %s %s", ar.bound_action, ar.actor)
     # ar = ar.spawn_request(renderer=dd.plugins.bootstrap3.renderer)
     # sar = BaseRequest(
@@ -507,15 +596,98 @@ def send_summary_email(user, messages):
     subject = _("{} unseen notifications").format(len(messages))
     subject = settings.EMAIL_SUBJECT_PREFIX + subject
 
-    template = rt.get_template('notify/summary.eml')
+    if template is None:
+        template = rt.get_template('notify/summary.eml')
     context = dict(user=user, E=E, rt=rt, messages=messages)
     body = template.render(**context)
 
     sender = settings.SERVER_EMAIL
-    rt.send_email(subject, sender, body, [user.email])
-    for msg in messages:
-        msg.sent = timezone.now()
-        msg.save()
+    if not rt.send_email(subject, sender, body, [user.email],
+                         connection=connection):
+        return False
+    if save:
+        mark_messages_sent([msg.pk for msg in messages])
+    return True
+
+
+def open_connection():
+    """Return an open connection to the email server, or `None` if the
+    server cannot be reached.
+
+    """
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        dd.logger.warning("Cannot connect to email server: %s", e)
+        return None
+    return connection
+
+
+def close_connection(connection):
+    """Close the given connection to the email server, ignoring errors
+    (e.g. when the server has already closed it).
+
+    """
+    try:
+        connection.close()
+    except Exception as e:
+        dd.logger.debug("Failed to close email connection: %s", e)
+
+
+def send_individual_emails(messages):
+    """Send an individual email for each of the given messages.
+
+    All emails are sent through a single connection to the email
+    server, the template is loaded only once, and the messages are
+    marked as sent using a few `update()` queries at the end.
+
+    Only the messages whose email has actually been sent are marked
+    as sent.  When the connection gets lost, the remaining messages
+    are left for the next run.
+
+    """
+    template = rt.get_template('notify/individual.eml')
+    connection = open_connection()
+    if connection is None:
+        return
+    done = []
+    try:
+        for obj in messages:
+            if obj.send_individual_email(connection, template, False):
+                done.append(obj.pk)
+    except Exception as e:
+        if not is_email_connection_error(e):
+            raise
+        dd.logger.warning("Lost connection to email server: %s", e)
+    finally:
+        close_connection(connection)
+    mark_messages_sent(done)
+
+
+def send_summary_emails(users):
+    """Send a summary email to each user of the given `dict` which maps
+    users to lists of messages.  Like :func:`send_individual_emails`
+    this uses a single connection to the email server and marks only
+    the messages of the emails which have actually been sent.
+
+    """
+    template = rt.get_template('notify/summary.eml')
+    connection = open_connection()
+    if connection is None:
+        return
+    done = []
+    try:
+        for user, lst in users.items():
+            if send_summary_email(user, lst, connection, template, False):
+                done += [msg.pk for msg in lst]
+    except Exception as e:
+        if not is_email_connection_error(e):
+            raise
+        dd.logger.warning("Lost connection to email server: %s", e)
+    finally:
+        close_connection(connection)
+    mark_messages_sent(done)
 
 
 h = settings.EMAIL_HOST
@@ -531,15 +703,15 @@ if True:
         Message = rt.models.notify.Message
         qs = Message.objects.filter(sent__isnull=True)
         qs = qs.filter(user__mail_mode=MailModes.daily).order_by('user')
-        if qs.count() > 0:
-            users = dict()
-            for obj in qs:
-                lst = users.setdefault(obj.user, [])
-                lst.append(obj)
+        qs = qs.select_related('user')
+        users = dict()
+        for obj in qs:
+            lst = users.setdefault(obj.user, [])
+            lst.append(obj)
+        if len(users):
             dd.logger.debug(
                 "Send out daily summaries for %d users.", len(users))
-            for user, lst in users.items():
-                send_summary_email(user, lst)
+            send_summary_emails(users)
         else:
             dd.logger.debug("No messages to send.")
 
@@ -549,11 +721,12 @@ if True:
         Message = rt.models.notify.Message
         qs = Message.objects.filter(sent__isnull=True)
         qs = qs.filter(user__mail_mode=MailModes.immediately)
-        if qs.count() > 0:
+        qs = qs.select_related('user').order_by('pk')
+        messages = list(qs)
+        if len(messages):
             dd.logger.debug(
-                "Send out emails for %d messages.", qs.count())
-            for obj in qs:
-                obj.send_individual_email()
+                "Send out emails for %d messages.", len(messages))
+            send_individual_emails(messages)
         else:
             dd.logger.debug("No messages to send.")
 
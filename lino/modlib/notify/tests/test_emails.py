@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Tests for sending the notification emails.  Run them from any Lino
+project which has :mod:`lino.modlib.notify` installed::
+
+  $ python manage.py test lino.modlib.notify
+
+"""
+
+from __future__ import unicode_literals
+
+import smtplib
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.test.utils import override_settings, CaptureQueriesContext
+
+from lino.api import rt
+from lino.modlib.notify.models import (
+    send_individual_emails, send_summary_emails)
+from lino.utils.djangotest import RemoteAuthTestCase
+
+
+class CountingBackend(locmem.EmailBackend):
+    """An in-memory email backend which counts its instances."""
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingBackend.instances += 1
+        super(CountingBackend, self).__init__(*args, **kwargs)
+
+
+class FailingBackend(locmem.EmailBackend):
+    """An email backend which cannot connect to its server."""
+
+    def open(self):
+        raise IOError("Connection refused")
+
+
+class FlakyBackend(locmem.EmailBackend):
+    """An email backend which loses its connection after having sent
+    :attr:`limit` emails and which refuses the recipients in
+    :attr:`refused`.
+
+    """
+    limit = None
+    refused = ()
+    attempts = 0
+
+    def send_messages(self, messages):
+        FlakyBackend.attempts += 1
+        if self.limit is not None and len(mail.outbox) >= self.limit:
+            raise smtplib.SMTPServerDisconnected("Connection lost")
+        for msg in messages:
+            for to in msg.to:
+                if to in self.refused:
+                    raise smtplib.SMTPRecipientsRefused({to: (550, 'No')})
+        return super(FlakyBackend, self).send_messages(messages)
+
+
+FLAKY = 'lino.modlib.notify.tests.test_emails.FlakyBackend'
+
+
+@override_settings(
+    EMAIL_BACKEND='lino.modlib.notify.tests.test_emails.CountingBackend',
+    SERVER_EMAIL='lino@localhost')
+class EmailsTest(RemoteAuthTestCase):
+
+    def setUp(self):
+        super(EmailsTest, self).setUp()
+        CountingBackend.instances = 0
+        FlakyBackend.limit = None
+        FlakyBackend.refused = ()
+        FlakyBackend.attempts = 0
+        mail.outbox = []
+        User = settings.SITE.user_model
+        UserTypes = rt.models.users.UserTypes
+        self.users = [
+            self.create_obj(
+                User, username=name, first_name=name.capitalize(),
+                email=name + '@lino.test', profile=UserTypes.user)
+            for name in ('anna', 'bert')]
+        self.create_obj(User, username='nomail', profile=UserTypes.user)
+        for i in range(3):
+            for user in User.objects.order_by('pk'):
+                self.create_obj(
+                    rt.models.notify.Message, user=user,
+                    subject="Subject {}".format(i),
+                    body="Body {}".format(i),
+                    message_type=rt.models.notify.MessageTypes.action)
+
+    def get_messages(self):
+        return list(rt.models.notify.Message.objects.order_by(
+            'pk').select_related('user'))
+
+    def count_updates(self, queries):
+        return len([q for q in queries
+                    if q['sql'].startswith('UPDATE')
+                    and 'notify_message' in q['sql']])
+
+    def test_individual_emails(self):
+        messages = self.get_messages()
+        self.assertEqual(len(messages), 9)
+        with CaptureQueriesContext(connection) as ctx:
+            send_individual_emails(messages)
+        self.assertEqual(CountingBackend.instances, 1)
+        self.assertEqual(self.count_updates(ctx.captured_queries), 1)
+        self.assertEqual(len(mail.outbox), 6)
+        for msg, email in zip(
+                [m for m in messages if m.user.email], mail.outbox):
+            self.assertEqual(email.to, [msg.user.email])
+            self.assertIn(msg.user.first_name, email.body)
+            self.assertIn(msg.body, email.body)
+        for msg in self.get_messages():
+            if msg.user.email:
+                self.assertIsNotNone(msg.sent)
+            else:
+                self.assertIsNone(msg.sent)
+
+    def test_summary_emails(self):
+        users = dict()
+        for msg in self.get_messages():
+            users.setdefault(msg.user, []).append(msg)
+        with CaptureQueriesContext(connection) as ctx:
+            send_summary_emails(users)
+        self.assertEqual(CountingBackend.instances, 1)
+        self.assertEqual(self.count_updates(ctx.captured_queries), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            sorted([e.to[0] for e in mail.outbox]),
+            ['anna@lino.test', 'bert@lino.test'])
+        for email in mail.outbox:
+            self.assertIn("You have 3 unseen notifications", email.body)
+            for i in range(3):
+                self.assertIn("Body {}".format(i), email.body)
+        qs = rt.models.notify.Message.objects.filter(sent__isnull=True)
+        self.assertEqual(
+            list(qs.values_list('user__username', flat=True)),
+            ['nomail'] * 3)
+
+    @override_settings(
+        EMAIL_BACKEND='lino.modlib.notify.tests.test_emails.FailingBackend')
+    def test_no_connection(self):
+        send_individual_emails(self.get_messages())
+        self.assertEqual(len(mail.outbox), 0)
+        qs = rt.models.notify.Message.objects.filter(sent__isnull=False)
+        self.assertEqual(qs.count(), 0)
+
+    def get_sent(self):
+        qs = rt.models.notify.Message.objects.filter(sent__isnull=False)
+        return list(qs.order_by('pk').values_list('pk', flat=True))
+
+    @override_settings(EMAIL_BACKEND=FLAKY)
+    def test_lost_connection(self):
+        """When the connection gets lost in the middle of a batch, only
+        the messages sent before are marked as sent, and no more
+        emails are tried.
+
+        """
+        FlakyBackend.limit = 2
+        messages = [m for m in self.get_messages() if m.user.email]
+        send_individual_emails(messages)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(FlakyBackend.attempts, 3)
+        self.assertEqual(self.get_sent(), [m.pk for m in messages[:2]])
+
+    @override_settings(EMAIL_BACKEND=FLAKY)
+    def test_lost_connection_summary(self):
+        FlakyBackend.limit = 1
+        users = dict()
+        for msg in self.get_messages():
+            users.setdefault(msg.user, []).append(msg)
+        send_summary_emails(users)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(FlakyBackend.attempts, 2)
+        user = settings.SITE.user_model.objects.get(email=mail.outbox[0].to[0])
+        self.assertEqual(
+            self.get_sent(), sorted([msg.pk for msg in users[user]]))
+
+    @override_settings(EMAIL_BACKEND=FLAKY)
+    def test_refused_recipient(self):
+        """A failing email is not marked as sent, but the others are still
+        sent.
+
+        """
+        FlakyBackend.refused = ['anna@lino.test']
+        messages = self.get_messages()
+        send_individual_emails(messages)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(FlakyBackend.attempts, 6)
+        self.assertEqual(
+            self.get_sent(),
+            [m.pk for m in messages if m.user.username == 'bert'])
@@ -105,6 +105,21 @@ class Checker(dd.Choice):
             qs = Problem.objects.filter(**gfk2lookup(gfk, obj, checker=self))
             qs.delete()
 
+        todo, done, prb = self.get_problem(obj, fix)
+        if prb is not None:
+            prb.full_clean()
+            prb.save()
+        return (todo, done)
+
+    def get_problem(self, obj, fix=False):
+        """Run this checker on the specified object and return a tuple
+        `(todo, done, problem)` where `problem` is either `None` or
+        an unsaved :class:`Problem
+        <lino.modlib.plausibility.models.Problem>` to be saved by the
+        caller.
+
+        """
+        Problem = rt.modules.plausibility.Problem
         done = []
         todo = []
         for fixable, msg in self.get_plausibility_problems(obj, fix):
@@ -114,6 +129,7 @@ class Checker(dd.Choice):
                 done.append(msg)
             else:
                 todo.append(msg)
+        prb = None
         if len(todo):
             user = self.get_responsible_user(obj)
             if user is None:
@@ -123,9 +139,7 @@ class Checker(dd.Choice):
             with translation.override(lang):
                 msg = '\n'.join([str(s) for s in todo])
             prb = Problem(owner=obj, message=msg, checker=self, user=user)
-            prb.full_clean()
-            prb.save()
-        return (todo, done)
+        return (todo, done, prb)
 
     def get_plausibility_problems(self, obj, fix=False):
         """Return or yield a series of `(fixable, message)` tuples, each
@@ -24,6 +24,7 @@ from django.core.management.base import BaseCommand, CommandError
 from atelier.utils import list_py2
 from lino.modlib.plausibility.choicelists import Checkers
 from lino.modlib.plausibility.models import check_plausibility
+from lino.modlib.plausibility.models import check_dirty_objects
 
 from lino.api import rt
 
@@ -39,6 +40,13 @@ class Command(BaseCommand):
     the form `app_label.ModelName`, and only these models are being
     updated.
 
+    With `--workers`, the objects of every model are checked in
+    parallel by a pool of worker processes, each of them processing a
+    chunk of primary keys.
+
+    With `--dirty`, check only the objects which have been saved or
+    deleted since the last run.
+
     """
 
     def add_arguments(self, parser):
@@ -51,6 +59,18 @@ class Command(BaseCommand):
             '-f', '--fix', action='store_true', dest='fix',
             default=False,
             help="Fix any repairable problems.")
+        parser.add_argument(
+            '-w', '--workers', action='store', type=int, dest='workers',
+            default=None,
+            help="The number of worker processes to use.")
+        parser.add_argument(
+            '--chunk-size', action='store', type=int, dest='chunk_size',
+            default=None,
+            help="The number of primary keys to check per chunk.")
+        parser.add_argument(
+            '--dirty', action='store_true', dest='dirty',
+            default=False,
+            help="Check only objects which changed since the last run.")
 
     def handle(self, *args, **options):
         app = options.get('checkers', args)
@@ -60,4 +80,14 @@ class Command(BaseCommand):
             rt.show(Checkers, column_names="value text")
         else:
             rt.startup()
-            check_plausibility(args=args, fix=options['fix'])
+            if options['dirty']:
+                timings = check_dirty_objects(
+                    fix=options['fix'], chunk_size=options['chunk_size'])
+            else:
+                timings = check_plausibility(
+                    args=args, fix=options['fix'],
+                    workers=options['workers'],
+                    chunk_size=options['chunk_size'])
+            for chk, seconds in timings.items():
+                self.stdout.write("{0:>10.2f}s {1}".format(
+                    seconds, chk.value))
@@ -12,11 +12,17 @@ from __future__ import unicode_literals, print_function
 import six
 from builtins import object
 from builtins import str
+import time
+import multiprocessing
 from collections import OrderedDict
 
-from django.db import models
+from django.conf import settings
+from django.db import models, connections, transaction
 from django.utils import translation
 
+from lino.core.utils import iter_chunks
+from lino.core.tableversions import bump_table_versions
+
 from lino.core.gfks import gfk2lookup
 from lino.modlib.gfks.mixins import Controllable
 from lino.modlib.users.mixins import UserAuthored
@@ -150,6 +156,25 @@ class Problem(Controllable, UserAuthored):
     fix_problem = FixProblem()
 
 
+class DirtyObject(dd.Model):
+    """Marks a database object as needing to be checked again.
+
+    Lino creates these automatically when an object of some
+    checkable model (see :func:`get_checkable_models`) is saved or
+    deleted.  They are consumed by :func:`check_dirty_objects`.  Note
+    that queryset-level updates and deletes don't send any signals and
+    therefore don't mark anything as dirty.
+
+    """
+    class Meta(object):
+        app_label = 'plausibility'
+        verbose_name = _("Object to check")
+        verbose_name_plural = _("Objects to check")
+
+    owner_type = dd.ForeignKey('contenttypes.ContentType')
+    owner_id = models.PositiveIntegerField()
+
+
 dd.update_field(Problem, 'user', verbose_name=_("Responsible"))
 Problem.set_widget_options('checker', width=10)
 Problem.set_widget_options('user', width=10)
@@ -269,6 +294,61 @@ def set_plausibility_actions(sender, **kw):
 
 
 
+@dd.receiver(dd.post_analyze)
+def connect_dirty_objects(sender, models_list=None, **kw):
+    """Connect the signal handlers which mark checkable objects as dirty
+    when they are saved or deleted.  They are connected only for the
+    checkable models and their MTI children, so that the other models
+    can still be deleted in bulk.
+
+    """
+    for m in models_list:
+        if m is DirtyObject or m is Problem:
+            continue
+        if get_checkable_model(m) is None:
+            continue
+        name = dd.full_model_name(m)
+        models.signals.post_save.connect(
+            mark_dirty_object, sender=m,
+            dispatch_uid='plausibility_mark_dirty_saved_' + name)
+        models.signals.post_delete.connect(
+            mark_dirty_object, sender=m,
+            dispatch_uid='plausibility_mark_dirty_deleted_' + name)
+
+
+_checkable_senders = dict()
+
+
+def get_checkable_model(sender):
+    """Return the model of :func:`get_checkable_models` to which the
+    given model belongs (either because it is that model or an MTI
+    child of it), or `None`.
+
+    """
+    try:
+        return _checkable_senders[sender]
+    except KeyError:
+        pass
+    m = None
+    mc = get_checkable_models()
+    for cand in [sender] + list(sender._meta.get_parent_list()):
+        if cand in mc:
+            m = cand
+            break
+    _checkable_senders[sender] = m
+    return m
+
+
+def mark_dirty_object(sender, instance=None, raw=False, **kw):
+    if raw:
+        return
+    m = get_checkable_model(sender)
+    if m is None or instance.pk is None:
+        return
+    ct = rt.modules.contenttypes.ContentType.objects.get_for_model(m)
+    DirtyObject(owner_type=ct, owner_id=instance.pk).save()
+
+
 def get_checkable_models(*args):
     """Return an `OrderedDict` mapping each model which has at least one
     checker to a list of these checkers.
@@ -291,43 +371,222 @@ def get_checkable_models(*args):
     return checkable_models
 
 
-def check_plausibility(args=[], fix=True):
-    """Called by :manage:`checkdata`. See there."""
+def check_objects(checkers, objects, fix, timings):
+    """Run the given checkers on the given database objects and save
+    the detected problems using a single `bulk_create`.  Return a
+    tuple `(todo, done)` with the number of found and fixed problems.
+
+    Note that the problems are not validated using `full_clean()`,
+    only their message is truncated to its maximum length.
+
+    `timings` is a dict which maps the value of each checker to the
+    number of seconds it has been running so far.
+
+    """
+    Problem = rt.modules.plausibility.Problem
+    max_length = Problem._meta.get_field('message').max_length
+    todo = done = 0
+    problems = []
+    for obj in objects:
+        for chk in checkers:
+            t0 = time.time()
+            t, d, prb = chk.get_problem(obj, fix)
+            timings[chk.value] = timings.get(chk.value, 0) + \
+                time.time() - t0
+            todo += len(t)
+            done += len(d)
+            if prb is not None:
+                prb.message = prb.message[:max_length]
+                problems.append(prb)
+    if len(problems):
+        Problem.objects.bulk_create(problems)
+        bump_table_versions(Problem)
+    return (todo, done)
+
+
+def sort_timings(timings):
+    """Convert a dict of timings as collected by :func:`check_objects`
+    into an `OrderedDict` which maps checkers to seconds.
+
+    """
+    rv = OrderedDict()
+    for chk in Checkers.objects():
+        if chk.value in timings:
+            rv[chk] = timings[chk.value]
+    return rv
+
+
+def check_pk_range(job):
+    """Check the objects of a given model whose primary key is within a
+    given range.  This is run in a worker process of the pool used by
+    :func:`check_plausibility`.
+
+    """
+    model_name, checker_values, lo, hi, fix = job
+    m = dd.resolve_model(model_name)
+    checkers = [Checkers.get_by_value(v) for v in checker_values]
+    timings = dict()
+    with translation.override('en'):
+        qs = m.objects.filter(pk__gte=lo, pk__lt=hi).order_by('pk')
+        todo, done = check_objects(checkers, qs, fix, timings)
+    return (todo, done, timings)
+
+
+def check_plausibility(args=[], fix=True, workers=None, chunk_size=None):
+    """Called by :manage:`checkdata`. See there.
+
+    When `workers` is greater than 1, the primary key range of every
+    model is split into chunks of `chunk_size` (default is
+    :attr:`data_chunk_size <lino.core.site.Site.data_chunk_size>`)
+    rows which are checked in parallel by a pool of worker processes,
+    each with its own database connection.  Models whose primary key
+    is not an integer are checked in the main process.
+
+    Return an `OrderedDict` which maps every checker to the number of
+    seconds it has been running (summed over all workers).
+
+    """
     Problem = rt.modules.plausibility.Problem
     mc = get_checkable_models(*args)
     if len(mc) == 0 and len(args) > 0:
         raise Exception("No checker matches {0}".format(args))
+    if chunk_size is None:
+        chunk_size = settings.SITE.data_chunk_size
+    pool = None
+    if workers is not None and workers > 1:
+        # Every worker must open its own database connection.
+        connections.close_all()
+        pool = multiprocessing.Pool(workers)
+    timings = dict()
     final_sums = [0, 0, 0]
-    with translation.override('en'):
-        for m, checkers in mc.items():
-            ct = rt.modules.contenttypes.ContentType.objects.get_for_model(m)
-            Problem.objects.filter(owner_type=ct).delete()
-            name = str(m._meta.verbose_name_plural)
-            qs = m.objects.all()
-            msg = "Running {0} data checkers on {1} {2}...".format(
-                len(checkers), qs.count(), name)
-            dd.logger.debug(msg)
-            sums = [0, 0, name]
-            for obj in qs:
-                for chk in checkers:
-                    todo, done = chk.update_problems(obj, False, fix)
-                    sums[0] += len(todo)
-                    sums[1] += len(done)
-            if sums[0] or sums[1]:
-                msg = "Found {0} and fixed {1} data problems in {2}."
-                dd.logger.info(msg.format(*sums))
-            else:
-                dd.logger.debug(
-                    "No data problems found in {0}.".format(name))
-            final_sums[0] += 1
-            final_sums[1] += sums[0]
-            final_sums[2] += sums[1]
+    try:
+        with translation.override('en'):
+            for m, checkers in mc.items():
+                ct = rt.modules.contenttypes.ContentType.objects.get_for_model(m)
+                Problem.objects.filter(owner_type=ct).delete()
+                DirtyObject.objects.filter(owner_type=ct).delete()
+                name = str(m._meta.verbose_name_plural)
+                qs = m.objects.all()
+                msg = "Running {0} data checkers on {1} {2}...".format(
+                    len(checkers), qs.count(), name)
+                dd.logger.debug(msg)
+                sums = [0, 0, name]
+                jobs = None
+                if pool is not None:
+                    jobs = get_pk_range_jobs(m, checkers, fix, chunk_size)
+                if jobs is None:
+                    for chunk in iter_chunks(qs, chunk_size):
+                        todo, done = check_objects(
+                            checkers, chunk, fix, timings)
+                        sums[0] += todo
+                        sums[1] += done
+                else:
+                    for todo, done, t in pool.imap_unordered(
+                            check_pk_range, jobs):
+                        sums[0] += todo
+                        sums[1] += done
+                        for k, v in t.items():
+                            timings[k] = timings.get(k, 0) + v
+                if sums[0] or sums[1]:
+                    msg = "Found {0} and fixed {1} data problems in {2}."
+                    dd.logger.info(msg.format(*sums))
+                else:
+                    dd.logger.debug(
+                        "No data problems found in {0}.".format(name))
+                final_sums[0] += 1
+                final_sums[1] += sums[0]
+                final_sums[2] += sums[1]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
     msg = "Done %d checkers, found %d and fixed %d problems."
     dd.logger.info(msg, *final_sums)
+    return sort_timings(timings)
+
+
+def check_dirty_objects(fix=False, chunk_size=None):
+    """Run the data checkers on every database object which has been
+    marked as dirty (see :class:`DirtyObject`), then remove these
+    marks.  Objects which no longer exist lose their problems.
+
+    Every chunk of objects is checked in a transaction which also
+    removes their marks, so that the marks survive a failing check.
+    Marks added while the check is running are kept.  Marks of
+    content types whose model no longer exists are removed.
+
+    Return the same as :func:`check_plausibility`.
+
+    """
+    Problem = rt.modules.plausibility.Problem
+    if chunk_size is None:
+        chunk_size = settings.SITE.data_chunk_size
+    by_type = OrderedDict()
+    for pk, ct_id, owner_id in DirtyObject.objects.values_list(
+            'pk', 'owner_type', 'owner_id'):
+        marks = by_type.setdefault(ct_id, dict())
+        marks.setdefault(owner_id, []).append(pk)
+    timings = dict()
+    mc = get_checkable_models()
+    ContentType = rt.modules.contenttypes.ContentType
+    with translation.override('en'):
+        for ct_id, marks in by_type.items():
+            ct = ContentType.objects.get_for_id(ct_id)
+            m = ct.model_class()
+            if m is None:
+                dd.logger.warning(
+                    "Removing %d dirty marks of obsolete content type %s.",
+                    len(marks), ct)
+                for chunk in iter_chunks(list(marks.values()), chunk_size):
+                    DirtyObject.objects.filter(
+                        pk__in=[pk for lst in chunk for pk in lst]).delete()
+                continue
+            checkers = mc.get(m)
+            pks = sorted(marks.keys())
+            for chunk in iter_chunks(pks, chunk_size):
+                with transaction.atomic():
+                    Problem.objects.filter(
+                        owner_type_id=ct_id, owner_id__in=chunk).delete()
+                    if checkers:
+                        qs = m.objects.filter(pk__in=chunk)
+                        check_objects(checkers, qs, fix, timings)
+                    DirtyObject.objects.filter(pk__in=[
+                        pk for owner_id in chunk
+                        for pk in marks[owner_id]]).delete()
+            dd.logger.debug(
+                "Checked %d dirty %s.", len(pks),
+                m._meta.verbose_name_plural)
+    return sort_timings(timings)
+
+
+def get_pk_range_jobs(m, checkers, fix, chunk_size):
+    """Return a list of jobs for :func:`check_pk_range`, or `None` if
+    the primary key of the given model is not an integer.
+
+    """
+    rng = m.objects.aggregate(lo=models.Min('pk'), hi=models.Max('pk'))
+    lo, hi = rng['lo'], rng['hi']
+    if lo is None:
+        return []
+    if not isinstance(lo, six.integer_types):
+        return None
+    name = dd.full_model_name(m)
+    values = [chk.value for chk in checkers]
+    return [(name, values, i, i + chunk_size, fix)
+            for i in range(lo, hi + 1, chunk_size)]
 
 
 @dd.schedule_daily()
 def checkdata():
     """Run all data checkers."""
     check_plausibility(fix=False)
+
+
+@dd.schedule_often(every=60)
+def checkdirtydata():
+    """Run the data checkers on objects which changed since the last
+    run.
+
+    """
+    check_dirty_objects(fix=False)
     # rt.login().run(settings.SITE.site_config.run_checkdata)
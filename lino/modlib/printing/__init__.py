@@ -25,6 +25,53 @@ class Plugin(ad.Plugin):
 
     verbose_name = _("Printing")
 
+    print_workers = None
+    """The number of worker processes to use for building the
+    printable documents when printing several rows at once (see
+    :meth:`CachedPrintAction.print_multiple
+    <lino.modlib.printing.actions.CachedPrintAction.print_multiple>`).
+
+    The default value `None` means that all documents are built by
+    the server process itself.
+
+    The worker processes are started when they are needed for the
+    first time and then remain alive as long as the server process.
+    They are started using the "spawn" method, which runs a new
+    Python interpreter.  When the server runs embedded in another
+    program (e.g. under mod_wsgi or uwsgi), you must specify that
+    interpreter in :attr:`print_workers_executable`.
+
+    Under Python 2 the workers are forked from the server process.
+    Forking a multithreaded process can deadlock, so under Python 2
+    you should not combine this with
+    :attr:`background_print_threshold` or use it with a multithreaded
+    web server.
+
+    """
+
+    print_workers_executable = None
+    """The Python interpreter to run the worker processes of
+    :attr:`print_workers`, e.g. the :file:`bin/python` of the virtual
+    environment of your site.
+
+    The default value `None` means to use `sys.executable`, which is
+    the right thing when the server is a Python process (e.g. when
+    using :manage:`runserver` or gunicorn), but not when it runs
+    embedded in another program (e.g. mod_wsgi or uwsgi).
+
+    """
+
+    background_print_threshold = None
+    """When printing more than this number of rows at once, Lino does
+    the job in a background thread and notifies the user when the
+    merged document is ready (or when the job failed).  Every
+    background job writes its own merged file.
+
+    The default value `None` means that printing is never done in
+    background.
+
+    """
+
     # needs_plugins = ['lino_xl.lib.appypod']
     # needs_plugins = ['lino.modlib.plausibility']
 
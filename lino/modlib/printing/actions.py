@@ -14,15 +14,22 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import atexit
 import shutil
 import datetime
+import threading
+import multiprocessing
 
+import django
 from django.conf import settings
+from django.db import connection, connections
+from django.utils import translation
 from django.utils.timezone import make_aware
 
 from lino.core.actions import Action, ShowDetailAction, GridEdit
-from lino.api import rt, _
+from lino.api import dd, rt, _
 from lino.core import dbutils
+from lino.core.utils import full_model_name, resolve_model
 
 from lino.core.roles import SiteStaff
 from lino.utils.xmlgen.html import E
@@ -35,6 +42,59 @@ davlink = settings.SITE.plugins.get('davlink', None)
 has_davlink = davlink is not None and settings.SITE.use_java
 
 
+def build_target_job(job):
+    """Build the printable document of one database object and return
+    its filename.  This is a module-level function so that it can run
+    in a worker process of :meth:`CachedPrintAction.print_multiple`.
+
+    """
+    name, pk, username, lng = job
+    obj = resolve_model(name).objects.get(pk=pk)
+    ar = rt.login(username)
+    with translation.override(lng):
+        obj.build_target(ar)
+    return obj.get_target_name()
+
+
+_print_pool = None
+_print_pool_lock = threading.Lock()
+
+
+def get_print_pool():
+    """Return the pool of worker processes for building printable
+    documents (see :attr:`print_workers
+    <lino.modlib.printing.Plugin.print_workers>`).
+
+    The pool is created when it is needed for the first time and then
+    used for all subsequent print jobs of this process, so that the
+    workers start their Lino site only once.
+
+    The workers are started using the "spawn" method so that they
+    don't inherit the locks of other threads (e.g. those of a
+    multithreaded web server).  This method is not available under
+    Python 2, where the workers are forked from the server process.
+
+    """
+    global _print_pool
+    with _print_pool_lock:
+        if _print_pool is None:
+            plugin = dd.plugins.printing
+            if hasattr(multiprocessing, 'get_context'):
+                ctx = multiprocessing.get_context('spawn')
+                if plugin.print_workers_executable:
+                    ctx.set_executable(plugin.print_workers_executable)
+                pool = ctx.Pool(plugin.print_workers,
+                                initializer=django.setup)
+            else:
+                # forked processes must not share the database
+                # connections of their parent
+                connections.close_all()
+                pool = multiprocessing.Pool(plugin.print_workers)
+            atexit.register(pool.terminate)
+            _print_pool = pool
+        return _print_pool
+
+
 class BasePrintAction(Action):
     """
     Base class for all "Print" actions.
@@ -167,28 +227,140 @@ class CachedPrintAction(BasePrintAction):
 
         def ok(ar2):
             # qs = [ar.actor.get_row_by_pk(pk) for pk in ar.selected_pks]
-            mf = self.print_multiple(ar, ar.selected_rows)
+            rows = ar.selected_rows
+            threshold = dd.plugins.printing.background_print_threshold
+            if threshold is not None and len(rows) > threshold:
+                mf = TmpMediaFile(ar, 'pdf', unique=True)
+                thread = threading.Thread(
+                    target=self.print_in_thread,
+                    args=(ar.get_user(), translation.get_language(),
+                          rows, mf))
+                thread.start()
+                ar2.success(_(
+                    "Printing %d rows in background. You will be "
+                    "notified when the document is ready.") % len(rows))
+                return
+            mf = self.print_multiple(ar, rows)
             ar2.success(open_url=mf.url)
             # kw.update(refresh_all=True)
             # return kw
         msg = _("This will print %d rows.") % len(ar.selected_rows)
         ar.confirm(ok, msg, _("Are you sure?"))
 
-    def print_multiple(self, ar, qs):
-        pdfs = []
-        for obj in qs:
-            # assert isinstance(obj,CachedPrintable)
-            if obj.printed_by_id is None:
-                obj.build_target(ar)
-            pdf = obj.get_target_name()
-            assert pdf is not None
-            pdfs.append(pdf)
+    def print_multiple(self, ar, qs, mf=None):
+        """Build the printable documents of the given database objects
+        (unless they are cached) and merge them into a single pdf
+        file.  Return the :class:`TmpMediaFile
+        <lino.utils.media.TmpMediaFile>` of the merged file.
+
+        If :attr:`print_workers
+        <lino.modlib.printing.Plugin.print_workers>` is set, the
+        documents are built by the worker processes of
+        :func:`get_print_pool`.  The merge
+        starts as soon as the first document is available and adds
+        the others in their original order while the workers continue.
+
+        """
+        qs = list(qs)
+        # assert isinstance(obj,CachedPrintable)
+        todo = [i for i, obj in enumerate(qs) if obj.printed_by_id is None]
 
-        mf = TmpMediaFile(ar, 'pdf')
+        if mf is None:
+            mf = TmpMediaFile(ar, 'pdf')
         rt.makedirs_if_missing(os.path.dirname(mf.name))
-        merge_pdfs(pdfs, mf.name)
+
+        workers = dd.plugins.printing.print_workers
+        if workers and workers > 1 and len(todo) > 1:
+            username = None
+            u = ar.get_user()
+            if u is not None and u.pk is not None:
+                username = u.username
+            lng = translation.get_language()
+            jobs = [(full_model_name(qs[i].__class__), qs[i].pk,
+                     username, lng) for i in todo]
+            built = get_print_pool().imap(build_target_job, jobs)
+            merge_pdfs(self.iter_targets(qs, todo, built), mf.name)
+        else:
+            def build():
+                for i in todo:
+                    qs[i].build_target(ar)
+                    yield qs[i].get_target_name()
+            merge_pdfs(self.iter_targets(qs, todo, build()), mf.name)
         return mf
 
+    def iter_targets(self, qs, todo, built):
+        """Yield the filenames of the printable documents of the given
+        database objects in their original order.  `todo` is the
+        list of the indexes of the objects whose document gets built,
+        `built` yields the filenames of these documents.
+
+        """
+        built = iter(built)
+        todo = set(todo)
+        for i, obj in enumerate(qs):
+            if i in todo:
+                pdf = next(built)
+                logger.info("Built %s (%d of %d).", pdf, i + 1, len(qs))
+            else:
+                pdf = obj.get_target_name()
+            assert pdf is not None
+            yield pdf
+
+    def print_in_thread(self, *args):
+        """Run :meth:`print_in_background` in a thread of its own, and close
+        the database connection of that thread at the end.
+
+        """
+        try:
+            self.print_in_background(*args)
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            connection.close()
+
+    def print_in_background(self, user, lng, qs, mf):
+        """Run :meth:`print_multiple` and notify the given `user` when the
+        merged document is ready or when the job failed.
+
+        """
+        username = None
+        if user is not None and user.pk is not None:
+            username = user.username
+        ar = rt.login(username)
+        with translation.override(lng):
+            try:
+                self.print_multiple(ar, qs, mf)
+            except Exception as e:
+                logger.exception(e)
+                subject = _("Failed to print your document "
+                            "with %d rows.") % len(qs)
+                body = E.tostring(E.p(six.text_type(e)))
+            else:
+                subject = _("Your document with %d rows is ready.") % len(qs)
+                body = E.tostring(E.a(os.path.basename(mf.name), href=mf.url))
+            self.notify_user(user, subject, body)
+
+    def notify_user(self, user, subject, body):
+        """Send a notification message about a background print job to the
+        given `user`.  Just log it if there is no user or if
+        :mod:`lino.modlib.notify` is not installed.
+
+        """
+        if user is None or user.pk is None or not settings.SITE.is_installed(
+                'notify'):
+            logger.info("%s : %s", subject, body)
+            return
+        # not create_message() because that would skip the message if
+        # the user has another unseen message without owner
+        Message = rt.models.notify.Message
+        msg = Message(
+            user=user, subject=subject, body=body,
+            message_type=rt.models.notify.MessageTypes.action)
+        msg.full_clean()
+        msg.save()
+        if settings.SITE.use_websockets:
+            msg.send_browser_message(user)
+
 
 class EditTemplate(BasePrintAction):
     """Edit the print template, i.e. the file specified by
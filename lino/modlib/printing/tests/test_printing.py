@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Tests for printing several rows at once.  Run them from any Lino
+project::
+
+  $ python manage.py test lino.modlib.printing
+
+The notification test is skipped unless :mod:`lino.modlib.notify` is
+installed.
+
+"""
+
+from __future__ import unicode_literals
+
+import os
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory
+
+from lino.api import dd, rt
+from lino.modlib.printing.actions import CachedPrintAction, get_print_pool
+from lino.utils.djangotest import RemoteAuthTestCase
+from lino.utils.media import TmpMediaFile
+
+
+def get_site_title(i):
+    # runs in a worker process of get_print_pool()
+    return settings.SITE.title
+
+
+class PrintMultipleTest(RemoteAuthTestCase):
+
+    def setUp(self):
+        super(PrintMultipleTest, self).setUp()
+        self.robin = self.create_obj(
+            settings.SITE.user_model, username='robin',
+            profile=rt.models.users.UserTypes.admin)
+
+    def get_request(self):
+        ar = rt.models.users.Users.request(user=self.robin)
+        ar.request = RequestFactory().get('/', REMOTE_ADDR='127.0.0.1')
+        return ar
+
+    def test_tmp_media_file(self):
+        ar = self.get_request()
+        self.assertEqual(TmpMediaFile(ar, 'pdf').name,
+                         TmpMediaFile(ar, 'pdf').name)
+        a = TmpMediaFile(ar, 'pdf', unique=True)
+        b = TmpMediaFile(ar, 'pdf', unique=True)
+        self.assertNotEqual(a.name, b.name)
+        self.assertEqual(os.path.dirname(a.name), os.path.dirname(b.name))
+        self.assertTrue(a.url.endswith('.pdf'))
+
+    @skipUnless(settings.SITE.is_installed('notify'), "requires notify")
+    def test_background_message(self):
+        """Every background job notifies its user, even when an earlier
+        notification has not yet been seen.
+
+        """
+        robin = self.robin
+        ar = self.get_request()
+        printed = []
+
+        def print_multiple(ar, qs, mf=None):
+            printed.append(mf.name)
+            return mf
+
+        action = CachedPrintAction()
+        action.print_multiple = print_multiple
+        for i in range(2):
+            mf = TmpMediaFile(ar, 'pdf', unique=True)
+            action.print_in_background(robin, 'en', [], mf)
+
+        self.assertEqual(len(set(printed)), 2)
+        Message = rt.models.notify.Message
+        qs = Message.objects.filter(user=robin).order_by('id')
+        self.assertEqual(qs.count(), 2)
+        for msg, fn in zip(qs, printed):
+            self.assertIn(os.path.basename(fn), msg.body)
+
+    @skipUnless(settings.SITE.is_installed('notify'), "requires notify")
+    def test_background_failure(self):
+        """The user gets notified when a background job fails.  The
+        database connection of the caller remains open.
+
+        """
+        ar = self.get_request()
+        closed = []
+
+        def print_multiple(ar, qs, mf=None):
+            raise Exception("Template not found")
+
+        action = CachedPrintAction()
+        action.print_multiple = print_multiple
+        connection.close = lambda: closed.append(True)
+        try:
+            action.print_in_background(
+                self.robin, 'en', [], TmpMediaFile(ar, 'pdf', unique=True))
+        finally:
+            del connection.close
+        self.assertEqual(closed, [])
+        msg = rt.models.notify.Message.objects.get(user=self.robin)
+        self.assertIn("Failed to print", msg.subject)
+        self.assertIn("Template not found", msg.body)
+
+    def test_print_pool(self):
+        """The worker processes have their own Lino site and are reused
+        by subsequent print jobs.
+
+        """
+        plugin = dd.plugins.printing
+        old = plugin.print_workers
+        plugin.configure(print_workers=2)
+        try:
+            pool = get_print_pool()
+        finally:
+            plugin.configure(print_workers=old)
+        self.assertIs(get_print_pool(), pool)
+        titles = pool.map(get_site_title, range(2))
+        self.assertEqual(titles, [settings.SITE.title] * 2)
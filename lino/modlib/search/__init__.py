@@ -0,0 +1,54 @@
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Adds a search index which makes quick searches fast on big tables.
+
+Without this plugin, a quick search (see
+:meth:`quick_search_filter
+<lino.core.model.Model.quick_search_filter>`) does a
+case-insensitive ``LIKE '%text%'`` on every field of
+:attr:`quick_search_fields
+<lino.core.model.Model.quick_search_fields>`, which causes a
+sequential scan of the table.
+
+This plugin maintains a table of the trigrams (sequences of three
+characters) found in the quick search fields of every object of the
+:attr:`indexed_models <Plugin.indexed_models>`.  A quick search on
+these models then considers only the objects having all trigrams of
+the search text.
+
+The index is updated automatically when an object is saved or
+deleted.  Use the :manage:`rebuild_search_index` command after
+activating the plugin, after changing the :attr:`quick_search_fields
+<lino.core.model.Model.quick_search_fields>` of an indexed model or
+after updating the database using queryset methods (which don't send
+any signals).
+
+.. autosummary::
+   :toctree:
+
+    models
+    management.commands.rebuild_search_index
+
+"""
+
+from lino.api import ad, _
+
+
+class Plugin(ad.Plugin):
+    """See :doc:`/dev/plugins`.
+
+    """
+    verbose_name = _("Search index")
+
+    needs_plugins = ['lino.modlib.gfks']
+
+    indexed_models = None
+    """A string with a space-separated list of the models for which
+    to maintain a search index, e.g. ``"contacts.Partner
+    contacts.Person"``.
+
+    Note that for models using multi-table inheritance, every model
+    used for quick searches must be listed explicitly.
+
+    """
@@ -0,0 +1,44 @@
+# -*- coding: UTF-8 -*-
+# Copyright 2016 by Luc Saffre.
+# License: BSD, see LICENSE for more details.
+"""Defines the :manage:`rebuild_search_index` management command:
+
+.. management_command:: rebuild_search_index
+
+
+.. py2rst::
+
+  from lino.modlib.search.management.commands.rebuild_search_index \
+      import Command
+  print(Command.help)
+
+
+"""
+
+from __future__ import unicode_literals, print_function
+
+from django.core.management.base import BaseCommand
+
+from lino.api import rt
+from lino.modlib.search.models import rebuild_search_index
+
+
+class Command(BaseCommand):
+    args = "[app1.Model1] [app2.Model2] ..."
+    help = """
+
+    Rebuild the search index of the quick search fields.
+
+    If no arguments are given, rebuild it for all indexed models.
+    Otherwise every positional argument is expected to be a model
+    name in the form `app_label.ModelName`, and only these models
+    are being indexed.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*')
+
+    def handle(self, *args, **options):
+        models = [rt.modules.resolve(name) for name in options['models']]
+        rebuild_search_index(*models)
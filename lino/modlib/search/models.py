@@ -0,0 +1,234 @@
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""The :xfile:`models.py` module for `lino.modlib.search`.
+
+"""
+
+from __future__ import unicode_literals, print_function
+from builtins import str
+from builtins import object
+
+import logging
+logger = logging.getLogger(__name__)
+
+from django.conf import settings
+from django.db import models
+
+from lino.api import dd, rt, _
+from lino.utils.mldbc.fields import BabelCharField, BabelTextField
+from lino.core.utils import iter_chunks
+
+
+class SearchToken(dd.Model):
+    """A trigram found in the quick search fields of a database object
+    of some indexed model.
+
+    """
+    class Meta(object):
+        app_label = 'search'
+        verbose_name = _("Search token")
+        verbose_name_plural = _("Search tokens")
+        index_together = [('owner_type', 'token'),
+                          ('owner_type', 'owner_id')]
+
+    owner_type = dd.ForeignKey('contenttypes.ContentType')
+    owner_id = models.PositiveIntegerField()
+    token = models.CharField(max_length=3)
+
+
+def get_trigrams(text):
+    """Return the set of trigrams of the given text.  The text is
+    converted to lower case.
+
+    """
+    text = text.lower()
+    return set([text[i:i + 3] for i in range(len(text) - 2)])
+
+
+class SearchIndex(object):
+    """The search index of a given model.  An instance of this is
+    stored as :attr:`quick_search_index
+    <lino.core.model.Model.quick_search_index>` on every indexed
+    model.
+
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._fields = None
+
+    def get_owner_type(self):
+        return rt.modules.contenttypes.ContentType.objects.get_for_model(
+            self.model)
+
+    def get_indexed_fields(self):
+        """Return the list of database fields whose content is indexed.
+        These are the :attr:`quick_search_fields
+        <lino.core.model.Model.quick_search_fields>` of the model, plus
+        the language variants of babel fields.
+
+        """
+        if self._fields is None:
+            lst = []
+            meta = self.model._meta
+            for fn in self.model.quick_search_fields:
+                fld = meta.get_field(fn)
+                lst.append(fld)
+                if isinstance(fld, (BabelCharField, BabelTextField)):
+                    for lng in settings.SITE.BABEL_LANGS:
+                        lst.append(meta.get_field(fn + '_' + lng.name))
+            self._fields = lst
+        return self._fields
+
+    def get_trigrams(self, obj):
+        """Return the set of trigrams for the given database object.
+
+        The trigrams are computed from the values as they are stored
+        in the database (which is what the default quick search filter
+        compares with), not from their Python representation.  For
+        example the value of a :class:`ChoiceListField
+        <lino.core.choicelists.ChoiceListField>` is indexed by its
+        `value`, not by its text.
+
+        """
+        tokens = set()
+        for fld in self.get_indexed_fields():
+            v = fld.get_prep_value(fld.value_from_object(obj))
+            if v:
+                tokens |= get_trigrams(str(v))
+        return tokens
+
+    def make_tokens(self, ct, obj):
+        return [SearchToken(owner_type=ct, owner_id=obj.pk, token=t)
+                for t in self.get_trigrams(obj)]
+
+    def update_object(self, obj):
+        """Update the index entries of the given database object."""
+        ct = self.get_owner_type()
+        SearchToken.objects.filter(owner_type=ct, owner_id=obj.pk).delete()
+        SearchToken.objects.bulk_create(self.make_tokens(ct, obj))
+
+    def delete_object(self, obj):
+        ct = self.get_owner_type()
+        SearchToken.objects.filter(owner_type=ct, owner_id=obj.pk).delete()
+
+    def rebuild(self):
+        """Rebuild the whole index of this model.  Return the number of
+        indexed objects.
+
+        """
+        ct = self.get_owner_type()
+        SearchToken.objects.filter(owner_type=ct).delete()
+        count = 0
+        for chunk in iter_chunks(self.model.objects.all()):
+            tokens = []
+            for obj in chunk:
+                tokens += self.make_tokens(ct, obj)
+            SearchToken.objects.bulk_create(tokens)
+            count += len(chunk)
+        return count
+
+    def get_filter(self, model, search_text, prefix=''):
+        """Return a filter expression which selects only the objects
+        having all the trigrams of the given search text, or `None`
+        if the index cannot be used for this search.
+
+        The returned filter is a superset of the objects matching the
+        default quick search filter, with which it gets combined by
+        :meth:`quick_search_filter
+        <lino.core.model.Model.quick_search_filter>`.
+
+        """
+        if model is not self.model:
+            # e.g. an MTI child having other quick search fields
+            return None
+        tokens = get_trigrams(search_text)
+        if not tokens:
+            return None
+        qs = SearchToken.objects.filter(
+            owner_type=self.get_owner_type(), token__in=tokens)
+        qs = qs.values('owner_id').annotate(
+            num=models.Count('token', distinct=True))
+        qs = qs.filter(num=len(tokens)).values_list('owner_id', flat=True)
+        return models.Q(**{prefix + 'pk__in': qs})
+
+
+def get_indexed_models():
+    """Return a list of the models mentioned in :attr:`indexed_models
+    <lino.modlib.search.Plugin.indexed_models>`.
+
+    """
+    names = dd.plugins.search.indexed_models
+    if not names:
+        return []
+    return [rt.modules.resolve(name) for name in names.split()]
+
+
+_indexed_senders = dict()
+
+
+def get_indexes(sender):
+    """Return the search indexes to update when an object of the given
+    model gets saved or deleted.  These are the indexes of the model
+    itself and of its MTI parents.
+
+    """
+    try:
+        return _indexed_senders[sender]
+    except KeyError:
+        pass
+    lst = []
+    for m in [sender] + list(sender._meta.get_parent_list()):
+        idx = m.__dict__.get('quick_search_index')
+        if idx is not None:
+            lst.append(idx)
+    _indexed_senders[sender] = lst
+    return lst
+
+
+def update_search_index(sender, instance=None, **kw):
+    for idx in get_indexes(sender):
+        idx.update_object(instance)
+
+
+def delete_search_index(sender, instance=None, **kw):
+    for idx in get_indexes(sender):
+        idx.delete_object(instance)
+
+
+@dd.receiver(dd.post_analyze)
+def setup_search_indexes(sender, models_list=None, **kw):
+    """Install a :class:`SearchIndex` on every indexed model and connect
+    the signal handlers which keep them up to date.
+
+    """
+    for m in get_indexed_models():
+        m.quick_search_index = SearchIndex(m)
+    # the indexed models and their MTI children
+    for m in models_list:
+        if not get_indexes(m):
+            continue
+        name = dd.full_model_name(m)
+        models.signals.post_save.connect(
+            update_search_index, sender=m,
+            dispatch_uid='search_update_index_' + name)
+        models.signals.post_delete.connect(
+            delete_search_index, sender=m,
+            dispatch_uid='search_delete_index_' + name)
+
+
+def rebuild_search_index(*models):
+    """Rebuild the search index for the given models (by default all
+    indexed models).
+
+    """
+    if not models:
+        models = get_indexed_models()
+    for m in models:
+        idx = m.__dict__.get('quick_search_index')
+        if idx is None:
+            raise Exception("{0} has no search index".format(
+                dd.full_model_name(m)))
+        count = idx.rebuild()
+        logger.info("Indexed %d %s.", count, m._meta.verbose_name_plural)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+
+"""Tests for :mod:`lino.modlib.search`.  Run them from a project which
+has this plugin installed::
+
+  $ python manage.py test lino.modlib.search
+
+"""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+from lino.api import rt
+from lino.utils.djangotest import RemoteAuthTestCase
+from lino.modlib.search.models import SearchIndex
+
+
+class SearchIndexTest(RemoteAuthTestCase):
+
+    def setUp(self):
+        super(SearchIndexTest, self).setUp()
+        self.model = settings.SITE.user_model
+        self.saved_index = self.model.__dict__.get('quick_search_index')
+        self.model.quick_search_index = SearchIndex(self.model)
+
+    def tearDown(self):
+        self.model.quick_search_index = self.saved_index
+        super(SearchIndexTest, self).tearDown()
+
+    def search(self, text, indexed=True):
+        model = self.model
+        idx = model.quick_search_index
+        if not indexed:
+            model.quick_search_index = None
+        try:
+            qs = model.objects.filter(model.quick_search_filter(text))
+            return set(qs.values_list('username', flat=True))
+        finally:
+            model.quick_search_index = idx
+
+    def test_stored_values(self):
+        """The index contains the values as stored in the database.  For
+        example the `profile` of a user is a :class:`ChoiceListField
+        <lino.core.choicelists.ChoiceListField>` whose text
+        ("Anonymous") differs from the stored value ("000").
+
+        """
+        UserTypes = rt.modules.users.UserTypes
+        create = self.create_obj
+        create(self.model, username='robin', first_name="Robin",
+               profile=UserTypes.admin)
+        create(self.model, username='anon', first_name="Anna",
+               profile=UserTypes.anonymous)
+        self.assertEqual(self.model.quick_search_index.rebuild(), 2)
+
+        self.assertEqual(self.search('000', False), set(['anon']))
+        self.assertEqual(self.search('000'), set(['anon']))
+        self.assertEqual(self.search('nonymous', False), set())
+        self.assertEqual(self.search('nonymous'), set())
+
+        for text in ('obi', 'ROB', 'Anna', 'nn', 'xyz'):
+            self.assertEqual(
+                self.search(text), self.search(text, False), text)
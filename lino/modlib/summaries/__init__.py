@@ -41,4 +41,5 @@ class Plugin(ad.Plugin):
         g = site.plugins.system
         m = m.add_menu(g.app_label, g.verbose_name)
         m.add_action('system.SiteConfig', 'check_summaries')
+        m.add_action('system.SiteConfig', 'refresh_summaries')
 
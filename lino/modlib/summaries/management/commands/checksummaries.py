@@ -35,9 +35,21 @@ class Command(BaseCommand):
     expected to be a model name in the form `app_label.ModelName`, and
     only these models are being updated.
 
+    With `--dirty`, update only the summary data which has been marked
+    as dirty since the last run.
+
     """
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dirty', action='store_true', dest='dirty',
+            default=False,
+            help="Update only the summary data marked as dirty.")
+
     def handle(self, *args, **options):
         ses = rt.login()
-        ses.run(settings.SITE.site_config.check_summaries)
+        if options['dirty']:
+            ses.run(settings.SITE.site_config.refresh_summaries)
+        else:
+            ses.run(settings.SITE.site_config.check_summaries)
         # checksummaries(args=args)
@@ -13,6 +13,25 @@ from builtins import object
 from django.db import models
 
 from lino.api import dd, _
+from lino.core.utils import iter_chunks
+from lino.core.tableversions import bump_table_versions
+
+
+class DateExtract(models.Func):
+    """Extract the year or the month from a date.  Django 1.9 has no
+    `ExtractYear` and `ExtractMonth` functions, so we use the
+    backend's `date_extract_sql()` directly.
+
+    """
+    def __init__(self, expression, lookup_name, **extra):
+        self.lookup_name = lookup_name
+        extra.setdefault('output_field', models.IntegerField())
+        super(DateExtract, self).__init__(expression, **extra)
+
+    def as_sql(self, compiler, connection):
+        sql, params = compiler.compile(self.source_expressions[0])
+        sql = connection.ops.date_extract_sql(self.lookup_name, sql)
+        return sql, params
 
 
 class ComputeResults(dd.Action):
@@ -111,16 +130,180 @@ class Summary(dd.Model):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def get_summary_aggregates(cls):
+        """Optionally yield a sequence of ``(qs, master_field,
+        date_field, aggregates)`` tuples which express the collectors
+        of this summary as aggregate expressions.
+
+        `qs` is the queryset of source rows, `master_field` the name
+        of the field (or lookup path) pointing from a source row to
+        the summary master, `date_field` the name (or lookup path) of
+        a date field which decides the period of a source row, and
+        `aggregates` a `dict` mapping names of summary fields to
+        aggregate expressions (e.g. ``dict(count=models.Count('id'))``).
+
+        If this returns `None` (the default), Lino uses
+        :meth:`get_summary_collectors`. Otherwise it uses
+        :meth:`update_for_masters` which fills all summary rows using
+        a few GROUP BY queries.
+
+        """
+        return None
+
+    @classmethod
+    def get_summary_sources(cls):
+        """Yield a sequence of ``(model, master_field, date_field)``
+        tuples which describe the source models of this summary.
+        Lino uses this to mark summary rows as dirty when a source
+        row gets saved or deleted (see :class:`DirtySummary
+        <lino.modlib.summaries.models.DirtySummary>`).
+
+        The default implementation returns the sources of
+        :meth:`get_summary_aggregates`.  Summaries which use
+        :meth:`get_summary_collectors` must override this if they
+        want incremental updates.
+
+        """
+        aggregates = cls.get_summary_aggregates()
+        if aggregates is None:
+            return
+        for qs, master_field, date_field, agg in aggregates:
+            yield qs.model, master_field, date_field
+
+    @classmethod
+    def get_period_for_date(cls, date):
+        """Return the ``(year, month)`` tuple of the period which
+        contains the given date.
+
+        """
+        if cls.summary_period == 'yearly':
+            return date.year, None
+        return date.year, date.month
+
     @classmethod
     def get_summary_masters(cls):
         return cls.get_summary_master_model().objects.all()
         
     @classmethod
     def update_for_master(cls, master):
+        if cls.get_summary_aggregates() is not None:
+            cls.update_for_masters([master])
+            return
         for year, month in cls.get_summary_periods():
             obj = cls.get_for_period(master, year, month)
             obj.compute_summary_values()
-                
+
+    @classmethod
+    def update_for_masters(cls, masters=None, periods=None):
+        """Update the summary rows of the given `masters` (default is
+        :meth:`get_summary_masters`) for the given `periods` (a
+        sequence of ``(year, month)`` tuples, default is
+        :meth:`get_summary_periods`).
+
+        For summaries which don't define
+        :meth:`get_summary_aggregates` this just calls
+        :meth:`update_for_master` for every master. Otherwise the
+        masters are processed in chunks of
+        :attr:`data_chunk_size <lino.core.site.Site.data_chunk_size>`,
+        running one GROUP BY query per aggregate specification and
+        chunk. New summary rows are inserted using `bulk_create`,
+        existing rows are updated only when some value has changed.
+        Note that this does not call :meth:`full_clean` on the summary
+        rows.
+
+        """
+        if masters is None:
+            masters = cls.get_summary_masters()
+        if cls.get_summary_aggregates() is None:
+            for master in masters:
+                if periods is None:
+                    cls.update_for_master(master)
+                else:
+                    for year, month in periods:
+                        obj = cls.get_for_period(master, year, month)
+                        obj.compute_summary_values()
+            return
+        if periods is None:
+            periods = list(cls.get_summary_periods())
+        else:
+            periods = list(periods)
+        if len(periods) == 0:
+            return
+        for chunk in iter_chunks(masters):
+            cls.bulk_update_summaries(
+                [m.pk if isinstance(m, models.Model) else m
+                 for m in chunk], periods)
+
+    @classmethod
+    def bulk_update_summaries(cls, master_ids, periods):
+        """Set-based implementation of :meth:`update_for_masters` for the
+        given list of master primary keys.
+
+        """
+        years = set([year for year, month in periods])
+        yearly = cls.summary_period == 'yearly'
+        values = dict()  # (master_id, year, month) -> {field: value}
+        fieldnames = set()
+        for qs, master_field, date_field, aggregates in \
+                cls.get_summary_aggregates():
+            fieldnames |= set(aggregates.keys())
+            qs = qs.filter(**{
+                master_field + '__in': master_ids,
+                date_field + '__year__gte': min(years),
+                date_field + '__year__lte': max(years)})
+            qs = qs.annotate(summary_year=DateExtract(date_field, 'year'))
+            group_by = [master_field, 'summary_year']
+            if not yearly:
+                qs = qs.annotate(
+                    summary_month=DateExtract(date_field, 'month'))
+                group_by.append('summary_month')
+            qs = qs.order_by().values(*group_by).annotate(**aggregates)
+            for row in qs:
+                if yearly:
+                    month = None
+                else:
+                    month = row['summary_month']
+                key = (row[master_field], row['summary_year'], month)
+                d = values.setdefault(key, dict())
+                for k in aggregates.keys():
+                    d[k] = row[k]
+
+        existing = dict()
+        qs = cls.objects.filter(master_id__in=master_ids, year__in=years)
+        for obj in qs.order_by('pk'):
+            key = (obj.master_id, obj.year, obj.month)
+            if key in existing:
+                # Theoretically this should never happen. There cannot
+                # be more than one object for a given master and period.
+                obj.delete()
+            else:
+                existing[key] = obj
+
+        to_create = []
+        for master_id in master_ids:
+            for year, month in periods:
+                key = (master_id, year, month)
+                obj = existing.get(key)
+                if obj is None:
+                    obj = cls(master_id=master_id, year=year, month=month)
+                    obj.reset_summary_data()
+                    for k, v in values.get(key, {}).items():
+                        setattr(obj, k, v)
+                    to_create.append(obj)
+                    continue
+                old = dict([(k, getattr(obj, k)) for k in fieldnames])
+                obj.reset_summary_data()
+                for k, v in values.get(key, {}).items():
+                    setattr(obj, k, v)
+                new = dict([(k, getattr(obj, k)) for k in fieldnames])
+                if new != old:
+                    cls.objects.filter(pk=obj.pk).update(**new)
+        if len(to_create):
+            cls.objects.bulk_create(to_create)
+        # update() and bulk_create() don't send any signals
+        bump_table_versions(cls)
+
     def reset_summary_data(self):
         pass
 
@@ -128,6 +311,10 @@ class Summary(dd.Model):
         return []
 
     def compute_summary_values(self):
+        if self.get_summary_aggregates() is not None:
+            self.__class__.update_for_masters(
+                [self.master_id], [(self.year, self.month)])
+            return
         self.reset_summary_data()
         for collector, qs in self.get_summary_collectors():
             for obj in qs:
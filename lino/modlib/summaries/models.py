@@ -6,27 +6,74 @@
 """
 
 from __future__ import unicode_literals, print_function
+from builtins import object
 
 from django.conf import settings
+from django.db import models, transaction
 from lino.api import dd, rt, _
+from lino.core.utils import iter_chunks
 
 from .mixins import UpdateSummariesByMaster, Summary
 
 
+class DirtySummary(dd.Model):
+    """Marks the summary data of a given master and period as needing
+    to be recomputed.
+
+    Lino creates these automatically when a row of some source model
+    (see :meth:`get_summary_sources
+    <lino.modlib.summaries.mixins.Summary.get_summary_sources>`) is
+    saved or deleted.  They are consumed by :func:`update_dirty_summaries`.
+    Note that queryset-level updates and deletes don't send any
+    signals and therefore don't mark anything as dirty.
+
+    """
+    class Meta(object):
+        app_label = 'summaries'
+        verbose_name = _("Dirty summary")
+        verbose_name_plural = _("Dirty summaries")
+
+    summary_model = models.CharField(_("Summary model"), max_length=100)
+    master_pk = models.IntegerField(_("Master"))
+    year = models.IntegerField(_("Year"))
+    month = models.IntegerField(_("Month"), null=True, blank=True)
+
+
 class CheckSummaries(dd.Action):
     """Web UI version of :manage:`checksummaries`. See there."""
     label = _("Update all summary data")
 
+    only_dirty = False
+    """Whether to update only the summary data which has been marked
+    as dirty.  This has no effect on summaries which don't define any
+    :meth:`get_summary_sources
+    <lino.modlib.summaries.mixins.Summary.get_summary_sources>`.
+
+    """
+
     def run_from_ui(self, ar, fix=None):
         for mm, summary_models in list(get_summary_models().items()):
             for sm in summary_models:
-                dd.logger.info("Updating %s ...", sm._meta.verbose_name_plural)
-                for master in sm.get_summary_masters():
-                    sm.update_for_master(master)
+                if self.only_dirty and has_summary_sources(sm):
+                    dd.logger.info(
+                        "Updating dirty %s ...",
+                        sm._meta.verbose_name_plural)
+                    update_dirty_summaries(sm)
+                else:
+                    dd.logger.info(
+                        "Updating %s ...", sm._meta.verbose_name_plural)
+                    sm.update_for_masters()
                 
         ar.set_response(refresh=True)
 
+
+class RefreshSummaries(CheckSummaries):
+    """Update only the summary data which has been marked as dirty."""
+    label = _("Update dirty summary data")
+    only_dirty = True
+
 dd.inject_action('system.SiteConfig', check_summaries=CheckSummaries())
+dd.inject_action('system.SiteConfig', refresh_summaries=RefreshSummaries())
 
 
 @dd.receiver(dd.pre_analyze)
@@ -42,6 +89,18 @@ def set_summary_actions(sender, **kw):
             check_summaries=UpdateSummariesByMaster(mm, summary_models))
 
 
+@dd.receiver(dd.post_analyze)
+def connect_summary_sources(sender, **kw):
+    """Connect the signal handlers which mark summary data as dirty
+    when a source row is saved or deleted.
+
+    """
+    for mm, summary_models in list(get_summary_models().items()):
+        for sm in summary_models:
+            for model, master_field, date_field in sm.get_summary_sources():
+                SummarySource(sm, model, master_field, date_field).connect()
+
+
 def get_summary_models():
     """Return a `dict` mapping each model which has at least one summary
     to a list of these summaries.
@@ -55,6 +114,127 @@ def get_summary_models():
     return summary_masters
 
 
+def has_summary_sources(sm):
+    for src in sm.get_summary_sources():
+        return True
+    return False
+
+
+def get_lookup_value(obj, path):
+    """Return the value of the given lookup path (e.g. ``'client'`` or
+    ``'client__partner'``) for the given database object.  For a
+    foreign key this returns the primary key of the pointed object.
+
+    """
+    parts = path.split('__')
+    for name in parts[:-1]:
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return None
+    fld = obj._meta.get_field(parts[-1])
+    return getattr(obj, fld.attname, None)
+
+
+class SummarySource(object):
+    """Marks the summary data of a given summary model as dirty when a
+    row of the given source model is saved or deleted.
+
+    """
+    def __init__(self, summary_model, model, master_field, date_field):
+        self.summary_model = summary_model
+        self.summary_name = dd.full_model_name(summary_model)
+        self.model = model
+        self.master_field = master_field
+        self.date_field = date_field
+
+    def connect(self):
+        models.signals.pre_save.connect(
+            self.pre_save, sender=self.model, weak=False)
+        models.signals.post_save.connect(
+            self.post_save, sender=self.model, weak=False)
+        models.signals.post_delete.connect(
+            self.post_delete, sender=self.model, weak=False)
+
+    def get_pair(self, master_pk, date):
+        if master_pk is None or date is None:
+            return None
+        year, month = self.summary_model.get_period_for_date(date)
+        return (master_pk, year, month)
+
+    def pre_save(self, sender, instance=None, **kw):
+        # remember the old values because a changed master or date
+        # makes two periods dirty.
+        instance._summary_old_pairs = pairs = getattr(
+            instance, '_summary_old_pairs', dict())
+        if instance.pk is None:
+            return
+        qs = self.model.objects.filter(pk=instance.pk)
+        old = qs.values_list(self.master_field, self.date_field).first()
+        if old is not None:
+            pairs[self] = self.get_pair(*old)
+
+    def post_save(self, sender, instance=None, **kw):
+        pairs = getattr(instance, '_summary_old_pairs', dict())
+        self.mark_dirty(
+            pairs.pop(self, None),
+            self.get_pair(
+                get_lookup_value(instance, self.master_field),
+                get_lookup_value(instance, self.date_field)))
+
+    def post_delete(self, sender, instance=None, **kw):
+        self.mark_dirty(self.get_pair(
+            get_lookup_value(instance, self.master_field),
+            get_lookup_value(instance, self.date_field)))
+
+    def mark_dirty(self, *pairs):
+        DirtySummary = rt.models.summaries.DirtySummary
+        done = set()
+        for pair in pairs:
+            if pair is None or pair in done:
+                continue
+            done.add(pair)
+            master_pk, year, month = pair
+            DirtySummary(
+                summary_model=self.summary_name, master_pk=master_pk,
+                year=year, month=month).save()
+
+
+def update_dirty_summaries(sm):
+    """Update the summary data of the given summary model for all
+    masters and periods which have been marked as dirty, then remove
+    these marks.  Return the number of marks that have been processed.
+
+    The summaries of every period are updated in a transaction which
+    also removes the marks of that period, so that the marks survive a
+    failing update.  Marks added while the update is running are kept.
+
+    """
+    qs = DirtySummary.objects.filter(summary_model=dd.full_model_name(sm))
+    rows = list(qs.values_list('pk', 'master_pk', 'year', 'month'))
+    if len(rows) == 0:
+        return 0
+    periods = set(sm.get_summary_periods())
+    by_period = dict()
+    obsolete = []
+    for pk, master_pk, year, month in rows:
+        if (year, month) in periods:
+            masters, marks = by_period.setdefault(
+                (year, month), (set(), []))
+            masters.add(master_pk)
+            marks.append(pk)
+        else:
+            obsolete.append(pk)
+    for period, (master_pks, marks) in list(by_period.items()):
+        with transaction.atomic():
+            masters = sm.get_summary_masters().filter(pk__in=master_pks)
+            sm.update_for_masters(masters, [period])
+            for chunk in iter_chunks(marks):
+                DirtySummary.objects.filter(pk__in=chunk).delete()
+    for chunk in iter_chunks(obsolete):
+        DirtySummary.objects.filter(pk__in=chunk).delete()
+    return len(rows)
+
+
 @dd.schedule_daily()
 def checksummaries():
-    rt.login().run(settings.SITE.site_config.check_summaries)
+    rt.login().run(settings.SITE.site_config.refresh_summaries)
@@ -134,6 +134,7 @@ lino.modlib.dashboard
 lino.modlib.database_ready
 lino.modlib.davlink
 lino.modlib.export_excel
+lino.modlib.export_excel.tests
 lino.modlib.extjs
 lino.modlib.gfks
 lino.modlib.gfks.fixtures
@@ -144,17 +145,24 @@ lino.modlib.languages.fixtures
 lino.modlib.lino_startup
 lino.modlib.lino_startup.management
 lino.modlib.lino_startup.management.commands
+lino.modlib.lino_startup.tests
 lino.modlib.office
 lino.modlib.plausibility
 lino.modlib.plausibility.fixtures
 lino.modlib.plausibility.management
 lino.modlib.plausibility.management.commands
 lino.modlib.printing
+lino.modlib.printing.tests
+lino.modlib.search
+lino.modlib.search.management
+lino.modlib.search.management.commands
+lino.modlib.search.tests
 lino.modlib.smtpd
 lino.modlib.smtpd.management
 lino.modlib.smtpd.management.commands
 lino.modlib.notify
 lino.modlib.notify.fixtures
+lino.modlib.notify.tests
 lino.modlib.summaries
 lino.modlib.summaries.fixtures
 lino.modlib.summaries.management
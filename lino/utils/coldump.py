@@ -0,0 +1,239 @@
+# -*- coding: UTF-8 -*-
+# Copyright 2016 by Luc Saffre.
+# License: BSD, see file LICENSE for more details.
+
+"""Reading and writing the column files of a database dump written by
+:manage:`dump2py` with ``--format col``.
+
+Such a dump contains the same :xfile:`restore.py` as a Python dump
+(with its `create_APP_MODEL` functions and its `SOURCE_VERSION`), so
+the data migrations defined by :func:`install_migrations
+<lino.utils.dpy.install_migrations>` work in the same way.  But
+instead of one `.py` file per table it has a directory per table
+containing a file :file:`table.json` and one or two typed binary
+files per column:
+
+- fixed-width columns (``int``, ``bool``, ``date``, ``time`` and
+  ``datetime``) are stored in a :file:`.col` file, one record of a
+  null flag and a little-endian integer per row;
+
+- the other columns (``text``, ``decimal``, ``model`` and ``json``)
+  have a :file:`.idx` file with the (start, length) of every row in
+  the UTF-8 data of their :file:`.dat` file.
+
+These files are gzip compressed unless the dump was written with
+``--no-compress``.  Uncompressed files are memory-mapped when loading.
+
+"""
+
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import io
+import json
+import gzip
+import mmap
+import struct
+import datetime
+import calendar
+
+FIXED_FORMATS = {
+    'int': struct.Struct(str('<Bq')),
+    'bool': struct.Struct(str('<Bb')),
+    'date': struct.Struct(str('<Bi')),
+    'time': struct.Struct(str('<Bi')),
+    'datetime': struct.Struct(str('<Bq')),
+}
+
+INDEX_FORMAT = struct.Struct(str('<qq'))
+
+TEXT_TYPES = ('text', 'decimal', 'model', 'json')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def open_column_file(filename, mode, compress):
+    if compress:
+        return gzip.open(filename + '.gz', mode)
+    return io.open(filename, mode)
+
+
+def read_column_file(filename):
+    """Return the content of a column file, either as a memory map (if
+    the file is not compressed) or as a byte string.
+
+    """
+    if os.path.exists(filename + '.gz'):
+        with gzip.open(filename + '.gz', 'rb') as f:
+            return f.read()
+    with io.open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def value2int(type, value):
+    if type == 'date':
+        return value.toordinal()
+    if type == 'time':
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if type == 'datetime':
+        return calendar.timegm(value.timetuple())
+    return int(value)
+
+
+def int2value(type, value):
+    if type == 'date':
+        return datetime.date.fromordinal(value)
+    if type == 'time':
+        return datetime.time(value // 3600, value // 60 % 60, value % 60)
+    if type == 'datetime':
+        d = EPOCH + datetime.timedelta(seconds=value)
+        return (d.year, d.month, d.day, d.hour, d.minute, d.second)
+    if type == 'bool':
+        return bool(value)
+    return value
+
+
+class ColumnWriter(object):
+    """Writes the values of one column.  The values must be `None` or of
+    the Python type corresponding to the column type (`datetime`
+    values must be naive).
+
+    """
+    def __init__(self, filename, type, compress=True):
+        self.type = type
+        if type in TEXT_TYPES:
+            self.index = open_column_file(filename + '.idx', 'wb', compress)
+            self.data = open_column_file(filename + '.dat', 'wb', compress)
+            self.offset = 0
+        else:
+            self.format = FIXED_FORMATS[type]
+            self.data = open_column_file(filename + '.col', 'wb', compress)
+            self.index = None
+
+    def append(self, value):
+        if self.index is None:
+            if value is None:
+                self.data.write(self.format.pack(1, 0))
+            else:
+                self.data.write(self.format.pack(
+                    0, value2int(self.type, value)))
+        elif value is None:
+            self.index.write(INDEX_FORMAT.pack(self.offset, -1))
+        else:
+            if self.type == 'json':
+                value = json.dumps(value)
+            data = value.encode('utf-8')
+            self.index.write(INDEX_FORMAT.pack(self.offset, len(data)))
+            self.data.write(data)
+            self.offset += len(data)
+
+    def close(self):
+        self.data.close()
+        if self.index is not None:
+            self.index.close()
+
+
+class ColumnReader(object):
+    """Reads the values of one column written by :class:`ColumnWriter`.
+    `date` and `time` values are returned as Python objects,
+    `datetime` values as a tuple `(year, month, day, hour, minute,
+    second)`.
+
+    """
+    def __init__(self, filename, type):
+        self.type = type
+        if type in TEXT_TYPES:
+            self.index = read_column_file(filename + '.idx')
+            self.data = read_column_file(filename + '.dat')
+        else:
+            self.format = FIXED_FORMATS[type]
+            self.data = read_column_file(filename + '.col')
+            self.index = None
+
+    def get(self, i):
+        """Return the value of row number `i`."""
+        if self.index is None:
+            null, v = self.format.unpack_from(self.data, i * self.format.size)
+            if null:
+                return None
+            return int2value(self.type, v)
+        start, length = INDEX_FORMAT.unpack_from(
+            self.index, i * INDEX_FORMAT.size)
+        if length < 0:
+            return None
+        v = bytes(self.data[start:start + length]).decode('utf-8')
+        if self.type == 'json':
+            return json.loads(v)
+        return v
+
+    def close(self):
+        for f in (self.data, self.index):
+            if isinstance(f, mmap.mmap):
+                f.close()
+
+
+class TableWriter(object):
+    """Writes the column files of one table into the directory
+    `dirname`.  `columns` is a list of `(name, type)` tuples.
+
+    """
+    def __init__(self, dirname, columns, compress=True):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.dirname = dirname
+        self.columns = columns
+        self.count = 0
+        self.writers = [
+            ColumnWriter(os.path.join(dirname, name), type, compress)
+            for name, type in columns]
+
+    def append(self, values):
+        for w, v in zip(self.writers, values):
+            w.append(v)
+        self.count += 1
+
+    def close(self, **kw):
+        for w in self.writers:
+            w.close()
+        kw.update(rows=self.count, columns=self.columns)
+        with io.open(os.path.join(self.dirname, 'table.json'), 'wb') as f:
+            f.write(json.dumps(kw, indent=1).encode('utf-8'))
+
+
+def load_table(loader, globals_dict, db_table):
+    """Load the rows of the given table of a column dump using the
+    `create_DB_TABLE` function of the given :xfile:`restore.py`
+    namespace.  Called from the :xfile:`restore.py` of a column dump.
+
+    """
+    dirname = os.path.join(
+        os.path.dirname(globals_dict['__file__']), db_table)
+    with io.open(os.path.join(dirname, 'table.json'), 'rb') as f:
+        meta = json.loads(f.read().decode('utf-8'))
+    if meta.get('error'):
+        raise Exception(
+            "The data of table {0} has not been dumped because an "
+            "error {1} occured.".format(db_table, meta['error']))
+    globals_dict['logger'].info(
+        "Loading %d objects to table %s...", meta['rows'], db_table)
+    readers = [ColumnReader(os.path.join(dirname, name), type)
+               for name, type in meta['columns']]
+    dt = globals_dict['dt']
+    create = globals_dict['create_' + db_table]
+    for i in range(meta['rows']):
+        values = []
+        for r in readers:
+            v = r.get(i)
+            if v is not None:
+                if r.type == 'datetime':
+                    v = dt(*v)
+                elif r.type == 'model':
+                    v = globals_dict.get(v)
+            values.append(v)
+        loader.save(create(*values))
+    for r in readers:
+        r.close()
+    loader.flush_deferred_objects()
@@ -21,6 +21,7 @@ logger = logging.getLogger(__name__)
 
 from io import StringIO
 import os
+import sys
 from os.path import dirname
 import imp
 from decimal import Decimal
@@ -34,6 +35,8 @@ from django.db.models import ForeignKey
 from django.utils.module_loading import import_string
 
 from django.db import IntegrityError
+from django.db import connection, transaction
+from django.core.management.color import no_style
 from django.db.models.fields import NOT_PROVIDED
 from django.core.serializers import base
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
@@ -43,6 +46,7 @@ from django.utils import translation
 from lino.utils.mldbc.fields import BabelCharField, BabelTextField
 from lino.core.choicelists import ChoiceListField
 from lino.core.utils import obj2str, sorted_models_list, full_model_name
+from lino.core.tableversions import bump_table_versions
 
 SUFFIX = '.py'
 
@@ -115,11 +119,27 @@ class FakeDeserializedObject(base.DeserializedObject):
 
     """
 
+    prepared = False
+
     def __init__(self, deserializer, object):
         self.object = object
         # self.name = name
         self.deserializer = deserializer
 
+    def prepare(self):
+        """Call the `before_dumpy_save` method of the object (if it has
+        one).  Do it only once, even when the object gets saved more
+        than once (e.g. after a failed bulk insert or when it had been
+        deferred).
+
+        """
+        if self.prepared:
+            return
+        m = getattr(self.object, 'before_dumpy_save', None)
+        if m is not None:
+            m()
+        self.prepared = True
+
     def save(self, *args, **kw):
         """
         """
@@ -139,11 +159,7 @@ class FakeDeserializedObject(base.DeserializedObject):
         """
         obj = self.object
         try:
-            """
-            """
-            m = getattr(obj, 'before_dumpy_save', None)
-            if m is not None:
-                m()
+            self.prepare()
             if not self.deserializer.quick:
                 try:
                     obj.full_clean()
@@ -232,9 +248,16 @@ class LoaderBase(object):
             self.save_later = {}
             self.saved = 0
             for obj in try_again:
-                obj.try_save()  # ,*args,**kw):
+                self.try_save(obj)
             logger.info("Saved %d objects.", self.saved)
 
+    def try_save(self, obj):
+        """Try to save the given :class:`FakeDeserializedObject`.  Return
+        `True` on success, `False` if it has been deferred.
+
+        """
+        return obj.try_save()
+
     def expand(self, obj):
         if obj is None:
             pass  # ignore None values
@@ -325,17 +348,131 @@ data."""
 class DpyLoader(LoaderBase):
     """Instantiated by :xfile:`restore.py`.
 
+    If `quick` is True, the dump is trusted: the objects are not
+    validated, consecutive objects of a same model are inserted using
+    `bulk_create` in batches of
+    :attr:`lino.core.site.Site.data_chunk_size`, and the whole restore
+    runs in a single transaction with foreign key checks deferred
+    until :meth:`finalize`.  A batch which fails is saved object by
+    object.  Objects of MTI children are always saved one by one.
+
+    Note that `bulk_create` doesn't call the `save` methods nor send
+    the `pre_save` and `post_save` signals.
+
     """
-    def __init__(self, globals_dict):
+    def __init__(self, globals_dict, quick=False):
         self.globals_dict = globals_dict
         super(DpyLoader, self).__init__()
+        self.quick = quick
+        self.batch = []
+        self.loaded_models = set()
+        self._transaction = None
+        self._constraints_disabled = False
         site = globals_dict['settings'].SITE
         site.startup()
         site.install_migrations(self)
 
     def save(self, obj):
         for o in self.expand(obj):
-            o.try_save()
+            if self.quick:
+                self.add_to_batch(o)
+            else:
+                self.try_save(o)
+
+    def add_to_batch(self, o):
+        model = o.object.__class__
+        self.loaded_models.add(model)
+        if model._meta.parents:
+            # Django cannot bulk create MTI children
+            self.flush_batch()
+            self.try_save(o)
+            return
+        if self.batch and self.batch[0].object.__class__ is not model:
+            self.flush_batch()
+        self.batch.append(o)
+        if len(self.batch) >= settings.SITE.data_chunk_size:
+            self.flush_batch()
+
+    def flush_batch(self):
+        """Insert the objects of the current batch using a single
+        `bulk_create`.  If this fails, save them one by one.
+
+        """
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        model = batch[0].object.__class__
+        for o in batch:
+            o.prepare()
+        try:
+            with transaction.atomic():
+                model._default_manager.bulk_create(
+                    [o.object for o in batch])
+        except Exception as e:
+            logger.info("Failed to bulk create %d %s (%s). "
+                        "Saving them one by one.", len(batch),
+                        model._meta.verbose_name_plural, e)
+            for o in batch:
+                self.try_save(o)
+            return
+        for o in batch:
+            self.register_success()
+
+    def try_save(self, obj):
+        """In quick mode, save every single object in its own savepoint.
+        Otherwise an object which fails to save would abort the whole
+        restore transaction on databases like PostgreSQL, while
+        :meth:`FakeDeserializedObject.try_save` defers it and expects
+        to continue.
+
+        """
+        if not self.quick:
+            return obj.try_save()
+        with transaction.atomic():
+            ok = obj.try_save()
+            if not ok:
+                transaction.set_rollback(True)
+        return ok
+
+    def flush_deferred_objects(self):
+        self.flush_batch()
+        super(DpyLoader, self).flush_deferred_objects()
+
+    def initialize(self):
+        if self.quick:
+            self._transaction = transaction.atomic()
+            self._transaction.__enter__()
+            self._constraints_disabled = \
+                connection.disable_constraint_checking()
+        super(DpyLoader, self).initialize()
+
+    def finalize(self):
+        self.flush_batch()
+        super(DpyLoader, self).finalize()
+        if self._transaction is None:
+            return
+        t, self._transaction = self._transaction, None
+        try:
+            if self._constraints_disabled:
+                connection.enable_constraint_checking()
+            # check the foreign keys which have not been checked while
+            # loading
+            connection.check_constraints(table_names=[
+                m._meta.db_table for m in self.loaded_models])
+            # explicit primary keys don't update the sequences
+            sql = connection.ops.sequence_reset_sql(
+                no_style(), list(self.loaded_models))
+            if sql:
+                with connection.cursor() as cursor:
+                    for ln in sql:
+                        cursor.execute(ln)
+            # bulk_create doesn't send the signals which invalidate
+            # cached data
+            bump_table_versions(*self.loaded_models)
+        except Exception:
+            t.__exit__(*sys.exc_info())
+            raise
+        t.__exit__(None, None, None)
 
 
 class DpyDeserializer(LoaderBase):
@@ -7,6 +7,7 @@ from builtins import str
 from builtins import object
 
 import os
+import uuid
 
 from django.conf import settings
 
@@ -46,11 +47,21 @@ class MediaFile(object):
 
 
 class TmpMediaFile(MediaFile):
+    """A temporary file generated for the given action request.  Its
+    name depends on the IP address of the client and on the actor, so
+    a new request for the same actor overwrites it.  Specify
+    `unique=True` if this must not happen (e.g. because the file is
+    generated in the background).
 
-    def __init__(self, ar, fmt):
+    """
+
+    def __init__(self, ar, fmt, unique=False):
         ip = ar.request.META.get('REMOTE_ADDR', 'unknown_ip')
+        name = str(ar.actor)
+        if unique:
+            name += '-' + uuid.uuid4().hex
         super(TmpMediaFile, self).__init__(
-            False, 'cache', 'appy' + fmt, ip, str(ar.actor) + '.' + fmt)
+            False, 'cache', 'appy' + fmt, ip, name + '.' + fmt)
 
 
 def _test():
@@ -1,5 +1,5 @@
 # -*- coding: UTF-8 -*-
-# Copyright 2013 Luc Saffre
+# Copyright 2013-2016 Luc Saffre
 # License: BSD (see file COPYING for details)
 
 try:
@@ -11,14 +11,21 @@ except ImportError:
 
 
 def merge_pdfs(pdfs, output_name):
+    """Merge the pdf files whose names are yielded by `pdfs` into a
+    single pdf file `output_name`.
+
+    `pdfs` may be a generator which builds the files while they are
+    being merged.
+
+    """
     output = pyPdf.PdfFileWriter()
 
     for input_name in pdfs:
-        input = pyPdf.PdfFileReader(file(input_name, "rb"))
+        input = pyPdf.PdfFileReader(open(input_name, "rb"))
         #~ print "%s has %s pages." % (input_name, input.getNumPages())
         for page in input.pages:
             output.addPage(page)
 
-    outputStream = file(output_name, "wb")
+    outputStream = open(output_name, "wb")
     output.write(outputStream)
     outputStream.close()
@@ -63,17 +63,35 @@ class UnicodeWriter(object):
         self.encoder = codecs.getincrementalencoder(encoding)()
 
     def writerow(self, row):
-        self.writer.writerow([s.encode("utf-8") for s in row])
+        if six.PY2:
+            self.writer.writerow([s.encode("utf-8") for s in row])
+        else:
+            self.writer.writerow(row)
         # Fetch UTF-8 output from the queue ...
         data = self.queue.getvalue()
-        data = data.decode("utf-8")
+        if six.PY2:
+            data = data.decode("utf-8")
         # ... and reencode it into the target encoding
         data = self.encoder.encode(data)
         # write to the target stream
-        self.stream.write(data)
+        rv = self.stream.write(data)
         # empty queue
+        self.queue.seek(0)
         self.queue.truncate(0)
+        return rv
 
     def writerows(self, rows):
         for row in rows:
             self.writerow(row)
+
+
+class EchoBuffer(object):
+
+    """
+    A file-like object whose :meth:`write` method just returns the
+    data instead of storing it.  Used together with
+    :class:`UnicodeWriter` for generating streamed responses.
+    """
+
+    def write(self, data):
+        return data
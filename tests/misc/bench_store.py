@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+# Copyright 2016 Luc Saffre
+# License: BSD (see file COPYING for details)
+"""Compare the compiled row serializers of a
+:class:`lino.core.store.Store` with the non-compiled loops
+(:meth:`row2list_loop <lino.core.store.Store.row2list_loop>` and
+:meth:`row2dict_loop <lino.core.store.Store.row2dict_loop>`) on a
+table with 50 columns.
+
+Usage::
+
+  $ python tests/misc/bench_store.py
+
+"""
+from __future__ import print_function
+
+import os
+import datetime
+import timeit
+
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE', 'lino.projects.std.settings_test')
+
+import django
+django.setup()
+
+from django.db import models
+from lino.core import store
+
+COLUMNS = 50
+ROWS = 200
+REPEAT = 20
+
+
+class Row(object):
+    """A database-free row with a value for every column."""
+
+    @classmethod
+    def get_chooser_for_field(cls, name):
+        return None
+
+
+def make_store():
+    fields = []
+    for i in range(COLUMNS):
+        name = str('f%d' % i)
+        kind = i % 5
+        if kind == 0:
+            fld = models.CharField(max_length=20)
+            sf_class = store.StoreField
+        elif kind == 1:
+            fld = models.IntegerField()
+            sf_class = store.IntegerStoreField
+        elif kind == 2:
+            fld = models.BooleanField()
+            sf_class = store.BooleanStoreField
+        elif kind == 3:
+            fld = models.DateField()
+            sf_class = store.DateStoreField
+        else:
+            fld = models.CharField(
+                max_length=2, choices=[('a', "A"), ('b', "B")])
+            sf_class = store.ComboStoreField
+        fld.set_attributes_from_name(name)
+        fields.append(sf_class(fld, name))
+    st = store.Store.__new__(store.Store)
+    st.list_fields = st.detail_fields = tuple(fields)
+    st.compile_serializers()
+    return st
+
+
+def make_rows():
+    rows = []
+    for n in range(ROWS):
+        row = Row()
+        for i in range(COLUMNS):
+            kind = i % 5
+            if kind == 0:
+                v = "text %d" % n
+            elif kind == 1:
+                v = n
+            elif kind == 2:
+                v = bool(n % 2)
+            elif kind == 3:
+                v = datetime.date(2016, 1, 1 + n % 28)
+            else:
+                v = 'ab'[n % 2]
+            setattr(row, 'f%d' % i, v)
+        rows.append(row)
+    return rows
+
+
+def main():
+    st = make_store()
+    rows = make_rows()
+    for row in rows:
+        assert st.row2list(None, row) == st.row2list_loop(None, row)
+        assert st.row2dict(None, row) == st.row2dict_loop(None, row)
+
+    def bench(func):
+        return min(timeit.repeat(
+            lambda: [func(None, row) for row in rows],
+            number=REPEAT, repeat=3))
+
+    for name in ('row2list', 'row2dict'):
+        t1 = bench(getattr(st, name + '_loop'))
+        t2 = bench(getattr(st, name))
+        print("{0}: loop {1:.4f}s, compiled {2:.4f}s, speedup {3:.1f}x".format(
+            name, t1, t2, t1 / t2))
+
+
+if __name__ == '__main__':
+    main()